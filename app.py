@@ -2,154 +2,223 @@ import base64
 import os
 import sys
 import time
-import uuid
-from datetime import datetime
-from flask import Flask, render_template, request, redirect, url_for, flash, jsonify
-from sqlalchemy import create_engine
-from sqlalchemy.exc import OperationalError
+from datetime import date, datetime, timedelta
+from flask import (Flask, render_template, request, redirect, url_for, flash, jsonify, make_response, session,
+                   stream_with_context)
+from sqlalchemy import text
+from sqlalchemy.exc import OperationalError, TimeoutError as PoolTimeoutError
+from sqlalchemy.orm import joinedload
+from batch_events import BatchError, event_title, record_events
+from bulk_import import FORMATS as IMPORT_FORMATS, BulkImportError, progress_data, queue_import, source_format
+from bulk_mutations import delete_location as delete_location_rows, delete_plants, plant_filter, set_archived
+from cache import cache_stats, cached, init_cache
+from cold_storage import archived_events, events_growth_timeline, paginate_events
+from conditional import not_modified, plant_validators, set_validators
+from export import export_gzip
+from fragments import fragment_cache_status, init_fragments
+from identity import current_user_id, get_or_create_current_user_id
 from init_db import init_database
-from models import db
+from metrics import init_metrics, render_metrics
+from models import db, ImportProgress
+from pagination import keyset_paginate
+from partitions import timeline_partitioned
+from phase_durations import phase_durations_by_species, plant_growth_timeline
+from photo_storage import UploadRequest, allowed_file, save_photo_to_folder, release_photos, send_photo
+from photo_variants import photo_srcset, photo_url
+from search import KINDS as SEARCH_KINDS, search
+from summary import adjust_summary, compute_summary, event_deltas, get_summary
 
 
 def binary_to_data_url(binary_data, mime_type='image/jpeg'):
     """Convert either binary image data or filename to data URL for HTML display"""
     # If binary_data is actually a filename (string), construct the URL path
     if isinstance(binary_data, str) and binary_data:
-        # Return URL to the static photo file
-        return url_for('static', filename=binary_data)
+        # Return URL to the photo file (served by the photo route)
+        return photo_url(binary_data)
     elif binary_data:  # Handle legacy binary data
         encoded = base64.b64encode(binary_data).decode('utf-8')
         return f"data:{mime_type};base64,{encoded}"
     return None
 
 
-def wait_for_db(app):
-    """Wait for the database to be ready"""
+def wait_for_db(app, timeout=60):
+    """
+    Wait for the database to be ready, probing through the app's pooled engine
+    with exponential backoff (0.5s, 1s, 2s ... up to 8s between attempts)
+    """
     database_url = app.config['SQLALCHEMY_DATABASE_URI']
 
     # Only wait for DB if using PostgreSQL
     if database_url.startswith('postgresql'):
         print("Waiting for database...")
-        for attempt in range(30):  # Try for up to 30 seconds
-            try:
-                engine = create_engine(database_url)
-                with engine.connect() as conn:
+        with app.app_context():
+            engine = db.engine
+            deadline = time.monotonic() + timeout
+            delay = 0.5
+            attempt = 0
+            while True:
+                attempt += 1
+                try:
+                    with engine.connect() as conn:
+                        conn.execute(text('SELECT 1'))
                     print("Database connection established!")
-                    break
-            except OperationalError as e:
-                print(f"Attempt {attempt + 1}: Could not connect to database: {e}")
-                time.sleep(1)
-        else:
-            print("Could not connect to database after 30 attempts. Exiting.")
-            sys.exit(1)
-
-
-def allowed_file(filename):
-    """Check if uploaded file has allowed extension"""
-    ALLOWED_EXTENSIONS = {'png', 'jpg', 'jpeg', 'gif', 'webp'}
-    return '.' in filename and \
-        filename.rsplit('.', 1)[1].lower() in ALLOWED_EXTENSIONS
-
-
-def save_photo_to_folder(photo_file, object_type='general'):
-    """Save uploaded photo to organized subfolder structure and return relative path"""
-    if photo_file and photo_file.filename != '':
-        if allowed_file(photo_file.filename):
-            # Generate unique filename to avoid conflicts
-            ext = photo_file.filename.rsplit('.', 1)[1].lower()
-            unique_filename = f"{uuid.uuid4().hex}.{ext}"
-            
-            # Create organized directory structure based on object type
-            object_subdir = {
-                'plant': 'plants',
-                'location': 'locations', 
-                'event': 'events',
-                'general': 'general'
-            }.get(object_type, 'general')
-            
-            filepath = os.path.join('static', 'photos', object_subdir, unique_filename)
-            
-            # Create directory if it doesn't exist
-            os.makedirs(os.path.dirname(filepath), exist_ok=True)
-            
-            # Save the file
-            photo_file.save(filepath)
-            
-            # Return relative path from static directory
-            return f"photos/{object_subdir}/{unique_filename}"
-        else:
-            return None
-    return None
-
-
-def delete_file_from_disk(filepath):
-    """Delete file from disk if it exists"""
-    if filepath:
-        full_path = os.path.join('static', filepath)
-        if os.path.exists(full_path):
-            try:
-                os.remove(full_path)
-                # Also try to remove the directory if it's empty
-                dir_path = os.path.dirname(full_path)
-                if os.path.isdir(dir_path) and not os.listdir(dir_path):
-                    os.rmdir(dir_path)
-                return True
-            except OSError:
-                pass  # Fail silently if file removal fails
-    return False
+                    return
+                except OperationalError as e:
+                    print(f"Attempt {attempt}: Could not connect to database: {e}")
+                    if time.monotonic() + delay > deadline:
+                        break
+                    time.sleep(delay)
+                    delay = min(delay * 2, 8)
+        print(f"Could not connect to database after {attempt} attempts. Exiting.")
+        sys.exit(1)
+
+
+def pool_status(engine):
+    """Статистика пула соединений без обращения к базе данных"""
+    pool = engine.pool
+    status = {'pool_class': type(pool).__name__}
+    # Счетчики есть только у QueuePool (PostgreSQL); у пулов SQLite их нет
+    if hasattr(pool, 'checkedout'):
+        status.update({
+            'size': pool.size(),
+            'checked_in': pool.checkedin(),
+            'checked_out': pool.checkedout(),
+            'overflow': max(pool.overflow(), 0),
+            'max_overflow': pool._max_overflow,
+        })
+        status['saturated'] = status['checked_out'] >= status['size'] + status['max_overflow']
+    return status
+
+
+def engine_options(database_url):
+    """
+    Настройки пула соединений SQLAlchemy из переменных окружения. Каждый процесс
+    gunicorn держит свой пул, поэтому DB_POOL_SIZE должен быть не меньше числа
+    потоков воркера, а workers * (DB_POOL_SIZE + DB_MAX_OVERFLOW) - меньше
+    max_connections PostgreSQL.
+    """
+    options = {
+        'pool_pre_ping': os.environ.get('DB_POOL_PRE_PING', '1').lower() in ('1', 'true', 'yes'),
+        'pool_recycle': int(os.environ.get('DB_POOL_RECYCLE', 1800)),
+    }
+    # Размер пула настраивается только для QueuePool (у SQLite свой пул)
+    if database_url and database_url.startswith('postgresql'):
+        options['pool_size'] = int(os.environ.get('DB_POOL_SIZE', 5))
+        options['max_overflow'] = int(os.environ.get('DB_MAX_OVERFLOW', 10))
+    return options
 
 
 def create_app():
     app = Flask(__name__)
+    # Файлы из multipart-форм пишутся на диск блоками сразу при разборе запроса
+    app.request_class = UploadRequest
     app.config['SECRET_KEY'] = os.environ.get('SECRET_KEY', 'your-secret-key-change-in-production')
     app.config['SQLALCHEMY_DATABASE_URI'] = os.environ.get('DATABASE_URL')
     app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
+    app.config['SQLALCHEMY_ENGINE_OPTIONS'] = engine_options(app.config['SQLALCHEMY_DATABASE_URI'])
 
     # Настройки загрузки файлов определены в функции allowed_file()
 
     app.config['MAX_CONTENT_LENGTH'] = 160 * 1024 * 1024  # 16MB max file size
+    app.config['MAX_PHOTOS_PER_EVENT'] = int(os.environ.get('MAX_PHOTOS_PER_EVENT', 100))
+
+    # Передача файлов фото обратному прокси: '' (отдает Flask), 'x-sendfile' или 'x-accel-redirect'.
+    # Для x-accel-redirect в nginx нужен internal location с префиксом PHOTO_ACCEL_PREFIX,
+    # указывающий на каталог static/photos
+    app.config['PHOTO_SENDFILE'] = os.environ.get('PHOTO_SENDFILE', '').lower()
+    app.config['PHOTO_ACCEL_PREFIX'] = os.environ.get('PHOTO_ACCEL_PREFIX', '/protected-photos/')
+    app.config['USE_X_SENDFILE'] = app.config['PHOTO_SENDFILE'] == 'x-sendfile'
+
+    # Размеры страниц для курсорной пагинации
+    app.config['PLANTS_PAGE_SIZE'] = int(os.environ.get('PLANTS_PAGE_SIZE', 24))
+    app.config['TIMELINE_PAGE_SIZE'] = int(os.environ.get('TIMELINE_PAGE_SIZE', 50))
+    app.config['API_TIMELINE_MAX_LIMIT'] = int(os.environ.get('API_TIMELINE_MAX_LIMIT', 500))
+    # Максимум событий в одном пакете /api/events/batch (после раскрытия локаций)
+    app.config['API_BATCH_MAX_EVENTS'] = int(os.environ.get('API_BATCH_MAX_EVENTS', 1000))
+
+    # Каталог загруженных файлов массового импорта до обработки фоновой задачей
+    app.config['IMPORT_DIR'] = os.environ.get('IMPORT_DIR', 'imports')
+
+    # Размер страницы результатов поиска и максимум для API
+    app.config['SEARCH_PAGE_SIZE'] = int(os.environ.get('SEARCH_PAGE_SIZE', 20))
+    app.config['SEARCH_MAX_LIMIT'] = int(os.environ.get('SEARCH_MAX_LIMIT', 100))
+
+    # Ширины миниатюр фото (по возрастанию) и качество WebP-вариантов
+    app.config['PHOTO_VARIANT_WIDTHS'] = sorted(
+        int(width) for width in os.environ.get('PHOTO_VARIANT_WIDTHS', '160,320,640').split(',') if width.strip())
+    app.config['PHOTO_WEBP_QUALITY'] = int(os.environ.get('PHOTO_WEBP_QUALITY', 80))
+
+    # Кеш справочных данных и ответов API: 'memory' (LRU в процессе) или 'memcached' (CACHE_URL)
+    app.config['CACHE_BACKEND'] = os.environ.get('CACHE_BACKEND', 'memory').lower()
+    app.config['CACHE_URL'] = os.environ.get('CACHE_URL', 'localhost:11211')
+    app.config['CACHE_MAX_ENTRIES'] = int(os.environ.get('CACHE_MAX_ENTRIES', 1024))
+    app.config['CACHE_DEFAULT_TTL'] = int(os.environ.get('CACHE_DEFAULT_TTL', 300))
+    app.config['GROWTH_PHASES_CACHE_TTL'] = int(os.environ.get('GROWTH_PHASES_CACHE_TTL', 3600))
+    app.config['TIMELINE_CACHE_TTL'] = int(os.environ.get('TIMELINE_CACHE_TTL', 60))
+    # Кеш отрендеренных карточек и записей хронологии (LRU в процессе): максимум фрагментов, 0 - выключен
+    app.config['FRAGMENT_CACHE_MAX_ENTRIES'] = int(os.environ.get('FRAGMENT_CACHE_MAX_ENTRIES', 5000))
+    # Сколько секунд хранится фрагмент с фото, для которых еще не созданы миниатюры
+    app.config['FRAGMENT_INCOMPLETE_TTL'] = int(os.environ.get('FRAGMENT_INCOMPLETE_TTL', 60))
+
+    # Секционирование timeline_events по дате на PostgreSQL: '' (обычная таблица), 'year' или 'month'.
+    # Применяется миграцией; для уже созданной базы - python partitions.py
+    app.config['TIMELINE_PARTITIONING'] = os.environ.get('TIMELINE_PARTITIONING', '').lower()
+    app.config['TIMELINE_PARTITIONS_AHEAD'] = int(os.environ.get('TIMELINE_PARTITIONS_AHEAD', 2))
+    # Окно последних событий дашборда: на секционированной таблице сначала читаются только его секции
+    app.config['RECENT_EVENTS_WINDOW_DAYS'] = int(os.environ.get('RECENT_EVENTS_WINDOW_DAYS', 30))
+
+    # Журнал медленных запросов с их SQL: порог в миллисекундах, 0 - выключен
+    app.config['SLOW_REQUEST_MS'] = int(os.environ.get('SLOW_REQUEST_MS', 0))
+    # Общий каталог метрик воркеров gunicorn (задает gunicorn.conf.py); пусто - метрики только процесса
+    app.config['METRICS_DIR'] = os.environ.get('METRICS_DIR', '')
+    app.config['METRICS_FLUSH_INTERVAL'] = float(os.environ.get('METRICS_FLUSH_INTERVAL', 1.0))
 
     # Инициализация базы данных приложением
     db.init_app(app)
+    init_cache(app)
+    init_fragments(app)
+    init_metrics(app)
 
     # Импорт моделей после инициализации БД для предотвращения циклических импортов
-    from models import User, Location, Plant, GrowthPhase, TimelineEvent, EventPhoto
+    from models import Location, Plant, GrowthPhase, TimelineEvent, EventPhoto
 
     # Добавление функции binary_to_data_url в окружение Jinja2 для использования в шаблонах
     app.jinja_env.globals['binary_to_data_url'] = binary_to_data_url
+    app.jinja_env.globals['photo_srcset'] = photo_srcset
+    app.jinja_env.globals['photo_url'] = photo_url
 
     @app.route('/')
     def index():
         """Главная страница с дашбордом статистики"""
-        # Получение пользователя по умолчанию
-        default_user = User.query.filter_by(username='default').first()
+        # Текущий пользователь (id кешируется, к таблице users обычно не обращаемся)
+        user_id = current_user_id()
         
-        if default_user:
-            # Подсчет статистики
-            total_plants = Plant.query.filter_by(user_id=default_user.id).count()
-            total_locations = Location.query.filter_by(user_id=default_user.id).count()
-            
-            # Получение последних растений
-            recent_plants = Plant.query.filter_by(user_id=default_user.id).order_by(Plant.created_at.desc()).limit(5).all()
-            
+        if user_id:
+            # Счетчики берутся из инкрементально поддерживаемой сводки (одна выборка по ключу)
+            summary = get_summary(user_id) or compute_summary(db.session, user_id)
+
             # Получение последних событий
-            recent_events = TimelineEvent.query.join(Plant).filter(
-                Plant.user_id == default_user.id
-            ).order_by(TimelineEvent.event_date.desc()).limit(5).all()
-            
-            # Получение архивных растений
-            archived_plants = Plant.query.filter_by(user_id=default_user.id, archived=True).all()
+            recent_query = TimelineEvent.query.options(joinedload(TimelineEvent.plant)).join(Plant).filter(
+                Plant.user_id == user_id
+            ).order_by(TimelineEvent.event_date.desc())
+            recent_events = []
+            if timeline_partitioned():
+                # Старые секции читаются, только если за последние дни событий меньше пяти
+                window_start = date.today() - timedelta(days=app.config['RECENT_EVENTS_WINDOW_DAYS'])
+                recent_events = recent_query.filter(TimelineEvent.event_date >= window_start).limit(5).all()
+            if len(recent_events) < 5:
+                recent_events = recent_query.limit(5).all()
+
+            # Получение последних архивных растений
+            archived_plants = Plant.query.filter_by(user_id=user_id, archived=True).order_by(
+                Plant.created_at.desc()).limit(5).all()
         else:
-            total_plants = 0
-            total_locations = 0
-            recent_plants = []
+            summary = None
             recent_events = []
             archived_plants = []
-        
-        return render_template('dashboard.html', 
-                               total_plants=total_plants,
-                               total_locations=total_locations,
-                               recent_plants=recent_plants,
+
+        return render_template('dashboard.html',
+                               summary=summary,
                                recent_events=recent_events,
                                archived_plants=archived_plants)
 
@@ -157,9 +226,9 @@ def create_app():
     def locations():
         """Показать все локации для текущего пользователя"""
         # Для разработки показываем локации для пользователя по умолчанию
-        default_user = User.query.filter_by(username='default').first()
-        if default_user:
-            locations = Location.query.filter_by(user_id=default_user.id).all()
+        user_id = current_user_id()
+        if user_id:
+            locations = Location.query.filter_by(user_id=user_id).all()
         else:
             locations = []
         return render_template('locations.html', locations=locations)
@@ -181,27 +250,19 @@ def create_app():
         lighting = request.form.get('lighting', '')
         substrate = request.form.get('substrate', '')
 
-        # Обработка загрузки фото - сохранение в папку static/photos/locations
+        # Обработка загрузки фото - сохранение в хранилище static/photos/content
         photo_filename = None
         if 'photo' in request.files:
             photo = request.files['photo']
-            photo_filename = save_photo_to_folder(photo, 'location')
+            photo_filename = save_photo_to_folder(photo)
             if not photo_filename:
                 flash('Недопустимый тип файла. Разрешены только JPG, PNG, GIF, WEBP.', 'warning')
 
         # Получение или создание пользователя по умолчанию для целей разработки
-        default_user = User.query.filter_by(username='default').first()
-        if not default_user:
-            default_user = User(
-                username='default',
-                email='default@example.com',
-                password_hash='temp_password_hash'
-            )
-            db.session.add(default_user)
-            db.session.flush()  # Получение ID пользователя без фиксации
+        user_id = get_or_create_current_user_id()
 
         location = Location(
-            user_id=default_user.id,
+            user_id=user_id,
             name=name,
             description=description,
             lighting=lighting if lighting else None,
@@ -210,6 +271,7 @@ def create_app():
         )
 
         db.session.add(location)
+        adjust_summary(user_id, location_count=1)
         db.session.commit()
 
         flash(f'Location {name} added successfully!', 'success')
@@ -227,27 +289,19 @@ def create_app():
                 lighting = request.form.get('lighting', '') or None
                 substrate = request.form.get('substrate', '') or None
 
-                # Обработка загрузки фото - сохранение в папку static/photos/locations
+                # Обработка загрузки фото - сохранение в хранилище static/photos/content
                 photo_filename = None
                 if 'photo' in request.files:
                     photo = request.files['photo']
-                    photo_filename = save_photo_to_folder(photo, 'location')
+                    photo_filename = save_photo_to_folder(photo)
                     if not photo_filename:
                         flash('Недопустимый тип файла. Разрешены только JPG, PNG, GIF, WEBP.', 'warning')
 
                 # Получение или создание пользователя по умолчанию для целей разработки
-                default_user = User.query.filter_by(username='default').first()
-                if not default_user:
-                    default_user = User(
-                        username='default',
-                        email='default@example.com',
-                        password_hash='temp_password_hash'
-                    )
-                    db.session.add(default_user)
-                    db.session.flush()  # Получение ID пользователя без фиксации
+                user_id = get_or_create_current_user_id()
 
                 new_location = Location(
-                    user_id=default_user.id,
+                    user_id=user_id,
                     name=name,
                     description=description,
                     lighting=lighting,
@@ -256,6 +310,7 @@ def create_app():
                 )
 
                 db.session.add(new_location)
+                adjust_summary(user_id, location_count=1)
                 db.session.commit()
 
                 flash(f'Location {name} added successfully!', 'success')
@@ -277,13 +332,11 @@ def create_app():
                     photo = request.files['photo']
                     if photo and photo.filename != '':
                         if allowed_file(photo.filename):
-                            # Удаление старого файла, если он существует
+                            # Освобождение ссылки на старый файл
                             if location.photo_filename:
-                                old_filepath = os.path.join('static', 'photo', location.photo_filename)
-                                if os.path.exists(old_filepath):
-                                    os.remove(old_filepath)
+                                release_photos(location.photo_filename)
                             
-                            # Сохранение нового фото в папке static/photo
+                            # Сохранение нового фото в хранилище static/photos/content
                             location.photo_filename = save_photo_to_folder(photo)
                         else:
                             flash('Недопустимый тип файла. Разрешены только JPG, PNG и GIF.', 'warning')
@@ -297,93 +350,118 @@ def create_app():
     @app.route('/plants')
     def plants():
         """Показать все растения для текущего пользователя, опционально отфильтрованные по локации"""
-        # Получение фильтра локации из параметров запроса
+        # Получение фильтра локации и курсора страницы из параметров запроса
         location_id = request.args.get('location', type=int)
+        cursor = request.args.get('cursor')
+        next_cursor = None
 
         if location_id:
             # Фильтрация растений по локации (убедиться, что она принадлежит пользователю по умолчанию)
-            default_user = User.query.filter_by(username='default').first()
-            if default_user:
-                plants = Plant.query.filter_by(location_id=location_id, user_id=default_user.id, archived=False).all()
+            user_id = current_user_id()
+            if user_id:
+                plants, next_cursor = keyset_paginate(
+                    Plant.query.options(joinedload(Plant.location)).filter_by(
+                        location_id=location_id, user_id=user_id, archived=False),
+                    [Plant.created_at, Plant.id], cursor, app.config['PLANTS_PAGE_SIZE'])
             else:
                 plants = []
             # Получение локации для отображения
             location = Location.query.get_or_404(location_id)
-            return render_template('plants.html', plants=plants, location=location)
+            return render_template('plants.html', plants=plants, location=location, next_cursor=next_cursor)
         else:
             # Показать все растения для пользователя по умолчанию без фильтрации по локации
-            default_user = User.query.filter_by(username='default').first()
-            if default_user:
-                plants = Plant.query.filter_by(user_id=default_user.id, archived=False).all()
+            user_id = current_user_id()
+            if user_id:
+                plants, next_cursor = keyset_paginate(
+                    Plant.query.options(joinedload(Plant.location)).filter_by(
+                        user_id=user_id, archived=False),
+                    [Plant.created_at, Plant.id], cursor, app.config['PLANTS_PAGE_SIZE'])
             else:
                 plants = []
-            return render_template('plants.html', plants=plants)
+            return render_template('plants.html', plants=plants, next_cursor=next_cursor)
 
 
     @app.route('/archive')
     def archive():
         """Показать все архивные растения для текущего пользователя"""
-        default_user = User.query.filter_by(username='default').first()
-        if default_user:
-            archived_plants = Plant.query.filter_by(user_id=default_user.id, archived=True).all()
+        user_id = current_user_id()
+        next_cursor = None
+        if user_id:
+            # Хронологии в холодном хранении: из архива читается только сводка, без сжатых событий
+            archived_plants, next_cursor = keyset_paginate(
+                Plant.query.options(joinedload(Plant.location), joinedload(Plant.archived_timeline)).filter_by(
+                    user_id=user_id, archived=True),
+                [Plant.created_at, Plant.id], request.args.get('cursor'), app.config['PLANTS_PAGE_SIZE'])
         else:
             archived_plants = []
-        return render_template('plants.html', plants=archived_plants, archived=True)
+        return render_template('plants.html', plants=archived_plants, archived=True, next_cursor=next_cursor)
+
+    @app.route('/search')
+    def search_page():
+        """Поиск по растениям, локациям и записям хронологии"""
+        query = request.args.get('q', '').strip()
+        kind = request.args.get('type')
+        results, next_cursor = search(current_user_id(), query, [kind] if kind else None,
+                                      request.args.get('cursor'), app.config['SEARCH_PAGE_SIZE'])
+        return render_template('search.html', query=query, kind=kind, results=results, next_cursor=next_cursor)
 
     @app.route('/plant/<int:plant_id>')
     def plant_detail(plant_id):
         """Показать детали для конкретного растения, включая его хронологию"""
-        from datetime import date
-
-        from sqlalchemy.orm import joinedload
-        
-        plant = Plant.query.get_or_404(plant_id)
-        timeline_events = TimelineEvent.query.options(joinedload(TimelineEvent.photos)).filter_by(plant_id=plant_id).order_by(
-            TimelineEvent.event_date.desc()).all()
-
-        # Получение событий этапов роста и расчет продолжительности
-        growth_phase_events = TimelineEvent.query.options(joinedload(TimelineEvent.photos)).filter_by(
-            plant_id=plant_id,
-            event_type='growth_phase'
-        ).order_by(TimelineEvent.event_date.desc()).all()
-
-        growth_timeline = []
+        # Страница зависит от текущей даты (продолжительности этапов). Flash-сообщения
+        # показываются один раз, поэтому страница с ними не получает валидаторов
+        etag, last_modified, total_events = plant_validators(plant_id, date.today(), request.query_string)
+        validators = None
+        if '_flashes' not in session:
+            validators = etag, max(last_modified, datetime.combine(date.today(), datetime.min.time()))
+            response = not_modified(*validators)
+            if response:
+                return response
+
+        plant = Plant.query.options(joinedload(Plant.location)).get_or_404(plant_id)
+        if plant.archived:
+            # Хронология архивного растения читается из холодного хранения целиком
+            archived_timeline = archived_events(plant_id)
+            total_events = len(archived_timeline)
+            timeline_events, next_cursor = paginate_events(
+                archived_timeline, request.args.get('cursor'), app.config['TIMELINE_PAGE_SIZE'], descending=True)
+        else:
+            timeline_events, next_cursor = keyset_paginate(
+                TimelineEvent.query.options(
+                    joinedload(TimelineEvent.photos),
+                    joinedload(TimelineEvent.growth_phase)
+                ).filter_by(plant_id=plant_id),
+                [TimelineEvent.event_date, TimelineEvent.id], request.args.get('cursor'),
+                app.config['TIMELINE_PAGE_SIZE'], descending=True, bound_page=timeline_partitioned())
+
+        # Кнопка "Показать еще" запрашивает только следующий фрагмент хронологии
+        if request.args.get('partial'):
+            response = make_response(render_template('_timeline_events.html', timeline_events=timeline_events))
+            response.headers['X-Next-Cursor'] = next_cursor or ''
+            return set_validators(response, *validators) if validators else response
+
+        if plant.archived:
+            growth_timeline = events_growth_timeline(archived_timeline, date.today())
+        elif not request.args.get('cursor') and next_cursor is None:
+            # Вся хронология уместилась на первой странице: этапы считаются по уже загруженным событиям
+            growth_timeline = events_growth_timeline(timeline_events[::-1], date.today())
+        else:
+            # На странице только часть событий, а этапам нужна вся история растения:
+            # даты и продолжительность считаются в базе (LEAD() OVER) одним запросом
+            growth_timeline = plant_growth_timeline(plant_id, date.today())
         total_days_since_germination = 0
-        # Так как события отсортированы в порядке убывания даты, 
-        # нужно изменить логику вычисления продолжительности
-        for i, event in enumerate(growth_phase_events):
-            start_date = event.event_date
-            # Для текущего этапа роста продолжительность - это разница между датой начала следующего этапа (в хронологическом порядке) и датой начала текущего этапа
-            # Так как массив отсортирован в обратном порядке (самые поздние даты первыми), 
-            # то конечная дата текущего этапа - это дата следующего элемента в хронологическом порядке (в обратно отсортированном массиве это элемент с индексом i-1, если i > 0)
-            if i > 0:
-                # Конечная дата этапа - это дата следующего этапа в хронологическом порядке (в обратном порядке это элемент с индексом i-1)
-                end_date = growth_phase_events[i - 1].event_date
-                # Продолжительность - это разница между датой начала следующего этапа и датой начала текущего этапа
-                duration = (end_date - start_date).days
-            else:
-                # Если это самый последний этап в хронологическом порядке (первый в обратном порядке), 
-                # расчет продолжительности от начала этапа до сегодняшнего дня
-                end_date = date.today()
-                duration = (end_date - start_date).days
-
-            growth_timeline.append({
-                'event': event,
-                'start_date': start_date,
-                'end_date': end_date,
-                'duration_days': duration
-            })
-        
-        # Вычисляем общее количество дней с момента прорастания (самой ранней даты роста) до сегодняшнего дня
-        if growth_phase_events:
-            earliest_event_date = min(event.event_date for event in growth_phase_events)
-            total_days_since_germination = (date.today() - earliest_event_date).days
-
-        return render_template('plant_detail.html',
-                               plant=plant,
-                               timeline_events=timeline_events,
-                               growth_timeline=growth_timeline,
-                               total_days_since_germination=total_days_since_germination)
+        # Общее количество дней с момента прорастания (самого раннего этапа) до сегодняшнего дня
+        if growth_timeline:
+            total_days_since_germination = (date.today() - growth_timeline[-1]['start_date']).days
+
+        response = make_response(render_template('plant_detail.html',
+                                                 plant=plant,
+                                                 timeline_events=timeline_events,
+                                                 total_events=total_events,
+                                                 next_cursor=next_cursor,
+                                                 growth_timeline=growth_timeline,
+                                                 total_days_since_germination=total_days_since_germination))
+        return set_validators(response, *validators) if validators else response
 
     @app.route('/add_plant', methods=['GET', 'POST'])
     def add_plant():
@@ -400,27 +478,19 @@ def create_app():
 
             notes = request.form.get('notes', '')
 
-            # Обработка загрузки фото - сохранение в папку static/photos/plants
+            # Обработка загрузки фото - сохранение в хранилище static/photos/content
             photo_filename = None
             if 'photo' in request.files:
                 photo = request.files['photo']
-                photo_filename = save_photo_to_folder(photo, 'plant')
+                photo_filename = save_photo_to_folder(photo)
                 if not photo_filename:
                     flash('Недопустимый тип файла. Разрешены только JPG, PNG, GIF, WEBP.', 'warning')
 
             # Получение или создание пользователя по умолчанию для целей разработки
-            default_user = User.query.filter_by(username='default').first()
-            if not default_user:
-                default_user = User(
-                    username='default',
-                    email='default@example.com',
-                    password_hash='temp_password_hash'
-                )
-                db.session.add(default_user)
-                db.session.flush()  # Получение ID пользователя без фиксации
+            user_id = get_or_create_current_user_id()
 
             plant = Plant(
-                user_id=default_user.id,
+                user_id=user_id,
                 name=name,
                 species=species,
                 location_id=location_id if location_id else None,
@@ -430,6 +500,7 @@ def create_app():
             )
 
             db.session.add(plant)
+            adjust_summary(user_id, plant_count=1)
             db.session.commit()
 
             flash(f'Plant {name} added successfully!', 'success')
@@ -461,14 +532,12 @@ def create_app():
                 photo = request.files['photo']
                 if photo and photo.filename != '':
                     if allowed_file(photo.filename):
-                        # Удаление старого файла, если он существует
+                        # Освобождение ссылки на старый файл
                         if plant.photo_filename:
-                            old_filepath = os.path.join('static', plant.photo_filename)
-                            if os.path.exists(old_filepath):
-                                os.remove(old_filepath)
+                            release_photos(plant.photo_filename)
                         
-                        # Сохранение нового фото в папке static/photos/plants
-                        plant.photo_filename = save_photo_to_folder(photo, 'plant')
+                        # Сохранение нового фото в хранилище static/photos/content
+                        plant.photo_filename = save_photo_to_folder(photo)
                     else:
                         flash('Недопустимый тип файла. Разрешены только JPG, PNG и GIF.', 'warning')
 
@@ -489,29 +558,30 @@ def create_app():
         event_date_str = request.form['event_date']
 
         # Генерация заголовка по умолчанию на основе типа события и даты, если описание не предоставлено
-        if description.strip():
-            title = description[:50] + "..." if len(description) > 50 else description
-        else:
-            title = f"{event_type.replace('_', ' ').title()} - {event_date_str}"
+        title = event_title(event_type, description, event_date_str)
 
         event_date = datetime.strptime(event_date_str, '%Y-%m-%d').date()
 
-        # Обработка загрузки фото для заметок - сохранение в папку static/photos/events
+        # Обработка загрузки фото для заметок - сохранение в хранилище static/photos/content
         photo_filename = None
         if 'note_photo' in request.files:
             photo = request.files['note_photo']
-            photo_filename = save_photo_to_folder(photo, 'event')
+            photo_filename = save_photo_to_folder(photo)
             if not photo_filename:
                 flash('Недопустимый тип файла. Разрешены только JPG, PNG и GIF.', 'warning')
 
-        # Обработка множественной загрузки фото для заметок - сохранение в папку static/photos/events
+        # Обработка множественной загрузки фото для заметок - сохранение в хранилище static/photos/content
         multiple_photos = []
         if 'note_photos' in request.files:
             photo_files = request.files.getlist('note_photos')
+            max_photos = app.config['MAX_PHOTOS_PER_EVENT']
+            if len(photo_files) > max_photos:
+                flash(f'К одному событию можно прикрепить не более {max_photos} фото.', 'warning')
+                photo_files = photo_files[:max_photos]
             for photo_file in photo_files:
                 if photo_file and photo_file.filename != '':
                     if allowed_file(photo_file.filename):
-                        saved_filename = save_photo_to_folder(photo_file, 'event')
+                        saved_filename = save_photo_to_folder(photo_file)
                         if saved_filename:
                             # Создаем объект EventPhoto для каждого файла
                             event_photo = EventPhoto(
@@ -572,6 +642,7 @@ def create_app():
             photo.event_id = event.id
             db.session.add(photo)
 
+        adjust_summary(plant.user_id, **event_deltas(event_type, 1))
         db.session.commit()
 
         flash(f'Event added to {plant.name}\'s timeline!', 'success')
@@ -583,15 +654,12 @@ def create_app():
         """Удалить событие из хронологии растения"""
         event = TimelineEvent.query.get_or_404(event_id)
         
-        # Удаление устаревшего поля photo_filename события
-        if event.photo_filename:
-            delete_file_from_disk(event.photo_filename)
-        
-        # Удаление всех фото из связи EventPhoto
-        for photo in event.photos:
-            delete_file_from_disk(photo.filename)
-        
+        # Удаление файлов (устаревшее поле photo_filename и все фото EventPhoto) в фоновой задаче
+        release_photos(event.photo_filename, *(photo.filename for photo in event.photos))
+
+        user_id = event.plant.user_id
         db.session.delete(event)
+        adjust_summary(user_id, **event_deltas(event.event_type, -1))
         db.session.commit()
         
         flash(f'Событие "{event.title}" успешно удалено!', 'success')
@@ -607,14 +675,12 @@ def create_app():
             photo = request.files['photo']
             if photo and photo.filename != '':
                 if allowed_file(photo.filename):
-                    # Удаление старого файла, если он существует
+                    # Освобождение ссылки на старый файл
                     if plant.photo_filename:
-                        old_filepath = os.path.join('static', plant.photo_filename)
-                        if os.path.exists(old_filepath):
-                            os.remove(old_filepath)
+                        release_photos(plant.photo_filename)
 
-                    # Сохранение нового фото в папке static/photos/plants
-                    plant.photo_filename = save_photo_to_folder(photo, 'plant')
+                    # Сохранение нового фото в хранилище static/photos/content
+                    plant.photo_filename = save_photo_to_folder(photo)
 
                     db.session.commit()
                     flash('Фото успешно обновлено!', 'success')
@@ -629,10 +695,8 @@ def create_app():
         plant = Plant.query.get_or_404(plant_id)
 
         if plant.photo_filename:
-            # Удаление файла фото из папки static/photos
-            filepath = os.path.join('static', plant.photo_filename)
-            if os.path.exists(filepath):
-                os.remove(filepath)
+            # Освобождение ссылки на файл фото (файл удаляется фоновой задачей, если он больше не нужен)
+            release_photos(plant.photo_filename)
             
             # Очистка имени файла в базе данных
             plant.photo_filename = None
@@ -650,14 +714,12 @@ def create_app():
             photo = request.files['photo']
             if photo and photo.filename != '':
                 if allowed_file(photo.filename):
-                    # Удаление старого файла, если он существует
+                    # Освобождение ссылки на старый файл
                     if location.photo_filename:
-                        old_filepath = os.path.join('static', location.photo_filename)
-                        if os.path.exists(old_filepath):
-                            os.remove(old_filepath)
+                        release_photos(location.photo_filename)
                     
-                    # Сохранение нового фото в папке static/photos/locations
-                    location.photo_filename = save_photo_to_folder(photo, 'location')
+                    # Сохранение нового фото в хранилище static/photos/content
+                    location.photo_filename = save_photo_to_folder(photo)
 
                     db.session.commit()
                     flash('Фото успешно обновлено!', 'success')
@@ -672,10 +734,8 @@ def create_app():
         location = Location.query.get_or_404(location_id)
 
         if location.photo_filename:
-            # Удаление файла фото из папки static/photos
-            filepath = os.path.join('static', location.photo_filename)
-            if os.path.exists(filepath):
-                os.remove(filepath)
+            # Освобождение ссылки на файл фото (файл удаляется фоновой задачей, если он больше не нужен)
+            release_photos(location.photo_filename)
             
             # Очистка имени файла в базе данных
             location.photo_filename = None
@@ -689,25 +749,10 @@ def create_app():
         """Удалить растение"""
         plant = Plant.query.get_or_404(plant_id)
         plant_name = plant.name
-        
-        # Удаление фото растения
-        if plant.photo_filename:
-            delete_file_from_disk(plant.photo_filename)
-        
-        # SQLAlchemy автоматически удалит связанные события благодаря каскадному удалению,
-        # но нам нужно вручную удалить файлы, связанные с этими событиями
-        
-        # Удаление фото событий и самих событий
-        for event in plant.timeline_events:
-            # Удаление устаревшего поля photo_filename события
-            if event.photo_filename:
-                delete_file_from_disk(event.photo_filename)
-            
-            # Удаление всех фото из связи EventPhoto
-            for photo in event.photos:
-                delete_file_from_disk(photo.filename)
-        
-        db.session.delete(plant)
+
+        # Постоянное число запросов: события и их фото удаляет каскад базы данных,
+        # файлы собираются одним запросом и удаляются фоновой задачей
+        delete_plants(plant.user_id, Plant.id == plant_id)
         db.session.commit()
         flash(f'Растение \"{plant_name}\" успешно удалено!', 'success')
         return redirect(url_for('plants'))
@@ -718,7 +763,8 @@ def create_app():
         plant = Plant.query.get_or_404(plant_id)
         plant_name = plant.name
         
-        plant.archived = True
+        # Хронология переносится в холодное хранение (cold_storage.py)
+        set_archived(plant.user_id, Plant.id == plant_id, archived=True)
         db.session.commit()
         flash(f'Растение "{plant_name}" успешно перемещено в архив!', 'success')
         return redirect(url_for('plants'))
@@ -729,7 +775,7 @@ def create_app():
         plant = Plant.query.get_or_404(plant_id)
         plant_name = plant.name
         
-        plant.archived = False
+        set_archived(plant.user_id, Plant.id == plant_id, archived=False)
         db.session.commit()
         flash(f'Растение "{plant_name}" успешно восстановлено из архива!', 'success')
         return redirect(url_for('plants'))
@@ -739,58 +785,245 @@ def create_app():
         """Удалить локацию"""
         location = Location.query.get_or_404(location_id)
         location_name = location.name
-        # Сначала переместить все растения в этой локации в "Без локации"
-        plants_in_location = Plant.query.filter_by(location_id=location_id).all()
-        for plant in plants_in_location:
-            plant.location_id = None
-        
-        # Удаление фото локации
-        if location.photo_filename:
-            delete_file_from_disk(location.photo_filename)
-            
-        db.session.delete(location)
+        # Растения локации переводятся в "Без локации" одним UPDATE
+        delete_location_rows(location)
         db.session.commit()
         flash(f'Локация \"{location_name}\" успешно удалена!', 'success')
         return redirect(url_for('locations'))
 
+    @app.route('/api/plants/archive', methods=['POST'])
+    @app.route('/api/plants/restore', methods=['POST'], endpoint='api_plants_restore')
+    def api_plants_archive():
+        """
+        Массово архивировать или восстановить растения одним UPDATE.
+        Тело запроса: {"plant_ids": [1, 2, 3]} и/или {"location_id": 4}
+        """
+        payload = request.get_json(silent=True)
+        if not isinstance(payload, dict):
+            return jsonify({'error': 'expected a JSON object with "plant_ids" or "location_id"'}), 400
+        plant_ids = payload.get('plant_ids')
+        location_id = payload.get('location_id')
+        if plant_ids is not None and (not isinstance(plant_ids, list)
+                                      or not all(isinstance(plant_id, int) for plant_id in plant_ids)):
+            return jsonify({'error': 'plant_ids must be a list of integers'}), 400
+        if location_id is not None and not isinstance(location_id, int):
+            return jsonify({'error': 'location_id must be an integer'}), 400
+
+        condition = plant_filter(current_user_id(), plant_ids, location_id)
+        if condition is None:
+            return jsonify({'error': 'plant_ids or location_id is required'}), 400
+        updated = set_archived(current_user_id(), condition, archived=request.endpoint == 'api_plants_archive')
+        db.session.commit()
+        return jsonify({'updated': updated})
+
+    @app.route('/api/phase_durations')
+    def api_phase_durations():
+        """Средняя продолжительность завершенных этапов роста по видам растений"""
+        user_id = current_user_id()
+        return jsonify(phase_durations_by_species(user_id) if user_id else [])
+
+    @app.route('/api/search')
+    def api_search():
+        """
+        Ранжированный поиск в формате JSON: /api/search?q=томат&type=plant&limit=20&cursor=...
+        type (plant, location или event) можно указать несколько раз.
+        """
+        kinds = request.args.getlist('type')
+        if any(kind not in SEARCH_KINDS for kind in kinds):
+            return jsonify({'error': f'type must be one of {", ".join(SEARCH_KINDS)}'}), 400
+        limit = min(max(request.args.get('limit', app.config['SEARCH_PAGE_SIZE'], type=int), 1),
+                    app.config['SEARCH_MAX_LIMIT'])
+        results, next_cursor = search(current_user_id(), request.args.get('q'), kinds,
+                                      request.args.get('cursor'), limit)
+
+        results_data = []
+        for kind, obj in results:
+            if kind == 'plant':
+                result = {'name': obj.name, 'species': obj.species,
+                          'location_name': obj.location.name if obj.location else None,
+                          'url': url_for('plant_detail', plant_id=obj.id)}
+            elif kind == 'location':
+                result = {'name': obj.name, 'description': obj.description,
+                          'url': url_for('location_detail', location_id=obj.id)}
+            else:
+                result = {'title': obj.title, 'description': obj.description, 'date': obj.event_date.isoformat(),
+                          'type': obj.event_type, 'plant_id': obj.plant_id, 'plant_name': obj.plant.name,
+                          'url': url_for('plant_detail', plant_id=obj.plant_id)}
+            results_data.append(dict(result, kind=kind, id=obj.id))
+        return jsonify({'results': results_data, 'next_cursor': next_cursor})
+
     @app.route('/api/growth_phases')
     def api_growth_phases():
         """API endpoint для получения всех этапов роста"""
-        phases = GrowthPhase.query.order_by(GrowthPhase.phase_order).all()
-        phases_data = []
-        for phase in phases:
-            phases_data.append({
-                'id': phase.id,
-                'name': phase.name,
-                'description': phase.description
-            })
-        return jsonify(phases_data)
+        def load_phases():
+            phases = GrowthPhase.query.order_by(GrowthPhase.phase_order).all()
+            phases_data = []
+            for phase in phases:
+                phases_data.append({
+                    'id': phase.id,
+                    'name': phase.name,
+                    'description': phase.description
+                })
+            return phases_data
+
+        # Этапы роста заполняются один раз при инициализации и почти не меняются
+        return jsonify(cached('growth_phases', 'all', load_phases, app.config['GROWTH_PHASES_CACHE_TTL']))
 
     @app.route('/api/timeline/<int:plant_id>')
     def api_timeline(plant_id):
         """API endpoint для получения данных хронологии растения в формате JSON"""
-        plant = Plant.query.get_or_404(plant_id)
-        timeline_events = TimelineEvent.query.filter_by(plant_id=plant_id).order_by(TimelineEvent.event_date).all()
-
-        events_data = []
-        for event in timeline_events:
-            event_data = {
-                'id': event.id,
-                'title': event.title,
-                'date': event.event_date.isoformat(),
-                'type': event.event_type,
-                'description': event.description,
-                'phase_name': event.growth_phase.name if event.growth_phase else None,
-                'fertilization_type': event.fertilization_type,
-                'fertilization_amount': event.fertilization_amount,
-                'photo_filename': event.photo_filename
+        limit = min(request.args.get('limit', 100, type=int), app.config['API_TIMELINE_MAX_LIMIT'])
+        cursor = request.args.get('cursor')
+
+        # Опрашивающие клиенты между изменениями получают 304 после одного запроса к индексам
+        etag, last_modified, _ = plant_validators(plant_id, limit, cursor)
+        response = not_modified(etag, last_modified)
+        if response:
+            return response
+
+        def load_timeline():
+            plant = Plant.query.get_or_404(plant_id)
+            if plant.archived:
+                timeline_events, next_cursor = paginate_events(archived_events(plant_id), cursor, max(limit, 1))
+            else:
+                timeline_events, next_cursor = keyset_paginate(
+                    TimelineEvent.query.options(joinedload(TimelineEvent.growth_phase)).filter_by(plant_id=plant_id),
+                    [TimelineEvent.event_date, TimelineEvent.id], cursor, max(limit, 1),
+                    bound_page=timeline_partitioned())
+
+            events_data = []
+            for event in timeline_events:
+                event_data = {
+                    'id': event.id,
+                    'title': event.title,
+                    'date': event.event_date.isoformat(),
+                    'type': event.event_type,
+                    'description': event.description,
+                    'phase_name': event.growth_phase.name if event.growth_phase else None,
+                    'fertilization_type': event.fertilization_type,
+                    'fertilization_amount': event.fertilization_amount,
+                    'photo_filename': event.photo_filename
+                }
+                events_data.append(event_data)
+
+            return {
+                'plant_name': plant.name,
+                'events': events_data,
+                'next_cursor': next_cursor
             }
-            events_data.append(event_data)
 
-        return jsonify({
-            'plant_name': plant.name,
-            'events': events_data
-        })
+        # ETag (он учитывает limit и cursor) входит в ключ: тело из кеша всегда соответствует
+        # валидаторам из базы, даже если изменение зафиксировал другой процесс
+        response = jsonify(cached(f'timeline:{plant_id}', etag, load_timeline, app.config['TIMELINE_CACHE_TTL']))
+        return set_validators(response, etag, last_modified)
+
+    @app.route('/api/events/batch', methods=['POST'])
+    def api_events_batch():
+        """
+        Записать события для многих растений одной транзакцией. Тело запроса:
+        {"events": [{"plant_id": 1, "event_type": "watering", "event_date": "2024-05-01"},
+                    {"location_id": 2, "event_type": "fertilization", "event_date": "2024-05-01",
+                     "fertilization_type": "NPK", "fertilization_amount": "5 мл"}]}
+        Элемент с location_id добавляет событие всем неархивным растениям локации.
+        """
+        payload = request.get_json(silent=True)
+        user_id = current_user_id()
+        if not isinstance(payload, dict):
+            return jsonify({'error': 'expected a JSON object with an "events" list'}), 400
+        if not user_id:
+            return jsonify({'error': 'unknown plants'}), 400
+
+        try:
+            created, plant_ids = record_events(user_id, payload.get('events'), app.config['API_BATCH_MAX_EVENTS'])
+        except BatchError as e:
+            db.session.rollback()
+            return jsonify({'error': str(e)}), 400
+        db.session.commit()
+        return jsonify({'created': created, 'plant_ids': plant_ids}), 201
+
+    @app.route('/api/import', methods=['POST'])
+    def api_import():
+        """
+        Поставить в очередь массовый импорт растений и событий из CSV или NDJSON (см. bulk_import.py).
+        Файл передается в поле file, формат определяется по расширению или полю format.
+        Необязательное поле key задает ключ импорта (по умолчанию - SHA-256 файла).
+        """
+        upload = request.files.get('file')
+        if not upload or not upload.filename:
+            return jsonify({'error': 'a CSV or NDJSON file is required in the "file" field'}), 400
+        fmt = request.form.get('format') or source_format(upload.filename)
+        if fmt not in IMPORT_FORMATS:
+            return jsonify({'error': f'format must be one of {", ".join(IMPORT_FORMATS)}'}), 400
+        key = request.form.get('key')
+        if key is not None and not 0 < len(key) <= 64:
+            return jsonify({'error': 'key must be 1 to 64 characters long'}), 400
+
+        user_id = get_or_create_current_user_id()
+        try:
+            progress = queue_import(user_id, upload, fmt, key, app.config['IMPORT_DIR'])
+        except BulkImportError as e:
+            db.session.rollback()
+            return jsonify({'error': str(e)}), 409
+        body = dict(progress_data(progress), status_url=url_for('api_import_progress', key=progress.key))
+        return jsonify(body), 200 if progress.finished else 202
+
+    @app.route('/api/import/<key>')
+    def api_import_progress(key):
+        """Прогресс массового импорта"""
+        progress = db.session.get(ImportProgress, key)
+        if progress is None or progress.user_id != current_user_id():
+            return jsonify({'error': 'unknown import'}), 404
+        return jsonify(progress_data(progress))
+
+    @app.route('/export/<any(locations, plants, events, event_photos):dataset>.<any(ndjson, csv):fmt>')
+    def export(dataset, fmt):
+        """Потоковая выгрузка набора данных в NDJSON или CSV, сжатая gzip на лету"""
+        body = stream_with_context(export_gzip(current_user_id(), dataset, fmt))
+        response = app.response_class(body, mimetype='application/gzip')
+        response.headers['Content-Disposition'] = f'attachment; filename={dataset}.{fmt}.gz'
+        return response
+
+    @app.route('/photos/<path:filename>')
+    def photo(filename):
+        """Отдать фото из static/photos с неизменяемыми заголовками кеширования"""
+        return send_photo(filename)
+
+    @app.route('/healthz')
+    def healthz():
+        """Проверка живости процесса: база данных не опрашивается, только состояние пула и кеша"""
+        return jsonify({'status': 'ok', 'pool': pool_status(db.engine), 'cache': cache_stats(),
+                        'fragments': fragment_cache_status()})
+
+    @app.route('/readyz')
+    def readyz():
+        """
+        Проверка готовности: соединение берется из общего пула приложения и выполняет
+        SELECT 1. Время ожидания соединения показывает нагрузку на пул; при исчерпанном
+        пуле или недоступной базе возвращается 503.
+        """
+        started = time.monotonic()
+        try:
+            with db.engine.connect() as conn:
+                wait_ms = (time.monotonic() - started) * 1000
+                conn.execute(text('SELECT 1'))
+        except PoolTimeoutError:
+            status, wait_ms = 'saturated', (time.monotonic() - started) * 1000
+        except OperationalError:
+            status, wait_ms = 'unavailable', None
+        else:
+            status = 'ok'
+
+        body = {
+            'status': status,
+            'pool': pool_status(db.engine),
+            'checkout_wait_ms': round(wait_ms, 2) if wait_ms is not None else None,
+        }
+        return jsonify(body), 200 if status == 'ok' else 503
+
+    @app.route('/metrics')
+    def metrics():
+        """Метрики процесса в текстовом формате Prometheus"""
+        return app.response_class(render_metrics(), mimetype='text/plain; version=0.0.4')
 
     @app.errorhandler(404)
     def not_found(error):
@@ -0,0 +1,138 @@
+"""
+Пакетная запись событий хронологии (полив, подкормка и т.п. для многих растений сразу).
+
+Вместо отдельного POST /add_event на каждое растение клиент отправляет список
+событий. Элемент списка адресуется либо одному растению (plant_id), либо всем
+неархивным растениям локации (location_id). Принадлежность растений и
+локаций пользователю и существование этапов роста проверяются одним запросом, события вставляются одним
+executemany, счетчики сводки корректируются один раз - все в одной транзакции.
+"""
+from collections import Counter
+from datetime import datetime
+
+from sqlalchemy import insert, literal, null, or_, select, union_all
+
+from cache import invalidate_on_commit
+from models import db, GrowthPhase, Location, Plant, TimelineEvent
+from summary import adjust_summary, event_deltas
+
+# Необязательные поля события, которые копируются из элемента запроса как есть
+OPTIONAL_FIELDS = ('description', 'phase_id', 'fertilization_type', 'fertilization_amount')
+# Строковые поля события: длина проверяется по колонке таблицы (None - без ограничения)
+STRING_FIELDS = ('event_type', 'description', 'fertilization_type', 'fertilization_amount')
+
+
+class BatchError(ValueError):
+    """Некорректный пакет событий; сообщение возвращается клиенту"""
+
+
+def event_title(event_type, description, event_date_str):
+    """Заголовок события: начало описания или тип события с датой"""
+    if description.strip():
+        return description[:50] + "..." if len(description) > 50 else description
+    return f"{event_type.replace('_', ' ').title()} - {event_date_str}"
+
+
+def _parse_item(index, item):
+    """Проверить элемент пакета и вернуть значения полей события (без plant_id)"""
+    if not isinstance(item, dict):
+        raise BatchError(f'events[{index}] must be an object')
+    if (item.get('plant_id') is None) == (item.get('location_id') is None):
+        raise BatchError(f'events[{index}] needs exactly one of plant_id or location_id')
+    for key in ('plant_id', 'location_id', 'phase_id'):
+        value = item.get(key)
+        if value is not None and (isinstance(value, bool) or not isinstance(value, int)):
+            raise BatchError(f'events[{index}].{key} must be an integer')
+    for key in STRING_FIELDS:
+        value = item.get(key)
+        if value is None:
+            continue
+        if not isinstance(value, str):
+            raise BatchError(f'events[{index}].{key} must be a string')
+        max_length = TimelineEvent.__table__.c[key].type.length
+        if max_length is not None and len(value) > max_length:
+            raise BatchError(f'events[{index}].{key} must be at most {max_length} characters')
+
+    event_type = item.get('event_type')
+    if event_type is None or not event_type.strip():
+        raise BatchError(f'events[{index}].event_type is required')
+    event_date_str = item.get('event_date')
+    try:
+        event_date = datetime.strptime(event_date_str, '%Y-%m-%d').date()
+    except (TypeError, ValueError):
+        raise BatchError(f'events[{index}].event_date must be YYYY-MM-DD')
+
+    values = {field: item.get(field) for field in OPTIONAL_FIELDS}
+    values['description'] = values['description'] or ''
+    values.update(
+        event_type=event_type,
+        event_date=event_date,
+        title=event_title(event_type, values['description'], event_date_str),
+    )
+    return values
+
+
+def record_events(user_id, items, max_events):
+    """
+    Записать пакет событий пользователя в текущей транзакции сессии.
+    Возвращает (количество событий, id растений, получивших события).
+    """
+    if not isinstance(items, list) or not items:
+        raise BatchError('events must be a non-empty list')
+    parsed = [(item, _parse_item(index, item)) for index, item in enumerate(items)]
+
+    plant_ids = {item['plant_id'] for item, _ in parsed if item.get('plant_id') is not None}
+    location_ids = {item['location_id'] for item, _ in parsed if item.get('location_id') is not None}
+    phase_ids = {values['phase_id'] for _, values in parsed if values['phase_id'] is not None}
+
+    # Один запрос: растения пользователя, названные явно или стоящие в указанных локациях,
+    # а также указанные локации пользователя и этапы роста
+    conditions = []
+    if plant_ids:
+        conditions.append(Plant.id.in_(plant_ids))
+    if location_ids:
+        conditions.append(Plant.location_id.in_(location_ids) & Plant.archived.is_(False))
+    lookups = [
+        select(literal('plant').label('kind'), Plant.id, Plant.location_id, Plant.archived)
+        .where(Plant.user_id == user_id, or_(*conditions))
+    ]
+    if location_ids:
+        lookups.append(select(literal('location'), Location.id, null(), null())
+                       .where(Location.user_id == user_id, Location.id.in_(location_ids)))
+    if phase_ids:
+        lookups.append(select(literal('phase'), GrowthPhase.id, null(), null()).where(GrowthPhase.id.in_(phase_ids)))
+    found = db.session.execute(union_all(*lookups)).all()
+
+    owned = sorted((row for row in found if row.kind == 'plant'), key=lambda row: row.id)
+    for kind, requested in (('plant', plant_ids), ('location', location_ids), ('phase', phase_ids)):
+        missing = requested - {row.id for row in found if row.kind == kind}
+        if missing:
+            raise BatchError(f'unknown {kind}s: {sorted(missing)}')
+    plants_by_location = {}
+    for _, plant_id, location_id, archived in owned:
+        if location_id in location_ids and not archived:
+            plants_by_location.setdefault(location_id, []).append(plant_id)
+
+    rows = []
+    for item, values in parsed:
+        if item.get('plant_id') is not None:
+            targets = [item['plant_id']]
+        else:
+            targets = plants_by_location.get(item['location_id'], [])
+        rows.extend(dict(values, plant_id=plant_id) for plant_id in targets)
+    if len(rows) > max_events:
+        raise BatchError(f'batch expands to {len(rows)} events, the limit is {max_events}')
+    if not rows:
+        return 0, []
+
+    db.session.execute(insert(TimelineEvent), rows)
+
+    deltas = Counter()
+    for row in rows:
+        deltas.update(event_deltas(row['event_type'], 1))
+    adjust_summary(user_id, **deltas)
+
+    # Вставка через Core не попадает в отслеживание сессии - сбрасываем кеш хронологий явно
+    touched = list(dict.fromkeys(row['plant_id'] for row in rows))
+    invalidate_on_commit(*(f'timeline:{plant_id}' for plant_id in touched))
+    return len(rows), touched
@@ -0,0 +1,100 @@
+#!/usr/bin/env python3
+"""
+Сравнение скорости записи событий: POST /add_event на каждое растение
+против одного POST /api/events/batch.
+
+Скрипт создает временную базу SQLite в памяти, заполняет её растениями и выполняет
+оба варианта через тестовый клиент Flask, выводя число событий в секунду.
+По окончании все таблицы базы удаляются (drop_all), поэтому с DATABASE_URL
+(тестовая база PostgreSQL) скрипт запускается только с флагом --i-know.
+
+Запуск: python bench_events.py [число растений] [--i-know]
+"""
+import os
+import sys
+import time
+
+DEFAULT_PLANTS = 40
+ROUNDS = 5
+
+
+def seed_plants(db, count):
+    """Создать пользователя по умолчанию, одну локацию и count растений в ней"""
+    from identity import invalidate_user_cache
+    from models import User, Location, Plant
+
+    user = User(username='default', email='default@example.com', password_hash='x')
+    db.session.add(user)
+    db.session.flush()
+    location = Location(user_id=user.id, name='Стеллаж')
+    db.session.add(location)
+    db.session.flush()
+    plants = [Plant(user_id=user.id, location_id=location.id, name=f'Растение {i}') for i in range(count)]
+    db.session.add_all(plants)
+    db.session.commit()
+    invalidate_user_cache()
+    return location.id, [plant.id for plant in plants]
+
+
+def bench_per_event(client, plant_ids):
+    started = time.perf_counter()
+    for plant_id in plant_ids:
+        response = client.post(f'/add_event/{plant_id}', data={'event_type': 'watering', 'event_date': '2024-05-01'})
+        if response.status_code != 302:
+            raise RuntimeError(f'/add_event returned {response.status_code}')
+    return time.perf_counter() - started
+
+
+def bench_batch(client, plant_ids):
+    events = [{'plant_id': plant_id, 'event_type': 'watering', 'event_date': '2024-05-01'} for plant_id in plant_ids]
+    started = time.perf_counter()
+    response = client.post('/api/events/batch', json={'events': events})
+    if response.status_code != 201:
+        raise RuntimeError(f'/api/events/batch returned {response.status_code}: {response.get_data(as_text=True)}')
+    return time.perf_counter() - started
+
+
+def bench_location(client, location_id, count):
+    started = time.perf_counter()
+    response = client.post('/api/events/batch', json={'events': [
+        {'location_id': location_id, 'event_type': 'watering', 'event_date': '2024-05-01'}]})
+    if response.status_code != 201 or response.get_json()['created'] != count:
+        raise RuntimeError(f'/api/events/batch returned {response.status_code}: {response.get_data(as_text=True)}')
+    return time.perf_counter() - started
+
+
+def main():
+    args = [arg for arg in sys.argv[1:] if arg != '--i-know']
+    count = int(args[0]) if args else DEFAULT_PLANTS
+    if os.environ.get('DATABASE_URL') and '--i-know' not in sys.argv:
+        sys.exit('DATABASE_URL is set: the benchmark drops all tables of that database at the end. '
+                 'Unset it to use a temporary SQLite database or pass --i-know for a disposable test database.')
+    os.environ.setdefault('DATABASE_URL', 'sqlite://')
+    from app import create_app
+    from init_db import init_database
+    from models import db
+
+    app = create_app()
+    with app.app_context():
+        init_database()
+        location_id, plant_ids = seed_plants(db, count)
+        client = app.test_client()
+
+        results = {'per-event /add_event': [], 'batch by plant_id': [], 'batch by location_id': []}
+        for _ in range(ROUNDS):
+            results['per-event /add_event'].append(bench_per_event(client, plant_ids))
+            results['batch by plant_id'].append(bench_batch(client, plant_ids))
+            results['batch by location_id'].append(bench_location(client, location_id, count))
+
+        print(f'{count} events per round, best of {ROUNDS} rounds')
+        baseline = min(results['per-event /add_event'])
+        for name, timings in results.items():
+            best = min(timings)
+            print(f'{name:24} {best * 1000:8.1f} ms  {count / best:10.0f} events/s  x{baseline / best:.1f}')
+
+        db.session.remove()
+        db.drop_all()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,259 @@
+#!/usr/bin/env python3
+"""
+Бенчмарк маршрутов приложения: задержки p50/p95/p99, пропускная способность
+и количество SQL-запросов на запрос.
+
+Каждый маршрут из ROUTES (страницы, /api/*, служебные) выполняется --requests
+раз через тестовый клиент Flask или по HTTP к запущенному серверу (--url,
+параллельно в --concurrency потоков). id локации и растения для адресов
+берутся из базы DATABASE_URL, поэтому при --url она должна совпадать с базой
+сервера. Без DATABASE_URL создается временная база SQLite, заполненная
+seed_data.py в масштабе --locations/--plants/--events.
+
+Результаты можно сохранить как опорные (--save) и сравнить с ними (--baseline):
+рост p95 больше --max-regression процентов считается регрессией, и скрипт
+завершается с ненулевым кодом. Количество SQL-запросов считается только
+в режиме тестового клиента.
+
+Запуск:
+  python benchmark.py [--requests 200] [--save bench_baseline.json]
+  DATABASE_URL=postgresql://... python seed_data.py --plants 100 --events 500
+  DATABASE_URL=postgresql://... python benchmark.py --url http://localhost:5000 --concurrency 8
+"""
+import argparse
+import json
+import os
+import statistics
+import sys
+import tempfile
+import time
+import urllib.error
+import urllib.parse
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date
+
+from check_queries import count_queries
+
+# (имя, метод, адрес, тело: {'json': ...} или {'data': поля формы}); в адресах подставляются location_id, plant_id и today
+ROUTES = [
+    ('dashboard', 'GET', '/', None),
+    ('plants', 'GET', '/plants', None),
+    ('plants by location', 'GET', '/plants?location={location_id}', None),
+    ('archive', 'GET', '/archive', None),
+    ('locations', 'GET', '/locations', None),
+    ('location detail', 'GET', '/location/{location_id}', None),
+    ('plant detail', 'GET', '/plant/{plant_id}', None),
+    ('plant timeline page', 'GET', '/plant/{plant_id}?partial=1', None),
+    ('add plant form', 'GET', '/add_plant', None),
+    ('edit plant form', 'GET', '/edit_plant/{plant_id}', None),
+    ('edit location form', 'GET', '/edit_location/{location_id}', None),
+    ('search page', 'GET', '/search?q=листья', None),
+    ('api timeline', 'GET', '/api/timeline/{plant_id}', None),
+    ('api growth phases', 'GET', '/api/growth_phases', None),
+    ('api phase durations', 'GET', '/api/phase_durations', None),
+    ('api search', 'GET', '/api/search?q=подкормка', None),
+    ('export locations', 'GET', '/export/locations.csv', None),
+    ('healthz', 'GET', '/healthz', None),
+    ('readyz', 'GET', '/readyz', None),
+    ('metrics', 'GET', '/metrics', None),
+    ('add event', 'POST', '/add_event/{plant_id}', {'data': {'event_type': 'watering', 'event_date': '{today}'}}),
+    ('api events batch', 'POST', '/api/events/batch', {'json': {'events': [
+        {'location_id': '{location_id}', 'event_type': 'watering', 'event_date': '{today}'}]}}),
+]
+
+
+def _fill(value, ids):
+    """Подставить id в адрес или тело запроса (числа остаются числами)"""
+    if isinstance(value, dict):
+        return {key: _fill(item, ids) for key, item in value.items()}
+    if isinstance(value, list):
+        return [_fill(item, ids) for item in value]
+    if isinstance(value, str):
+        if value.startswith('{') and value.endswith('}') and value[1:-1] in ids:
+            return ids[value[1:-1]]
+        return value.format(**ids)
+    return value
+
+
+def percentile(sorted_values, fraction):
+    index = min(len(sorted_values) - 1, max(0, round(fraction * len(sorted_values)) - 1))
+    return sorted_values[index]
+
+
+def summarize(timings, elapsed, query_counts=None):
+    timings = sorted(timings)
+    result = {
+        'p50_ms': round(percentile(timings, 0.50) * 1000, 2),
+        'p95_ms': round(percentile(timings, 0.95) * 1000, 2),
+        'p99_ms': round(percentile(timings, 0.99) * 1000, 2),
+        'rps': round(len(timings) / elapsed, 1),
+    }
+    if query_counts:
+        result['queries'] = statistics.median(query_counts)
+    return result
+
+
+def bench_test_client(app, db, ids, requests_per_route):
+    """Все маршруты через тестовый клиент Flask, последовательно, с подсчетом SQL-запросов"""
+    client = app.test_client()
+    results = {}
+    for name, method, url, body in ROUTES:
+        url, body = _fill(url, ids), _fill(body or {}, ids)
+        timings, query_counts = [], []
+        # Прогрев: кеши процесса и первое обращение к шаблону не входят в измерение
+        client.open(url, method=method, **body).close()
+        started = time.perf_counter()
+        for _ in range(requests_per_route):
+            with count_queries(db.engine) as statements:
+                request_started = time.perf_counter()
+                response = client.open(url, method=method, **body)
+                # Потоковые ответы (выгрузка) измеряются до последнего байта
+                response.get_data()
+                response.close()
+                timings.append(time.perf_counter() - request_started)
+            if response.status_code >= 400:
+                raise RuntimeError(f'{method} {url} returned {response.status_code}')
+            query_counts.append(len(statements))
+        results[name] = summarize(timings, time.perf_counter() - started, query_counts)
+    return results
+
+
+def _http_request(base_url, method, url, body):
+    data, headers = None, {}
+    if 'json' in body:
+        data, headers = json.dumps(body['json']).encode('utf-8'), {'Content-Type': 'application/json'}
+    elif 'data' in body:
+        data = urllib.parse.urlencode(body['data']).encode('utf-8')
+        headers = {'Content-Type': 'application/x-www-form-urlencoded'}
+    quoted = urllib.parse.quote(url, safe='/?=&')
+    request = urllib.request.Request(base_url + quoted, data=data, headers=headers, method=method)
+    started = time.perf_counter()
+    try:
+        with urllib.request.urlopen(request) as response:
+            response.read()
+            status = response.status
+    except urllib.error.HTTPError as e:
+        status = e.code
+    elapsed = time.perf_counter() - started
+    if status >= 400:
+        raise RuntimeError(f'{method} {url} returned {status}')
+    return elapsed
+
+
+class _NoRedirect(urllib.request.HTTPRedirectHandler):
+    """Ответ 302 после POST-форм измеряется сам по себе, без загрузки страницы перенаправления"""
+
+    def redirect_request(self, *args, **kwargs):
+        return None
+
+
+def bench_http(base_url, ids, requests_per_route, concurrency):
+    """Все маршруты по HTTP к запущенному серверу в concurrency потоков"""
+    urllib.request.install_opener(urllib.request.build_opener(_NoRedirect()))
+    results = {}
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        for name, method, url, body in ROUTES:
+            url, body = _fill(url, ids), _fill(body or {}, ids)
+            _http_request(base_url, method, url, body)
+            started = time.perf_counter()
+            timings = list(pool.map(lambda _: _http_request(base_url, method, url, body),
+                                    range(requests_per_route)))
+            results[name] = summarize(timings, time.perf_counter() - started)
+    return results
+
+
+def compare(results, baseline, max_regression):
+    """Напечатать результаты рядом с опорными; вернуть список регрессий p95"""
+    regressions = []
+    print(f"{'route':24} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8} {'req/s':>8} {'SQL':>5}  vs baseline p95")
+    for name, result in results.items():
+        line = (f"{name:24} {result['p50_ms']:8.2f} {result['p95_ms']:8.2f} {result['p99_ms']:8.2f} "
+                f"{result['rps']:8.1f} {result.get('queries', '-'):>5}")
+        previous = baseline.get(name) if baseline else None
+        if previous:
+            change = (result['p95_ms'] - previous['p95_ms']) / previous['p95_ms'] * 100 if previous['p95_ms'] else 0
+            line += f'  {change:+6.1f}%'
+            if change > max_regression:
+                regressions.append(f"{name}: p95 {previous['p95_ms']} -> {result['p95_ms']} ms ({change:+.1f}%)")
+            if 'queries' in previous and result.get('queries', previous['queries']) > previous['queries']:
+                regressions.append(f"{name}: SQL queries {previous['queries']} -> {result['queries']}")
+        print(line)
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark every route of the plant tracker')
+    parser.add_argument('--url', help='benchmark a running server over HTTP instead of the Flask test client')
+    parser.add_argument('--requests', type=int, default=100, help='requests per route')
+    parser.add_argument('--concurrency', type=int, default=4, help='parallel HTTP clients')
+    parser.add_argument('--locations', type=int, default=5, help='seed scale for the temporary database')
+    parser.add_argument('--plants', type=int, default=20)
+    parser.add_argument('--events', type=int, default=50)
+    parser.add_argument('--save', help='write results as a baseline JSON file')
+    parser.add_argument('--baseline', help='compare against a baseline JSON file')
+    parser.add_argument('--max-regression', type=float, default=25.0, help='allowed p95 growth, percent')
+    args = parser.parse_args()
+
+    temp_db = None
+    if not os.environ.get('DATABASE_URL'):
+        temp_db = tempfile.NamedTemporaryFile(suffix='.db', delete=False)
+        temp_db.close()
+        os.environ['DATABASE_URL'] = f'sqlite:///{temp_db.name}'
+
+    from app import create_app
+    from identity import current_user_id, invalidate_user_cache
+    from init_db import init_database
+    from models import db, Location, Plant
+    from seed_data import seed
+
+    app = create_app()
+    try:
+        with app.app_context():
+            init_database()
+            if temp_db:
+                seed(locations=args.locations, plants=args.plants, events=args.events, verbose=False)
+                invalidate_user_cache()
+            with app.test_request_context():
+                user_id = current_user_id()
+            if user_id is None:
+                sys.exit('No default user in the database - run seed_data.py first')
+            ids = {
+                'location_id': db.session.execute(db.select(db.func.min(Location.id)).where(
+                    Location.user_id == user_id)).scalar(),
+                'plant_id': db.session.execute(db.select(db.func.min(Plant.id)).where(
+                    Plant.user_id == user_id, Plant.archived.is_(False))).scalar(),
+                'today': date.today().isoformat(),
+            }
+            dialect = db.engine.dialect.name
+            db.session.remove()
+
+            if args.url:
+                results = bench_http(args.url.rstrip('/'), ids, args.requests, args.concurrency)
+            else:
+                results = bench_test_client(app, db, ids, args.requests)
+    finally:
+        if temp_db:
+            os.remove(temp_db.name)
+
+    baseline = None
+    if args.baseline:
+        with open(args.baseline, encoding='utf-8') as source:
+            baseline = json.load(source)['routes']
+    print(f"{dialect}, {'HTTP ' + args.url if args.url else 'Flask test client'}, "
+          f"{args.requests} requests per route")
+    regressions = compare(results, baseline, args.max_regression)
+
+    if args.save:
+        with open(args.save, 'w', encoding='utf-8') as target:
+            json.dump({'database': dialect, 'mode': 'http' if args.url else 'test_client',
+                       'requests': args.requests, 'routes': results}, target, ensure_ascii=False, indent=2)
+            target.write('\n')
+        print(f'Baseline saved to {args.save}')
+    if regressions:
+        print('\n'.join(['Regressions:'] + regressions))
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
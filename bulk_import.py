@@ -0,0 +1,480 @@
+#!/usr/bin/env python3
+"""
+Массовый импорт растений и истории хронологии из CSV или NDJSON (можно сжатых gzip).
+
+Каждая строка источника описывает одно событие растения, либо только само
+растение, если event_type не указан:
+
+    location_name, plant_name, species, planted_date, notes, plant_photo,
+    event_type, event_date, title, description, phase_name,
+    fertilization_type, fertilization_amount, photo_filename, photos
+
+Локации и этапы роста находятся по имени, растения - по паре (локация, имя);
+недостающие локации и растения создаются. Фото указываются путями
+относительно static и должны уже лежать в хранилище static/photos (photos - список
+путей, в CSV через '|'); строки с другими путями отклоняются.
+
+Строки обрабатываются порциями по IMPORT_CHUNK_SIZE: имена разрешаются
+несколькими запросами IN (...), id новых строк выделяются заранее, а сами
+строки загружаются через COPY на PostgreSQL или одним executemany на SQLite.
+Каждая порция фиксируется вместе с прогрессом в import_progress, поэтому
+прерванный импорт с тем же ключом продолжается с первой незафиксированной строки.
+
+Маршрут: POST /api/import (файл в поле file), прогресс - GET /api/import/<ключ>
+Командная строка: python bulk_import.py <файл> [ключ]
+"""
+import csv
+import gzip
+import hashlib
+import io
+import json
+import os
+import sys
+from collections import Counter
+from datetime import date, datetime
+from itertools import islice
+
+from sqlalchemy import func, select, text, update
+from sqlalchemy.exc import IntegrityError
+
+from batch_events import event_title
+from cache import invalidate_on_commit
+from jobs import enqueue_job, job_handler
+from models import db, EventPhoto, GrowthPhase, ImportProgress, Location, PhotoJob, Plant, TimelineEvent
+from photo_storage import CHUNK_SIZE, HashingUploadFile, acquire_photos, stored_photo_path
+from summary import adjust_summary, event_deltas
+
+IMPORT_CHUNK_SIZE = 5000
+FORMATS = ('csv', 'ndjson')
+
+
+class BulkImportError(ValueError):
+    """Некорректная строка источника; порция не загружается, прогресс остается прежним"""
+
+
+def source_format(filename):
+    """Формат по расширению файла (.csv, .ndjson/.jsonl, в том числе с .gz) или None"""
+    name = filename.lower()
+    if name.endswith('.gz'):
+        name = name[:-3]
+    if name.endswith('.csv'):
+        return 'csv'
+    if name.endswith(('.ndjson', '.jsonl')):
+        return 'ndjson'
+    return None
+
+
+def file_key(path):
+    """Ключ импорта по умолчанию - SHA-256 содержимого файла"""
+    digest = hashlib.sha256()
+    with open(path, 'rb') as source:
+        for chunk in iter(lambda: source.read(CHUNK_SIZE), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def read_rows(path, fmt):
+    """Генератор строк источника в виде словарей; gzip распознается по сигнатуре"""
+    with open(path, 'rb') as source:
+        compressed = source.read(2) == b'\x1f\x8b'
+    opener = gzip.open if compressed else open
+    with opener(path, 'rt', encoding='utf-8', newline='') as source:
+        if fmt == 'csv':
+            yield from csv.DictReader(source)
+        else:
+            for line in source:
+                if line.strip():
+                    yield json.loads(line)
+
+
+def _text(row, field, number, max_length=None):
+    value = row.get(field)
+    if value is None:
+        return None
+    value = str(value).strip()
+    if max_length and len(value) > max_length:
+        raise BulkImportError(f'row {number}: {field} is longer than {max_length} characters')
+    return value or None
+
+
+def _date(row, field, number):
+    value = _text(row, field, number)
+    if value is None:
+        return None
+    try:
+        return datetime.strptime(value, '%Y-%m-%d').date()
+    except ValueError:
+        raise BulkImportError(f'row {number}: {field} must be YYYY-MM-DD')
+
+
+def _photo_path(path, field, number):
+    """Путь к уже загруженному фото: только существующие файлы внутри static/photos"""
+    if path is not None and not (path.startswith('photos/') and stored_photo_path(path[len('photos/'):])):
+        raise BulkImportError(f'row {number}: {field} "{path}" is not a stored photo under photos/')
+    return path
+
+
+def _photo(row, field, number):
+    return _photo_path(_text(row, field, number, 255), field, number)
+
+
+def _photos(row, number):
+    photos = row.get('photos') or []
+    if isinstance(photos, str):
+        photos = photos.split('|')
+    if not isinstance(photos, list):
+        raise BulkImportError(f'row {number}: photos must be a list of paths')
+    return [_photo_path(photo, 'photos', number) for photo in (str(photo).strip() for photo in photos) if photo]
+
+
+def _copy_value(value):
+    """Значение в текстовом формате COPY"""
+    if value is None:
+        return '\\N'
+    if isinstance(value, bool):
+        return 't' if value else 'f'
+    if isinstance(value, (date, datetime)):
+        return value.isoformat()
+    return (str(value).replace('\\', '\\\\').replace('\t', '\\t')
+            .replace('\n', '\\n').replace('\r', '\\r'))
+
+
+def copy_rows(table, columns, rows):
+    """Загрузить кортежи значений колонок: COPY на PostgreSQL, executemany на остальных базах"""
+    if not rows:
+        return
+    connection = db.session.connection()
+    if connection.dialect.name != 'postgresql':
+        db.session.execute(table.insert(), [dict(zip(columns, row)) for row in rows])
+        return
+
+    buffer = io.StringIO()
+    for row in rows:
+        buffer.write('\t'.join(_copy_value(value) for value in row))
+        buffer.write('\n')
+    buffer.seek(0)
+    # COPY выполняется на соединении сессии, то есть в той же транзакции
+    cursor = connection.connection.cursor()
+    try:
+        cursor.copy_expert(f'COPY {table.name} ({", ".join(columns)}) FROM STDIN', buffer)
+    finally:
+        cursor.close()
+
+
+def allocate_ids(table, count):
+    """
+    Выделить count id для новых строк таблицы, чтобы ссылаться на них до вставки.
+    На SQLite вызывается под блокировкой записи, которую берет UPDATE прогресса порции.
+    """
+    if not count:
+        return []
+    if db.session.connection().dialect.name == 'postgresql':
+        return db.session.execute(
+            text("SELECT nextval(pg_get_serial_sequence(:table, 'id')) FROM generate_series(1, :count)"),
+            {'table': table.name, 'count': count}
+        ).scalars().all()
+    last_id = db.session.execute(select(func.coalesce(func.max(table.c.id), 0))).scalar()
+    return list(range(last_id + 1, last_id + count + 1))
+
+
+class BulkImporter:
+    """
+    Загрузка порций строк одного пользователя. Соответствия имен локаций, этапов
+    роста и растений их id накапливаются между порциями, поэтому каждое имя
+    ищется в базе не больше одного раза за импорт.
+    """
+
+    def __init__(self, user_id, key):
+        self.user_id = user_id
+        self.key = key
+        self.phases = {name.lower(): phase_id for phase_id, name in
+                       db.session.execute(select(GrowthPhase.id, GrowthPhase.name))}
+        self.locations = {}
+        self.plants = {}
+
+    def _parse(self, number, row):
+        if not isinstance(row, dict):
+            raise BulkImportError(f'row {number}: expected an object')
+        parsed = {
+            'location_name': _text(row, 'location_name', number, 100),
+            'plant_name': _text(row, 'plant_name', number, 100),
+            'species': _text(row, 'species', number, 100),
+            'planted_date': _date(row, 'planted_date', number),
+            'notes': _text(row, 'notes', number),
+            'plant_photo': _photo(row, 'plant_photo', number),
+            'event_type': _text(row, 'event_type', number, 50),
+        }
+        if parsed['plant_name'] is None:
+            raise BulkImportError(f'row {number}: plant_name is required')
+        if parsed['event_type'] is None:
+            return parsed
+
+        event_date = _date(row, 'event_date', number)
+        if event_date is None:
+            raise BulkImportError(f'row {number}: event_date is required for events')
+        phase_name = _text(row, 'phase_name', number)
+        phase_id = None
+        if phase_name is not None:
+            phase_id = self.phases.get(phase_name.lower())
+            if phase_id is None:
+                raise BulkImportError(f'row {number}: unknown growth phase "{phase_name}"')
+        description = _text(row, 'description', number) or ''
+        parsed.update(
+            event_date=event_date,
+            title=(_text(row, 'title', number)
+                   or event_title(parsed['event_type'], description, event_date.isoformat()))[:200],
+            description=description,
+            phase_id=phase_id,
+            fertilization_type=_text(row, 'fertilization_type', number, 100),
+            fertilization_amount=_text(row, 'fertilization_amount', number, 50),
+            photo_filename=_photo(row, 'photo_filename', number),
+            photos=_photos(row, number),
+        )
+        return parsed
+
+    def _resolve_locations(self, names):
+        """Найти уже существующие локации пользователя по именам; вернуть недостающие имена"""
+        unknown = {name for name in names if name is not None and name not in self.locations}
+        if unknown:
+            found = db.session.execute(
+                select(Location.name, func.min(Location.id))
+                .where(Location.user_id == self.user_id, Location.name.in_(unknown))
+                .group_by(Location.name)
+            ).all()
+            self.locations.update(found)
+        return [name for name in dict.fromkeys(names) if name is not None and name not in self.locations]
+
+    def _resolve_plants(self, keys):
+        """Найти растения пользователя по (id локации, имя); вернуть недостающие ключи"""
+        unknown = {key for key in keys if key not in self.plants}
+        if unknown:
+            found = db.session.execute(
+                select(Plant.location_id, Plant.name, func.min(Plant.id))
+                .where(Plant.user_id == self.user_id, Plant.name.in_({name for _, name in unknown}))
+                .group_by(Plant.location_id, Plant.name)
+            ).all()
+            self.plants.update(((location_id, name), plant_id) for location_id, name, plant_id in found)
+        return [key for key in dict.fromkeys(keys) if key not in self.plants]
+
+    def load(self, rows_done, rows):
+        """
+        Загрузить одну порцию в текущей транзакции и продвинуть прогресс.
+        rows_done - сколько строк источника уже было загружено до этой порции.
+        """
+        parsed = [self._parse(rows_done + index + 1, row) for index, row in enumerate(rows)]
+        now = datetime.utcnow()
+
+        # Первая запись порции: проверяет, что прогресс не ушел вперед в параллельном
+        # запуске, и берет блокировку записи (на SQLite - всей базы) до фиксации
+        advanced = db.session.execute(
+            update(ImportProgress)
+            .where(ImportProgress.key == self.key, ImportProgress.rows_done == rows_done)
+            .values(rows_done=rows_done + len(rows), updated_at=now),
+            execution_options={'synchronize_session': False}
+        ).rowcount
+        if not advanced:
+            raise BulkImportError(f'import {self.key} is running elsewhere or has already advanced')
+
+        new_locations = self._resolve_locations([row['location_name'] for row in parsed])
+        location_ids = allocate_ids(Location.__table__, len(new_locations))
+        copy_rows(Location.__table__, ('id', 'user_id', 'name', 'created_at', 'updated_at'), [
+            (location_id, self.user_id, name, now, now) for location_id, name in zip(location_ids, new_locations)])
+        self.locations.update(zip(new_locations, location_ids))
+
+        for row in parsed:
+            row['plant_key'] = (self.locations.get(row['location_name']), row['plant_name'])
+        new_plants = self._resolve_plants([row['plant_key'] for row in parsed])
+        # Поля нового растения берутся из первой его строки
+        first_rows = {}
+        for row in parsed:
+            first_rows.setdefault(row['plant_key'], row)
+        plant_ids = allocate_ids(Plant.__table__, len(new_plants))
+        plant_rows = [
+            (plant_id, self.user_id, location_id, name, first_rows[location_id, name]['species'],
+             first_rows[location_id, name]['planted_date'], first_rows[location_id, name]['notes'],
+             first_rows[location_id, name]['plant_photo'], False, now, now)
+            for plant_id, (location_id, name) in zip(plant_ids, new_plants)
+        ]
+        copy_rows(Plant.__table__, ('id', 'user_id', 'location_id', 'name', 'species', 'planted_date', 'notes',
+                                    'photo_filename', 'archived', 'created_at', 'updated_at'), plant_rows)
+        self.plants.update(zip(new_plants, plant_ids))
+
+        events = [row for row in parsed if row['event_type'] is not None]
+        event_ids = allocate_ids(TimelineEvent.__table__, len(events))
+        event_rows, photo_rows = [], []
+        for event_id, row in zip(event_ids, events):
+            event_rows.append((event_id, self.plants[row['plant_key']], row['event_type'], row['event_date'],
+                               row['title'], row['description'], row['phase_id'], row['fertilization_type'],
+                               row['fertilization_amount'], row['photo_filename'], now, now))
+            photo_rows.extend((event_id, filename, now, now) for filename in row['photos'])
+        copy_rows(TimelineEvent.__table__, (
+            'id', 'plant_id', 'event_type', 'event_date', 'title', 'description', 'phase_id',
+            'fertilization_type', 'fertilization_amount', 'photo_filename', 'created_at', 'updated_at'), event_rows)
+        copy_rows(EventPhoto.__table__, ('event_id', 'filename', 'created_at', 'updated_at'), photo_rows)
+
+        acquire_photos(*(row[7] for row in plant_rows), *(row[9] for row in event_rows),
+                       *(row[1] for row in photo_rows))
+
+        db.session.execute(
+            update(ImportProgress)
+            .where(ImportProgress.key == self.key)
+            .values(
+                locations_created=ImportProgress.locations_created + len(new_locations),
+                plants_created=ImportProgress.plants_created + len(new_plants),
+                events_created=ImportProgress.events_created + len(event_rows),
+                photos_created=ImportProgress.photos_created + len(photo_rows),
+            ),
+            execution_options={'synchronize_session': False}
+        )
+        deltas = Counter(location_count=len(new_locations), plant_count=len(new_plants))
+        for row in events:
+            deltas.update(event_deltas(row['event_type'], 1))
+        adjust_summary(self.user_id, **deltas)
+        # Вставка через COPY/Core не отслеживается сессией - сбрасываем кеш хронологий явно
+        invalidate_on_commit(*{f'timeline:{row[1]}' for row in event_rows})
+        return len(rows)
+
+
+def start_import(user_id, key):
+    """Получить прогресс импорта по ключу или создать его (с фиксацией)"""
+    progress = db.session.get(ImportProgress, key)
+    if progress is None:
+        try:
+            with db.session.begin_nested():
+                db.session.add(ImportProgress(key=key, user_id=user_id))
+        except IntegrityError:
+            pass  # Тот же импорт одновременно начал другой процесс
+        db.session.commit()
+        progress = db.session.get(ImportProgress, key)
+    if progress.user_id != user_id:
+        raise BulkImportError(f'import {key} belongs to another user')
+    return progress
+
+
+def import_rows(user_id, key, rows, chunk_size=IMPORT_CHUNK_SIZE):
+    """
+    Импортировать строки источника, фиксируя каждую порцию. Строки, уже учтенные
+    в прогрессе ключа, пропускаются. Возвращает прогресс импорта.
+    """
+    progress = start_import(user_id, key)
+    if progress.finished:
+        return progress
+    rows_done = progress.rows_done
+    importer = BulkImporter(user_id, key)
+    rows = islice(rows, rows_done, None)
+    try:
+        while True:
+            chunk = list(islice(rows, chunk_size))
+            if not chunk:
+                break
+            rows_done += importer.load(rows_done, chunk)
+            db.session.commit()
+    except Exception:
+        db.session.rollback()
+        raise
+
+    db.session.execute(
+        update(ImportProgress).where(ImportProgress.key == key).values(finished=True, updated_at=datetime.utcnow()))
+    db.session.commit()
+    return db.session.get(ImportProgress, key)
+
+
+def import_file(user_id, key, path, fmt):
+    """Импортировать файл CSV или NDJSON (можно сжатый gzip)"""
+    try:
+        return import_rows(user_id, key, read_rows(path, fmt))
+    except (UnicodeDecodeError, json.JSONDecodeError, csv.Error) as e:
+        raise BulkImportError(f'cannot read {fmt} source: {e}')
+
+
+def _import_job(key):
+    """Последняя задача фонового импорта с этим ключом (None, если задача уже выполнена)"""
+    return db.session.execute(
+        select(PhotoJob)
+        .where(PhotoJob.kind == 'bulk_import', PhotoJob.payload['key'].as_string() == key)
+        .order_by(PhotoJob.id.desc())
+        .limit(1)
+    ).scalar()
+
+
+def progress_data(progress):
+    """
+    Прогресс импорта для JSON API. failed - задача исчерпала попытки, error - последняя
+    строка ошибки задачи (есть и у задачи, которая еще будет повторена).
+    """
+    job = None if progress.finished else _import_job(progress.key)
+    error = job.last_error.strip().splitlines()[-1] if job is not None and job.last_error else None
+    return {
+        'key': progress.key,
+        'rows_done': progress.rows_done,
+        'locations_created': progress.locations_created,
+        'plants_created': progress.plants_created,
+        'events_created': progress.events_created,
+        'photos_created': progress.photos_created,
+        'finished': progress.finished,
+        'failed': job is not None and job.status == 'failed',
+        'error': error,
+    }
+
+
+def queue_import(user_id, upload, fmt, key, import_dir):
+    """
+    Сохранить загруженный файл в import_dir и поставить импорт в очередь фоновых задач.
+    Без ключа используется SHA-256 файла, посчитанный при приеме загрузки (UploadRequest
+    уже записал файл в import_dir, поэтому он только переименовывается).
+    Возвращает прогресс импорта (уже завершенный импорт повторно не запускается).
+    """
+    if isinstance(upload.stream, HashingUploadFile):
+        temp_name, sha256 = upload.stream.finish()
+    else:
+        with HashingUploadFile(import_dir) as temp_file:
+            for chunk in iter(lambda: upload.stream.read(CHUNK_SIZE), b''):
+                temp_file.write(chunk)
+        temp_name, sha256 = temp_file.finish()
+
+    progress = start_import(user_id, key or sha256)
+    if progress.finished:
+        os.remove(temp_name)
+        return progress
+
+    path = os.path.join(import_dir, f'{sha256}.{fmt}')
+    os.replace(temp_name, path)
+    enqueue_job('bulk_import', user_id=user_id, key=progress.key, path=path, fmt=fmt)
+    db.session.commit()
+    return progress
+
+
+@job_handler('bulk_import')
+def bulk_import_job(user_id, key, path, fmt):
+    # Повторный запуск задачи продолжает импорт с сохраненного прогресса
+    progress = db.session.get(ImportProgress, key)
+    if not (progress and progress.finished):
+        import_file(user_id, key, path, fmt)
+    try:
+        os.remove(path)
+    except FileNotFoundError:
+        pass
+
+
+if __name__ == "__main__":
+    # При прямом запуске нужно создать контекст приложения
+    if len(sys.argv) < 2 or not source_format(sys.argv[1]):
+        print("Usage: python bulk_import.py <file.csv|file.ndjson>[.gz] [key]")
+        sys.exit(2)
+
+    from app import create_app
+    from identity import get_or_create_current_user_id
+    app = create_app()
+    with app.app_context():
+        path = sys.argv[1]
+        key = sys.argv[2] if len(sys.argv) > 2 else file_key(path)
+        user_id = get_or_create_current_user_id()
+        db.session.commit()
+        try:
+            progress = import_file(user_id, key, path, source_format(path))
+        except BulkImportError as e:
+            print(f"Import {key} stopped: {e}")
+            sys.exit(1)
+        print(f"Import {key}: {progress.rows_done} rows, {progress.locations_created} locations, "
+              f"{progress.plants_created} plants, {progress.events_created} events, "
+              f"{progress.photos_created} event photos")
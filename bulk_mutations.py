@@ -0,0 +1,112 @@
+"""
+Массовые изменения растений и локаций набором SQL-операторов.
+
+Удаление растений и локаций, архивирование и восстановление выполняются
+постоянным числом UPDATE/DELETE независимо от количества затронутых строк.
+События и их фото удаляются каскадами базы данных (ondelete='CASCADE'),
+а имена файлов для очистки собираются одним запросом. Хронологии архивных
+растений переносятся в холодное хранение (cold_storage.py) порциями растений.
+"""
+from datetime import datetime
+
+from sqlalchemy import delete, func, or_, select, union_all, update
+
+from cache import invalidate_on_commit
+from cold_storage import archive_timelines, archived_photo_filenames, restore_timelines
+from models import db, EventPhoto, Location, Plant, TimelineEvent
+from photo_storage import release_photos
+from summary import adjust_summary, event_deltas
+
+
+def plant_filter(user_id, plant_ids=None, location_id=None):
+    """Условие выборки растений пользователя по списку id и/или по локации"""
+    conditions = []
+    if plant_ids:
+        conditions.append(Plant.id.in_(plant_ids))
+    if location_id is not None:
+        conditions.append(Plant.location_id == location_id)
+    return (Plant.user_id == user_id) & or_(*conditions) if conditions else None
+
+
+def plant_photo_filenames(condition):
+    """Все файлы фото выбранных растений, их событий и фото событий одним запросом"""
+    plant_ids = select(Plant.id).where(condition)
+    event_ids = select(TimelineEvent.id).where(TimelineEvent.plant_id.in_(plant_ids))
+    filenames = union_all(
+        select(Plant.photo_filename.label('filename')).where(condition),
+        select(TimelineEvent.photo_filename).where(TimelineEvent.plant_id.in_(plant_ids)),
+        select(EventPhoto.filename).where(EventPhoto.event_id.in_(event_ids)),
+    ).subquery()
+    return db.session.execute(select(filenames.c.filename).where(filenames.c.filename.isnot(None))).scalars().all()
+
+
+def delete_plants(user_id, condition):
+    """
+    Удалить выбранные растения пользователя вместе с событиями и фото.
+    Возвращает количество удаленных растений.
+    """
+    # Изменения сводки: растения (и архивные среди них) и их события по типам
+    plants = db.session.execute(select(Plant.id, Plant.archived).where(condition)).all()
+    if not plants:
+        return 0
+    plant_ids = [plant_id for plant_id, _ in plants]
+    summary_deltas = {'plant_count': -len(plants), 'archived_plant_count': -sum(1 for _, flag in plants if flag)}
+    event_type_counts = db.session.execute(
+        select(TimelineEvent.event_type, func.count(TimelineEvent.id))
+        .where(TimelineEvent.plant_id.in_(plant_ids))
+        .group_by(TimelineEvent.event_type)
+    )
+    for event_type, count in event_type_counts:
+        for column, delta in event_deltas(event_type, -count).items():
+            summary_deltas[column] = summary_deltas.get(column, 0) + delta
+
+    # Файлы удаляются фоновой задачей одним списком, включая фото хронологий в архиве
+    release_photos(*plant_photo_filenames(Plant.id.in_(plant_ids)), *archived_photo_filenames(plant_ids))
+
+    # События, фото событий и архивы хронологий удаляет каскад ondelete='CASCADE'
+    db.session.execute(
+        delete(Plant).where(Plant.id.in_(plant_ids)),
+        execution_options={'synchronize_session': False}
+    )
+    adjust_summary(user_id, **summary_deltas)
+    invalidate_on_commit(*(f'timeline:{plant_id}' for plant_id in plant_ids))
+    return len(plant_ids)
+
+
+def delete_location(location):
+    """Удалить локацию; ее растения остаются без локации"""
+    # Явный UPDATE вместо ondelete='SET NULL', чтобы у растений обновился updated_at (валидаторы ETag)
+    db.session.execute(
+        update(Plant).where(Plant.location_id == location.id).values(location_id=None, updated_at=datetime.utcnow()),
+        execution_options={'synchronize_session': False}
+    )
+    release_photos(location.photo_filename)
+    db.session.execute(
+        delete(Location).where(Location.id == location.id),
+        execution_options={'synchronize_session': False}
+    )
+    adjust_summary(location.user_id, location_count=-1)
+
+
+def set_archived(user_id, condition, archived):
+    """
+    Архивировать (archived=True) или восстановить выбранные растения; возвращает число измененных.
+    Хронологии архивируемых растений переносятся в холодное хранение, восстанавливаемых - обратно.
+    """
+    # archived может быть NULL у старых строк - такие растения считаются неархивными
+    changed = Plant.archived.isnot(True) if archived else Plant.archived.is_(True)
+    plant_ids = db.session.execute(select(Plant.id).where(condition, changed)).scalars().all()
+    if not plant_ids:
+        return 0
+    db.session.execute(
+        update(Plant)
+        .where(Plant.id.in_(plant_ids))
+        .values(archived=archived, updated_at=datetime.utcnow()),
+        execution_options={'synchronize_session': False}
+    )
+    adjust_summary(user_id, archived_plant_count=len(plant_ids) if archived else -len(plant_ids))
+    if archived:
+        archive_timelines(user_id, plant_ids)
+    else:
+        restore_timelines(user_id, plant_ids)
+    return len(plant_ids)
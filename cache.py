@@ -0,0 +1,212 @@
+"""
+Сквозной (read-through) кеш для справочных данных и ответов JSON API.
+
+Значения хранятся в бэкенде, выбранном настройкой CACHE_BACKEND:
+  memory    - LRU-кеш с TTL внутри процесса (по умолчанию)
+  memcached - общий для всех процессов memcached по адресу CACHE_URL
+              (нужен пакет pymemcache; подойдет и локальный memcached)
+
+Ключи группируются в пространства имен (например, 'timeline:<plant_id>').
+У каждого пространства есть версия, которая входит в ключи его записей,
+поэтому сброс пространства - это одна запись новой версии, а не удаление
+всех ключей. Пространства вложены: сброс 'timeline' сбрасывает и все
+'timeline:<plant_id>'. Изменения Plant, TimelineEvent и GrowthPhase сбрасывают
+соответствующие пространства после фиксации транзакции (этапы роста входят
+в хронологии всех растений, поэтому их изменение сбрасывает 'timeline').
+
+Кеш в памяти у каждого процесса gunicorn свой: сброс виден только в процессе,
+выполнившем запись, остальные увидят изменения не позже чем через TTL.
+Для мгновенного сброса во всех процессах используется memcached.
+"""
+import json
+import threading
+import time
+import uuid
+from collections import Counter, OrderedDict
+
+from flask import current_app, has_app_context
+from sqlalchemy import event
+from sqlalchemy.orm import Session
+
+from models import db, GrowthPhase, Plant, TimelineEvent
+
+
+class MemoryCache:
+    """LRU-кеш с временем жизни записей внутри процесса"""
+
+    def __init__(self, max_entries=1024):
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            value, expires_at = entry
+            if expires_at is not None and expires_at <= time.monotonic():
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return value
+
+    def set(self, key, value, ttl=None):
+        expires_at = time.monotonic() + ttl if ttl else None
+        with self._lock:
+            self._entries[key] = (value, expires_at)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def delete(self, key):
+        with self._lock:
+            self._entries.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def __len__(self):
+        return len(self._entries)
+
+
+class MemcachedCache:
+    """Общий для процессов кеш в memcached; значения сериализуются в JSON"""
+
+    def __init__(self, server, key_prefix='plant-tracker:'):
+        try:
+            from pymemcache.client.base import Client
+        except ImportError:
+            raise RuntimeError('CACHE_BACKEND=memcached requires the pymemcache package')
+        host, _, port = server.partition(':')
+        self.key_prefix = key_prefix
+        self._client = Client((host, int(port or 11211)), connect_timeout=1, timeout=1, no_delay=True)
+
+    def get(self, key):
+        raw = self._client.get(self.key_prefix + key)
+        return json.loads(raw) if raw is not None else None
+
+    def set(self, key, value, ttl=None):
+        self._client.set(self.key_prefix + key, json.dumps(value), expire=ttl or 0, noreply=True)
+
+    def delete(self, key):
+        self._client.delete(self.key_prefix + key, noreply=True)
+
+    def clear(self):
+        self._client.flush_all(noreply=True)
+
+
+# Счетчики попаданий и промахов процесса по пространствам имен (без идентификаторов)
+_stats = Counter()
+_stats_lock = threading.Lock()
+
+
+def init_cache(app):
+    """Создать бэкенд кеша по настройкам приложения"""
+    if app.config['CACHE_BACKEND'] == 'memcached':
+        backend = MemcachedCache(app.config['CACHE_URL'])
+    else:
+        backend = MemoryCache(app.config['CACHE_MAX_ENTRIES'])
+    app.extensions['cache'] = backend
+    return backend
+
+
+def _backend():
+    return current_app.extensions['cache']
+
+
+def _stats_name(namespace):
+    """'timeline:42' -> 'timeline': счетчики не должны разрастаться по числу растений"""
+    return namespace.split(':', 1)[0]
+
+
+def record_lookup(name, hit):
+    """Учесть попадание или промах в счетчиках процесса (имя - без идентификаторов)"""
+    with _stats_lock:
+        _stats[(name, 'hits' if hit else 'misses')] += 1
+
+
+def _namespace_version(backend, namespace):
+    version = backend.get(f'{namespace}:version')
+    if version is None:
+        version = uuid.uuid4().hex[:12]
+        backend.set(f'{namespace}:version', version)
+    return version
+
+
+def cached(namespace, key, loader, ttl=None):
+    """
+    Вернуть значение из кеша или вычислить его через loader() и сохранить.
+    Значение должно сериализоваться в JSON (для memcached) и не изменяться вызывающим кодом.
+    """
+    backend = _backend()
+    # Версии всех уровней пространства: 'timeline' и 'timeline:42'
+    parts = namespace.split(':')
+    versions = ':'.join(_namespace_version(backend, ':'.join(parts[:depth])) for depth in range(1, len(parts) + 1))
+    full_key = f'{namespace}:{versions}:{key}'
+    value = backend.get(full_key)
+    record_lookup(_stats_name(namespace), value is not None)
+    if value is None:
+        value = loader()
+        backend.set(full_key, value, ttl or current_app.config['CACHE_DEFAULT_TTL'])
+    return value
+
+
+def invalidate(*namespaces):
+    """Сбросить все записи пространств имен (и вложенных в них), сменив их версию"""
+    backend = _backend()
+    for namespace in namespaces:
+        backend.delete(f'{namespace}:version')
+
+
+def invalidate_on_commit(*namespaces):
+    """
+    Сбросить пространства имен после фиксации текущей транзакции сессии. Нужен для
+    массовых изменений через Core (insert/update/delete), которые не отслеживаются сессией.
+    """
+    db.session.info.setdefault('cache_invalidations', set()).update(namespaces)
+
+
+def cache_stats():
+    """Попадания, промахи и доля попаданий по пространствам имен для мониторинга"""
+    with _stats_lock:
+        stats = {}
+        for (name, kind), count in _stats.items():
+            stats.setdefault(name, {'hits': 0, 'misses': 0})[kind] = count
+    for counts in stats.values():
+        lookups = counts['hits'] + counts['misses']
+        counts['hit_rate'] = round(counts['hits'] / lookups, 3) if lookups else None
+    return stats
+
+
+def _touched_namespaces(session):
+    """Пространства имен, затронутые изменениями текущего flush"""
+    namespaces = set()
+    for obj in list(session.new) + list(session.dirty) + list(session.deleted):
+        if isinstance(obj, GrowthPhase):
+            namespaces.update(('growth_phases', 'timeline'))
+        elif isinstance(obj, Plant) and obj.id is not None:
+            namespaces.add(f'timeline:{obj.id}')
+        elif isinstance(obj, TimelineEvent) and obj.plant_id is not None:
+            namespaces.add(f'timeline:{obj.plant_id}')
+    return namespaces
+
+
+@event.listens_for(Session, 'after_flush')
+def _collect_invalidations(session, flush_context):
+    session.info.setdefault('cache_invalidations', set()).update(_touched_namespaces(session))
+
+
+@event.listens_for(Session, 'after_commit')
+def _apply_invalidations(session):
+    namespaces = session.info.pop('cache_invalidations', None)
+    # Вне приложения (скрипты без init_cache) сбрасывать нечего
+    if namespaces and has_app_context() and 'cache' in current_app.extensions:
+        invalidate(*namespaces)
+
+
+@event.listens_for(Session, 'after_soft_rollback')
+def _discard_invalidations(session, previous_transaction):
+    if not session.in_transaction():
+        session.info.pop('cache_invalidations', None)
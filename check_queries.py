@@ -0,0 +1,157 @@
+#!/usr/bin/env python3
+"""
+Проверка количества SQL-запросов на маршрут.
+
+Скрипт заполняет временную базу SQLite данными двух размеров, выполняет каждый
+маршрут через тестовый клиент Flask и сравнивает количество SQL-запросов.
+Если количество растет вместе с числом строк (N+1) или превышает бюджет
+маршрута, скрипт завершается с ненулевым кодом.
+
+Запуск: python check_queries.py
+"""
+import os
+import sys
+from contextlib import contextmanager
+from datetime import date, timedelta
+
+from sqlalchemy import event
+
+# Бюджет SQL-запросов на один запрос к маршруту
+QUERY_BUDGETS = {
+    '/': 3,
+    '/plants': 1,
+    '/plants?location={location_id}': 1,
+    '/archive': 1,
+    '/locations': 1,
+    '/location/{location_id}': 2,
+    '/plant/{plant_id}': 4,
+    '/api/timeline/{plant_id}': 3,
+    '/api/growth_phases': 1,
+    '/search?q=plant': 4,
+    '/api/search?q=event': 3,
+}
+
+SMALL_SCALE = 2
+LARGE_SCALE = 20
+
+
+@contextmanager
+def count_queries(engine):
+    """Собрать SQL-запросы (текст и параметры), выполненные движком внутри блока"""
+    statements = []
+
+    def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        statements.append((statement, parameters))
+
+    event.listen(engine, 'before_cursor_execute', before_cursor_execute)
+    try:
+        yield statements
+    finally:
+        event.remove(engine, 'before_cursor_execute', before_cursor_execute)
+
+
+def seed_data(db, scale, other_users=0):
+    """
+    Заполнить базу: scale локаций, scale растений на локацию, scale событий на растение.
+    Данные создаются для пользователя по умолчанию и для other_users дополнительных пользователей.
+    Возвращает идентификаторы первой локации и первого растения пользователя по умолчанию.
+    """
+    from models import User, Location, Plant, GrowthPhase, TimelineEvent, EventPhoto
+    from identity import invalidate_user_cache
+    from summary import rebuild_summary
+
+    phases = GrowthPhase.query.order_by(GrowthPhase.phase_order).all()
+    event_types = ['growth_phase', 'fertilization', 'watering', 'note']
+    start = date(2024, 1, 1)
+
+    ids = {}
+    for user_index in range(other_users + 1):
+        username = 'default' if user_index == 0 else f'user{user_index}'
+        user = User(username=username, email=f'{username}@example.com', password_hash='temp_password_hash')
+        db.session.add(user)
+        db.session.flush()
+
+        for location_index in range(scale):
+            location = Location(user_id=user.id, name=f'Location {location_index}')
+            db.session.add(location)
+            db.session.flush()
+            ids.setdefault('location_id', location.id)
+
+            for plant_index in range(scale):
+                plant = Plant(
+                    user_id=user.id,
+                    location_id=location.id,
+                    name=f'Plant {location_index}-{plant_index}',
+                    archived=plant_index % 2 == 1
+                )
+                db.session.add(plant)
+                db.session.flush()
+                ids.setdefault('plant_id', plant.id)
+
+                for event_index in range(scale):
+                    event_type = event_types[event_index % len(event_types)]
+                    timeline_event = TimelineEvent(
+                        plant_id=plant.id,
+                        event_type=event_type,
+                        event_date=start + timedelta(days=event_index),
+                        title=f'Event {event_index}',
+                        phase_id=phases[event_index % len(phases)].id if event_type == 'growth_phase' else None
+                    )
+                    timeline_event.photos = [EventPhoto(filename=f'photos/events/{event_index}.jpg')]
+                    db.session.add(timeline_event)
+
+        db.session.flush()
+        rebuild_summary(db.session, user.id)
+        db.session.commit()
+    # Пользователи созданы заново - id из предыдущей базы в кеше процесса устарели
+    invalidate_user_cache()
+    return ids
+
+
+def measure(scale):
+    """Вернуть количество SQL-запросов для каждого маршрута при заданном размере данных"""
+    os.environ['DATABASE_URL'] = 'sqlite://'
+    from app import create_app
+    from init_db import init_database
+    from models import db
+
+    app = create_app()
+    results = {}
+    with app.app_context():
+        init_database()
+        ids = seed_data(db, scale)
+        client = app.test_client()
+        # Прогрев кеша процесса (id текущего пользователя): измеряется установившийся режим
+        client.get('/')
+        for route in QUERY_BUDGETS:
+            url = route.format(**ids)
+            with count_queries(db.engine) as statements:
+                response = client.get(url)
+            if response.status_code != 200:
+                raise RuntimeError(f'{url} returned {response.status_code}')
+            results[route] = len(statements)
+        db.session.remove()
+        db.drop_all()
+    return results
+
+
+def main():
+    small = measure(SMALL_SCALE)
+    large = measure(LARGE_SCALE)
+
+    failures = []
+    for route, budget in QUERY_BUDGETS.items():
+        print(f'{route:40} {small[route]:>3} -> {large[route]:>3} (budget {budget})')
+        if large[route] > small[route]:
+            failures.append(f'{route}: query count grows with rows ({small[route]} -> {large[route]})')
+        if large[route] > budget:
+            failures.append(f'{route}: {large[route]} queries exceeds budget of {budget}')
+
+    if failures:
+        print('\n'.join(failures))
+        sys.exit(1)
+    print('All routes are within their query budgets')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,322 @@
+#!/usr/bin/env python3
+"""
+Холодное хранение хронологий архивных растений.
+
+При архивировании события растения вместе с фото событий переносятся из
+горячих таблиц timeline_events и event_photos в одну строку archived_timelines:
+сжатый zlib JSON всех событий и краткая сводка (число событий и фото, диапазон
+дат, счетчики по типам, продолжительности завершенных этапов роста). Горячие
+таблицы и их индексы содержат только события активных растений. Восстановление
+вставляет события обратно с новыми id и удаляет строку архива.
+
+Ссылки на файлы фото переходят в архив вместе со строками, поэтому счетчики
+photo_files не меняются. Счетчики событий в сводке дашборда относятся только
+к горячим событиям: перенос их уменьшает, восстановление увеличивает.
+Хронология архивного растения читается из архива целиком (страница растения,
+API хронологии, выгрузка, статистика этапов); поиск по событиям архива не ведется.
+
+Для баз, где архивные растения с событиями в горячих таблицах уже есть:
+python cold_storage.py
+"""
+import json
+import zlib
+from collections import Counter
+from datetime import date, datetime
+
+from sqlalchemy import delete, select
+from sqlalchemy.orm import joinedload, undefer
+from sqlalchemy.orm.attributes import set_committed_value
+
+from bulk_import import allocate_ids, copy_rows
+from cache import invalidate_on_commit
+from models import db, ArchivedTimeline, EventPhoto, GrowthPhase, Plant, TimelineEvent
+from pagination import decode_cursor, encode_cursor
+from summary import adjust_summary, event_deltas
+
+EVENT_FIELDS = ('id', 'event_type', 'event_date', 'title', 'description', 'phase_id', 'fertilization_type',
+                'fertilization_amount', 'photo_filename', 'created_at', 'updated_at')
+PHOTO_FIELDS = ('id', 'filename', 'created_at', 'updated_at')
+DATE_FIELDS = {'event_date': date, 'created_at': datetime, 'updated_at': datetime}
+
+# Растений в одной порции переноса: события растений порции держатся в памяти
+ARCHIVE_BATCH_SIZE = 100
+COMPRESSION_LEVEL = 6
+
+
+def _json_row(fields, values):
+    return [value.isoformat() if isinstance(value, (date, datetime)) else value
+            for value in (values[field] for field in fields)]
+
+
+def _parse_row(fields, row):
+    values = dict(zip(fields, row))
+    for field, python_type in DATE_FIELDS.items():
+        if values.get(field):
+            values[field] = python_type.fromisoformat(values[field])
+    return values
+
+
+def pack_timeline(events):
+    """
+    Сжать события (словари полей EVENT_FIELDS с фото в ключе 'photos'). Фото хранятся
+    внутри своих событий, поэтому id событий в архиве ни на что не ссылаются.
+    """
+    rows = [_json_row(EVENT_FIELDS, event) + [[_json_row(PHOTO_FIELDS, photo) for photo in event['photos']]]
+            for event in events]
+    return zlib.compress(json.dumps(rows, ensure_ascii=False, separators=(',', ':')).encode('utf-8'),
+                         COMPRESSION_LEVEL)
+
+
+def unpack_timeline(payload):
+    """События архива как словари с исходными типами значений, отсортированные по (дата, id)"""
+    events = []
+    for row in json.loads(zlib.decompress(payload)):
+        event = _parse_row(EVENT_FIELDS, row[:-1])
+        event['photos'] = [_parse_row(PHOTO_FIELDS, photo) for photo in row[-1]]
+        events.append(event)
+    return events
+
+
+def timeline_summary(events):
+    """Колонки сводки ArchivedTimeline по событиям, отсортированным по (дата, id)"""
+    phases = [event for event in events if event['event_type'] == 'growth_phase']
+    return {
+        'event_count': len(events),
+        'photo_count': sum(len(event['photos']) for event in events),
+        'first_event_date': events[0]['event_date'] if events else None,
+        'last_event_date': events[-1]['event_date'] if events else None,
+        'event_type_counts': dict(Counter(event['event_type'] for event in events)),
+        # Этап завершен, если после него есть следующий - как completed в phase_durations.py
+        'phase_durations': [[phase['phase_id'], (following['event_date'] - phase['event_date']).days]
+                            for phase, following in zip(phases, phases[1:])],
+    }
+
+
+def _hot_events(plant_ids):
+    """События растений из горячих таблиц с фото: {plant_id: [событие, ...]}"""
+    photos = {}
+    for row in db.session.execute(
+            select(EventPhoto.event_id, *(getattr(EventPhoto, field) for field in PHOTO_FIELDS))
+            .join(TimelineEvent, TimelineEvent.id == EventPhoto.event_id)
+            .where(TimelineEvent.plant_id.in_(plant_ids))
+            .order_by(EventPhoto.id)):
+        photos.setdefault(row.event_id, []).append(dict(zip(PHOTO_FIELDS, row[1:])))
+
+    events = {}
+    for row in db.session.execute(
+            select(TimelineEvent.plant_id, *(getattr(TimelineEvent, field) for field in EVENT_FIELDS))
+            .where(TimelineEvent.plant_id.in_(plant_ids))):
+        event = dict(zip(EVENT_FIELDS, row[1:]), photos=photos.get(row.id, []))
+        events.setdefault(row.plant_id, []).append(event)
+    return events
+
+
+def _counter_deltas(event_types, sign):
+    deltas = Counter()
+    for event_type, count in Counter(event_types).items():
+        deltas.update(event_deltas(event_type, sign * count))
+    return deltas
+
+
+def archive_timelines(user_id, plant_ids):
+    """
+    Перенести события растений пользователя в холодное хранение в текущей транзакции.
+    События, добавленные к уже архивному растению, дописываются к его архиву.
+    Возвращает количество перенесенных событий.
+    """
+    moved = []
+    for offset in range(0, len(plant_ids), ARCHIVE_BATCH_SIZE):
+        events_by_plant = _hot_events(plant_ids[offset:offset + ARCHIVE_BATCH_SIZE])
+        if not events_by_plant:
+            continue
+        existing = {
+            archived.plant_id: archived for archived in ArchivedTimeline.query.options(
+                undefer(ArchivedTimeline.payload)).filter(ArchivedTimeline.plant_id.in_(list(events_by_plant)))
+        }
+        for plant_id, events in events_by_plant.items():
+            moved.extend(event['event_type'] for event in events)
+            archived = existing.get(plant_id)
+            if archived is None:
+                archived = ArchivedTimeline(plant_id=plant_id)
+                db.session.add(archived)
+            else:
+                events = unpack_timeline(archived.payload) + events
+            events.sort(key=lambda event: (event['event_date'], event['id']))
+            archived.payload = pack_timeline(events)
+            for column, value in timeline_summary(events).items():
+                setattr(archived, column, value)
+
+        # Фото событий удаляет каскад (или триггер на секционированной таблице)
+        db.session.execute(
+            delete(TimelineEvent).where(TimelineEvent.plant_id.in_(list(events_by_plant))),
+            execution_options={'synchronize_session': False}
+        )
+        invalidate_on_commit(*(f'timeline:{plant_id}' for plant_id in events_by_plant))
+
+    if moved:
+        adjust_summary(user_id, **_counter_deltas(moved, -1))
+    return len(moved)
+
+
+def restore_timelines(user_id, plant_ids):
+    """Вернуть события растений пользователя из холодного хранения в горячие таблицы; возвращает их число"""
+    event_columns = ('id', 'plant_id') + EVENT_FIELDS[1:]
+    restored = []
+    for offset in range(0, len(plant_ids), ARCHIVE_BATCH_SIZE):
+        batch = plant_ids[offset:offset + ARCHIVE_BATCH_SIZE]
+        archives = db.session.execute(
+            select(ArchivedTimeline.plant_id, ArchivedTimeline.payload).where(ArchivedTimeline.plant_id.in_(batch))
+        ).all()
+        if not archives:
+            continue
+        # Удаление строк архива - первая запись порции: на SQLite она берет блокировку,
+        # под которой allocate_ids выделяет id
+        db.session.execute(
+            delete(ArchivedTimeline).where(ArchivedTimeline.plant_id.in_([row.plant_id for row in archives])),
+            execution_options={'synchronize_session': False}
+        )
+        for plant_id, payload in archives:
+            events = unpack_timeline(payload)
+            event_rows, photo_rows = [], []
+            for event_id, event in zip(allocate_ids(TimelineEvent.__table__, len(events)), events):
+                event_rows.append((event_id, plant_id, *(event[field] for field in EVENT_FIELDS[1:])))
+                photo_rows.extend((event_id, photo['filename'], photo['created_at'], photo['updated_at'])
+                                  for photo in event['photos'])
+            copy_rows(TimelineEvent.__table__, event_columns, event_rows)
+            copy_rows(EventPhoto.__table__, ('event_id', 'filename', 'created_at', 'updated_at'), photo_rows)
+            restored.extend(event['event_type'] for event in events)
+        invalidate_on_commit(*(f'timeline:{row.plant_id}' for row in archives))
+
+    if restored:
+        adjust_summary(user_id, **_counter_deltas(restored, 1))
+    return len(restored)
+
+
+def archived_photo_filenames(plant_ids):
+    """Файлы фото событий в архивах растений (для освобождения при удалении растений)"""
+    filenames = []
+    for payload in db.session.execute(
+            select(ArchivedTimeline.payload).where(ArchivedTimeline.plant_id.in_(plant_ids))).scalars():
+        for event in unpack_timeline(payload):
+            filenames.append(event['photo_filename'])
+            filenames.extend(photo['filename'] for photo in event['photos'])
+    return [filename for filename in filenames if filename]
+
+
+def archived_events(plant_id):
+    """
+    Хронология архивного растения для просмотра от старых событий к новым: события архива
+    и события, добавленные после архивирования. События архива - объекты TimelineEvent вне
+    сессии с атрибутом in_cold_storage, их нельзя удалить по id.
+    """
+    payload = db.session.execute(
+        select(ArchivedTimeline.payload).where(ArchivedTimeline.plant_id == plant_id)).scalar()
+    events = []
+    if payload:
+        phases = {phase.id: phase for phase in GrowthPhase.query}
+        for values in unpack_timeline(payload):
+            photos = [EventPhoto(event_id=values['id'], **photo) for photo in values.pop('photos')]
+            event = TimelineEvent(plant_id=plant_id, **values)
+            # Без событий ORM: объекты не попадают в сессию через backref этапа роста
+            set_committed_value(event, 'photos', photos)
+            set_committed_value(event, 'growth_phase', phases.get(event.phase_id))
+            event.in_cold_storage = True
+            events.append(event)
+    events.extend(TimelineEvent.query.options(
+        joinedload(TimelineEvent.photos), joinedload(TimelineEvent.growth_phase)).filter_by(plant_id=plant_id))
+    events.sort(key=lambda event: (event.event_date, event.id))
+    return events
+
+
+def paginate_events(events, cursor=None, limit=50, descending=False):
+    """Страница списка событий с тем же курсором (event_date, id), что и keyset_paginate"""
+    if descending:
+        events = events[::-1]
+    if cursor:
+        key = tuple(decode_cursor(cursor, [TimelineEvent.event_date, TimelineEvent.id]))
+        events = [event for event in events
+                  if ((event.event_date, event.id) < key if descending else (event.event_date, event.id) > key)]
+    if len(events) <= limit:
+        return events, None
+    events = events[:limit]
+    return events, encode_cursor([events[-1].event_date, events[-1].id])
+
+
+def events_growth_timeline(events, today):
+    """Этапы роста по списку событий от последнего к первому, как plant_growth_timeline()"""
+    phases = [event for event in events if event.event_type == 'growth_phase']
+    intervals = []
+    for index, event in enumerate(phases):
+        next_date = phases[index + 1].event_date if index + 1 < len(phases) else None
+        end_date = next_date or today
+        intervals.append({
+            'id': event.id,
+            'plant_id': event.plant_id,
+            'phase_id': event.phase_id,
+            'phase_name': event.growth_phase.name if event.growth_phase else None,
+            'description': event.description,
+            'start_date': event.event_date,
+            'end_date': end_date,
+            'duration_days': (end_date - event.event_date).days,
+            'completed': next_date is not None,
+        })
+    return intervals[::-1]
+
+
+def archived_export_rows(user_id, dataset):
+    """Строки выгрузки events / event_photos из архивов пользователя, порциями по растению"""
+    phase_names = dict(db.session.execute(select(GrowthPhase.id, GrowthPhase.name)).all())
+    archives = db.session.execute(
+        select(ArchivedTimeline.plant_id, ArchivedTimeline.payload)
+        .join(Plant, Plant.id == ArchivedTimeline.plant_id)
+        .where(Plant.user_id == user_id)
+        .order_by(ArchivedTimeline.plant_id),
+        execution_options={'stream_results': True, 'yield_per': 1}
+    )
+    for plant_id, payload in archives:
+        events = unpack_timeline(payload)
+        if dataset == 'events':
+            yield [(event['id'], plant_id, event['event_type'], event['event_date'], event['title'],
+                    event['description'], phase_names.get(event['phase_id']), event['fertilization_type'],
+                    event['fertilization_amount'], event['photo_filename'], event['created_at'],
+                    event['updated_at']) for event in events]
+        else:
+            yield [(photo['id'], event['id'], photo['filename'], photo['created_at'])
+                   for event in events for photo in event['photos']]
+
+
+def archived_phase_durations(user_id):
+    """Завершенные этапы роста из архивов пользователя: [(вид, id этапа, дни), ...]"""
+    rows = db.session.execute(
+        select(Plant.species, ArchivedTimeline.phase_durations)
+        .join(Plant, Plant.id == ArchivedTimeline.plant_id)
+        .where(Plant.user_id == user_id)
+    )
+    return [(species or '', phase_id, days) for species, durations in rows for phase_id, days in durations]
+
+
+def archive_existing():
+    """Перенести в холодное хранение события всех архивных растений, оставшиеся в горячих таблицах"""
+    plants = db.session.execute(
+        select(Plant.user_id, Plant.id)
+        .where(Plant.archived.is_(True), select(TimelineEvent.id).where(TimelineEvent.plant_id == Plant.id).exists())
+        .order_by(Plant.user_id, Plant.id)
+    ).all()
+    plant_ids = {}
+    for user_id, plant_id in plants:
+        plant_ids.setdefault(user_id, []).append(plant_id)
+    moved = 0
+    for user_id, ids in plant_ids.items():
+        for offset in range(0, len(ids), ARCHIVE_BATCH_SIZE):
+            moved += archive_timelines(user_id, ids[offset:offset + ARCHIVE_BATCH_SIZE])
+            db.session.commit()
+    return len(plants), moved
+
+
+if __name__ == "__main__":
+    # При прямом запуске нужно создать контекст приложения
+    from app import create_app
+    app = create_app()
+    with app.app_context():
+        plant_count, event_count = archive_existing()
+        print(f"Moved {event_count} events of {plant_count} archived plants to cold storage")
@@ -0,0 +1,57 @@
+"""
+Условные GET-запросы (ETag / Last-Modified) для страницы и API хронологии растения.
+
+Валидаторы строятся одним запросом по индексам: updated_at растения и его
+локации, количество событий и максимальный updated_at событий. Добавление,
+изменение и удаление событий, как и изменение растения, меняют ETag. Если
+клиент прислал совпадающий If-None-Match (или If-Modified-Since не старше
+Last-Modified), маршрут отвечает 304, не загружая события и не рендеря шаблон.
+"""
+import hashlib
+from datetime import datetime
+
+from flask import abort, current_app, request
+from sqlalchemy import func, select
+from werkzeug.http import is_resource_modified
+
+from models import db, Location, Plant, TimelineEvent
+
+_EPOCH = datetime(1970, 1, 1)
+
+
+def plant_validators(plant_id, *extra):
+    """
+    (ETag, Last-Modified, количество событий) хронологии растения; 404, если растения нет.
+    extra - дополнительные значения, от которых зависит ответ (например, текущая дата).
+    """
+    event_count = select(func.count(TimelineEvent.id)).where(
+        TimelineEvent.plant_id == Plant.id).scalar_subquery()
+    events_updated_at = select(func.max(TimelineEvent.updated_at)).where(
+        TimelineEvent.plant_id == Plant.id).scalar_subquery()
+    row = db.session.execute(
+        select(Plant.updated_at, Location.updated_at, event_count, events_updated_at)
+        .outerjoin(Location, Location.id == Plant.location_id)
+        .where(Plant.id == plant_id)
+    ).first()
+    if row is None:
+        abort(404)
+
+    plant_updated_at, location_updated_at, count, events_updated_at = row
+    last_modified = max(value or _EPOCH for value in (plant_updated_at, location_updated_at, events_updated_at))
+    raw = ':'.join(str(value) for value in (plant_id, *row, *extra))
+    return hashlib.sha1(raw.encode('utf-8')).hexdigest()[:20], last_modified, count
+
+
+def not_modified(etag, last_modified):
+    """Ответ 304, если у клиента актуальная версия, иначе None"""
+    if is_resource_modified(request.environ, etag=etag, last_modified=last_modified):
+        return None
+    return set_validators(current_app.response_class(status=304), etag, last_modified)
+
+
+def set_validators(response, etag, last_modified):
+    """Добавить валидаторы к ответу; no-cache заставляет клиента перепроверять их при каждом запросе"""
+    response.set_etag(etag)
+    response.last_modified = last_modified
+    response.cache_control.no_cache = True
+    return response
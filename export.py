@@ -0,0 +1,136 @@
+#!/usr/bin/env python3
+"""
+Потоковая выгрузка данных пользователя в NDJSON или CSV, сжатая gzip на лету.
+
+Строки читаются серверным курсором (stream_results + yield_per) порциями по
+EXPORT_CHUNK_SIZE и сразу сериализуются и сжимаются, поэтому потребление памяти
+не зависит от объема данных. Выбираются только колонки (без ORM-объектов),
+чтобы identity map сессии не разрастался.
+
+Маршрут: /export/<набор>.<формат>, например /export/events.ndjson
+Командная строка: python export.py <набор> <формат> [файл.gz]
+(без имени файла результат пишется в stdout)
+"""
+import csv
+import io
+import json
+import sys
+import zlib
+from datetime import date, datetime
+from itertools import chain
+
+from sqlalchemy import select
+
+from cold_storage import archived_export_rows
+from models import db, EventPhoto, GrowthPhase, Location, Plant, TimelineEvent
+
+EXPORT_CHUNK_SIZE = 1000
+DATASETS = ('locations', 'plants', 'events', 'event_photos')
+FORMATS = ('ndjson', 'csv')
+
+
+def _datasets(user_id):
+    """Запросы наборов данных пользователя; порядок колонок задает заголовок CSV"""
+    return {
+        'locations': select(
+            Location.id, Location.name, Location.description, Location.lighting, Location.substrate,
+            Location.photo_filename, Location.created_at, Location.updated_at,
+        ).where(Location.user_id == user_id).order_by(Location.id),
+        'plants': select(
+            Plant.id, Plant.name, Plant.species, Plant.location_id, Location.name.label('location_name'),
+            Plant.planted_date, Plant.notes, Plant.photo_filename, Plant.archived,
+            Plant.created_at, Plant.updated_at,
+        ).outerjoin(Location, Location.id == Plant.location_id)
+        .where(Plant.user_id == user_id).order_by(Plant.id),
+        'events': select(
+            TimelineEvent.id, TimelineEvent.plant_id, TimelineEvent.event_type, TimelineEvent.event_date,
+            TimelineEvent.title, TimelineEvent.description, GrowthPhase.name.label('phase_name'),
+            TimelineEvent.fertilization_type, TimelineEvent.fertilization_amount, TimelineEvent.photo_filename,
+            TimelineEvent.created_at, TimelineEvent.updated_at,
+        ).join(Plant, Plant.id == TimelineEvent.plant_id)
+        .outerjoin(GrowthPhase, GrowthPhase.id == TimelineEvent.phase_id)
+        .where(Plant.user_id == user_id).order_by(TimelineEvent.id),
+        'event_photos': select(
+            EventPhoto.id, EventPhoto.event_id, EventPhoto.filename, EventPhoto.created_at,
+        ).join(TimelineEvent, TimelineEvent.id == EventPhoto.event_id)
+        .join(Plant, Plant.id == TimelineEvent.plant_id)
+        .where(Plant.user_id == user_id).order_by(EventPhoto.id),
+    }
+
+
+def _json_value(value):
+    return value.isoformat() if isinstance(value, (date, datetime)) else value
+
+
+def _ndjson_chunks(columns, partitions):
+    for rows in partitions:
+        yield ''.join(
+            json.dumps({column: _json_value(value) for column, value in zip(columns, row)}, ensure_ascii=False) + '\n'
+            for row in rows
+        )
+
+
+def _csv_chunks(columns, partitions):
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(columns)
+    for rows in partitions:
+        writer.writerows([_json_value(value) for value in row] for row in rows)
+        yield buffer.getvalue()
+        buffer.seek(0)
+        buffer.truncate()
+    # Заголовок без строк, если набор пуст
+    if buffer.tell():
+        yield buffer.getvalue()
+
+
+def export_rows(user_id, dataset, fmt):
+    """Генератор текстовых фрагментов выгрузки (без сжатия)"""
+    statement = _datasets(user_id)[dataset]
+    result = db.session.execute(
+        statement, execution_options={'stream_results': True, 'yield_per': EXPORT_CHUNK_SIZE})
+    columns = list(result.keys())
+    chunks = _ndjson_chunks if fmt == 'ndjson' else _csv_chunks
+    partitions = result.partitions()
+    if dataset in ('events', 'event_photos'):
+        # События архивных растений хранятся сжатыми в archived_timelines и идут после горячих
+        partitions = chain(partitions, archived_export_rows(user_id, dataset))
+    try:
+        yield from chunks(columns, partitions)
+    finally:
+        result.close()
+
+
+def gzip_stream(chunks):
+    """Сжать поток текстовых фрагментов в gzip, не накапливая его в памяти"""
+    compressor = zlib.compressobj(6, zlib.DEFLATED, zlib.MAX_WBITS | 16)
+    for chunk in chunks:
+        data = compressor.compress(chunk.encode('utf-8'))
+        if data:
+            yield data
+    yield compressor.flush()
+
+
+def export_gzip(user_id, dataset, fmt):
+    """Сжатая gzip выгрузка набора данных пользователя"""
+    return gzip_stream(export_rows(user_id, dataset, fmt))
+
+
+if __name__ == "__main__":
+    # При прямом запуске нужно создать контекст приложения
+    if len(sys.argv) < 3 or sys.argv[1] not in DATASETS or sys.argv[2] not in FORMATS:
+        print(f"Usage: python export.py {{{','.join(DATASETS)}}} {{{','.join(FORMATS)}}} [output.gz]")
+        sys.exit(2)
+
+    from app import create_app
+    from identity import current_user_id
+    app = create_app()
+    with app.app_context():
+        user_id = current_user_id()
+        output = open(sys.argv[3], 'wb') if len(sys.argv) > 3 else sys.stdout.buffer
+        try:
+            for data in export_gzip(user_id, sys.argv[1], sys.argv[2]):
+                output.write(data)
+        finally:
+            if output is not sys.stdout.buffer:
+                output.close()
@@ -0,0 +1,63 @@
+"""
+Кеш отрендеренных фрагментов шаблонов: карточек растений и локаций и записей хронологии.
+
+Ключ фрагмента - его вид, id сущности, ее updated_at и все остальное, от чего зависит
+разметка (например, updated_at связанной локации у карточки растения):
+
+    {% call fragment('plant', plant.id, plant.updated_at, ...) %} ...разметка... {% endcall %}
+
+Маршруты, изменяющие растения, локации и события, обновляют updated_at, поэтому после
+изменения фрагмент рендерится под новым ключом, а старый больше не запрашивается и
+вытесняется по LRU. Явный сброс не нужен, и кеш в памяти каждого процесса gunicorn не
+отдает устаревшую разметку. Размер кеша ограничен FRAGMENT_CACHE_MAX_ENTRIES (0 - выключен),
+попадания и промахи по видам фрагментов видны в cache_stats() (/healthz).
+
+Фрагменты с фото, для которых фоновая задача еще не создала миниатюры, хранятся
+не дольше FRAGMENT_INCOMPLETE_TTL секунд: иначе srcset не появился бы до следующего
+изменения сущности.
+"""
+from flask import current_app, g, has_app_context
+from markupsafe import Markup
+
+from cache import MemoryCache, record_lookup
+
+
+def init_fragments(app):
+    """Создать кеш фрагментов и зарегистрировать fragment() в окружении Jinja2"""
+    cache = MemoryCache(app.config['FRAGMENT_CACHE_MAX_ENTRIES'])
+    app.extensions['fragment_cache'] = cache
+    app.jinja_env.globals['fragment'] = fragment
+    return cache
+
+
+def fragment_key(kind, *parts):
+    """'plant', 42, datetime(...) -> 'plant:42:2024-05-01T10:00:00.123456'"""
+    return ':'.join([kind, *(part.isoformat() if hasattr(part, 'isoformat') else str(part) for part in parts)])
+
+
+def mark_fragment_incomplete():
+    """Разметка рендерящегося фрагмента неокончательная: хранить ее только короткое время"""
+    if has_app_context():
+        g.fragment_incomplete = True
+
+
+def fragment(kind, *parts, caller):
+    """Вернуть разметку фрагмента из кеша или отрендерить тело блока {% call %} и сохранить"""
+    if not current_app.config['FRAGMENT_CACHE_MAX_ENTRIES']:
+        return caller()
+    cache = current_app.extensions['fragment_cache']
+    key = fragment_key(kind, *parts)
+    html = cache.get(key)
+    record_lookup(f'fragment.{kind}', html is not None)
+    if html is None:
+        g.fragment_incomplete = False
+        html = caller()
+        ttl = current_app.config['FRAGMENT_INCOMPLETE_TTL'] if g.pop('fragment_incomplete', False) else None
+        cache.set(key, html, ttl)
+    return Markup(html)
+
+
+def fragment_cache_status():
+    """Заполненность кеша фрагментов процесса"""
+    cache = current_app.extensions['fragment_cache']
+    return {'entries': len(cache), 'max_entries': cache.max_entries}
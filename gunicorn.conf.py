@@ -0,0 +1,72 @@
+"""
+Конфигурация gunicorn для продакшн-запуска: python app.py остается только для разработки.
+
+    gunicorn -c gunicorn.conf.py app:app
+
+Приложение загружается в мастер-процессе до fork (preload_app), там же один раз
+выполняются ожидание базы данных и миграции. Воркеры получают готовое приложение
+и открывают собственные соединения с базой.
+"""
+import multiprocessing
+import os
+import shutil
+import tempfile
+
+bind = os.environ.get('GUNICORN_BIND', '0.0.0.0:5000')
+workers = int(os.environ.get('GUNICORN_WORKERS', multiprocessing.cpu_count() * 2 + 1))
+# При threads > 1 gunicorn использует воркеры gthread
+threads = int(os.environ.get('GUNICORN_THREADS', 4))
+timeout = int(os.environ.get('GUNICORN_TIMEOUT', 60))
+graceful_timeout = int(os.environ.get('GUNICORN_GRACEFUL_TIMEOUT', 30))
+keepalive = int(os.environ.get('GUNICORN_KEEPALIVE', 5))
+# Периодический перезапуск воркеров ограничивает рост памяти
+max_requests = int(os.environ.get('GUNICORN_MAX_REQUESTS', 1000))
+max_requests_jitter = int(os.environ.get('GUNICORN_MAX_REQUESTS_JITTER', 100))
+
+preload_app = True
+
+# Метрики всех воркеров суммируются через общий каталог (см. metrics.py); переменная
+# задается до загрузки приложения, чтобы ее увидел create_app()
+os.environ.setdefault('METRICS_DIR', os.path.join(tempfile.gettempdir(), 'plant-tracker-metrics'))
+accesslog = '-'
+errorlog = '-'
+
+
+def on_starting(server):
+    """Дождаться базы данных и применить миграции один раз в мастер-процессе"""
+    from app import app, wait_for_db
+    from init_db import init_database
+    from models import db
+
+    # Значения прошлого запуска мастера не должны попасть в новые счетчики
+    shutil.rmtree(os.environ['METRICS_DIR'], ignore_errors=True)
+    os.makedirs(os.environ['METRICS_DIR'], exist_ok=True)
+
+    wait_for_db(app)
+    with app.app_context():
+        init_database()
+        # Соединения мастера не должны достаться воркерам после fork
+        db.engine.dispose()
+
+
+def post_fork(server, worker):
+    """Сбросить унаследованный от мастера пул (не закрывая чужие соединения) и значения метрик"""
+    from app import app
+    from metrics import reset_metrics
+    from models import db
+
+    with app.app_context():
+        db.engine.dispose(close=False)
+    reset_metrics()
+
+
+def worker_exit(server, worker):
+    """Записать последние значения метрик воркера перед завершением"""
+    from metrics import flush_metrics
+    flush_metrics(force=True)
+
+
+def child_exit(server, worker):
+    """Перенести счетчики завершившегося воркера в общий итог (выполняется в мастере)"""
+    from metrics import collect_dead_process
+    collect_dead_process(worker.pid)
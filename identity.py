@@ -0,0 +1,64 @@
+"""
+Определение текущего пользователя.
+
+Пока в приложении нет аутентификации, все запросы выполняются от имени
+пользователя 'default'. Маршруты получают его id через current_user_id():
+значение вычисляется один раз за запрос и хранится в flask.g, а соответствие
+имени пользователя и id кешируется на уровне процесса, поэтому обычный запрос
+вообще не обращается к таблице users. При появлении аутентификации достаточно
+изменить _acting_username().
+"""
+from flask import g, has_app_context
+from sqlalchemy import select
+
+from models import db, User
+
+DEFAULT_USERNAME = 'default'
+
+# Кеш процесса: имя пользователя -> id. Заполняется только значениями, прочитанными
+# из базы (то есть зафиксированными), и сбрасывается invalidate_user_cache()
+_user_ids = {}
+
+
+def _acting_username():
+    """Имя пользователя, от имени которого выполняется запрос"""
+    return DEFAULT_USERNAME
+
+
+def current_user_id():
+    """id текущего пользователя или None, если пользователь еще не создан"""
+    if 'current_user_id' not in g:
+        username = _acting_username()
+        user_id = _user_ids.get(username)
+        if user_id is None:
+            user_id = db.session.execute(select(User.id).where(User.username == username)).scalar()
+            if user_id is not None:
+                _user_ids[username] = user_id
+        g.current_user_id = user_id
+    return g.current_user_id
+
+
+def get_or_create_current_user_id():
+    """id текущего пользователя; пользователь по умолчанию создается в текущей транзакции при отсутствии"""
+    user_id = current_user_id()
+    if user_id is None:
+        user = User(
+            username=_acting_username(),
+            email='default@example.com',
+            password_hash='temp_password_hash'
+        )
+        db.session.add(user)
+        db.session.flush()  # Получение ID пользователя без фиксации
+        # В кеш процесса id попадет при следующем чтении, после фиксации транзакции
+        user_id = g.current_user_id = user.id
+    return user_id
+
+
+def invalidate_user_cache(username=None):
+    """Сбросить кеш id для одного пользователя или целиком (после удаления или переименования)"""
+    if username is None:
+        _user_ids.clear()
+    else:
+        _user_ids.pop(username, None)
+    if has_app_context():
+        g.pop('current_user_id', None)
@@ -1,14 +1,21 @@
 #!/usr/bin/env python3
 
+from migrations import run_migrations
 from models import db, GrowthPhase, EventPhoto
+from partitions import maintain_partitions
 
 def init_database():
     """
     Инициализация базы данных с необходимыми таблицами и данными.
-    Создает все таблицы из моделей и добавляет данные по умолчанию при необходимости.
+    Применяет версионированные миграции схемы и добавляет данные по умолчанию при необходимости.
     """
-    # Create all tables defined in models
-    db.create_all()
+    # Apply pending schema migrations (see migrations.py)
+    run_migrations()
+
+    # Create upcoming timeline partitions (PostgreSQL with TIMELINE_PARTITIONING only)
+    created = maintain_partitions()
+    if created:
+        print(f"Created timeline partitions: {', '.join(created)}")
     
     # Add default growth phases if they don't exist
     existing_count = GrowthPhase.query.count()
@@ -0,0 +1,103 @@
+#!/usr/bin/env python3
+"""
+Очередь фоновых задач для работы с файлами фото.
+
+Маршруты только добавляют задачу в таблицу photo_jobs в той же транзакции,
+что и изменения данных, и сразу отвечают. Задачи выполняет отдельный
+процесс-обработчик (python worker.py), повторяя неудачные попытки с
+экспоненциальной задержкой. Обработчики должны быть идемпотентными:
+после сбоя обработчика задача может выполниться повторно.
+"""
+import time
+import traceback
+from datetime import datetime, timedelta
+
+from models import db, PhotoJob
+
+# Обработчики задач по типу, регистрируются декоратором job_handler
+JOB_HANDLERS = {}
+
+MAX_ATTEMPTS = 5
+# Задача в статусе running дольше этого времени считается брошенной упавшим обработчиком
+STALE_JOB_TIMEOUT = timedelta(minutes=10)
+
+
+def job_handler(kind):
+    """Зарегистрировать функцию как обработчик задач указанного типа"""
+    def decorator(func):
+        JOB_HANDLERS[kind] = func
+        return func
+    return decorator
+
+
+def enqueue_job(kind, **payload):
+    """Добавить задачу в текущую сессию; она станет видна обработчику после commit"""
+    job = PhotoJob(kind=kind, payload=payload)
+    db.session.add(job)
+    return job
+
+
+def claim_job():
+    """Захватить одну готовую к выполнению задачу (SKIP LOCKED на PostgreSQL)"""
+    now = datetime.utcnow()
+    job = db.session.execute(
+        db.select(PhotoJob)
+        .where(db.or_(
+            db.and_(PhotoJob.status == 'pending', PhotoJob.run_after <= now),
+            db.and_(PhotoJob.status == 'running', PhotoJob.locked_at < now - STALE_JOB_TIMEOUT)
+        ))
+        .order_by(PhotoJob.id)
+        .limit(1)
+        .with_for_update(skip_locked=True)
+    ).scalar()
+    if job:
+        job.status = 'running'
+        job.locked_at = now
+        job.attempts += 1
+    db.session.commit()
+    return job
+
+
+def run_job(job):
+    """Выполнить задачу: удалить при успехе, отложить или пометить failed при ошибке"""
+    try:
+        JOB_HANDLERS[job.kind](**job.payload)
+    except Exception:
+        db.session.rollback()
+        job.last_error = traceback.format_exc()
+        if job.attempts >= MAX_ATTEMPTS:
+            job.status = 'failed'
+        else:
+            job.status = 'pending'
+            job.run_after = datetime.utcnow() + timedelta(seconds=2 ** job.attempts)
+        print(f"Job {job.id} ({job.kind}) failed on attempt {job.attempts}")
+    else:
+        db.session.delete(job)
+    db.session.commit()
+
+
+def run_pending_jobs(limit=None):
+    """Выполнить готовые задачи, пока очередь не опустеет (или до limit задач)"""
+    processed = 0
+    while limit is None or processed < limit:
+        job = claim_job()
+        if not job:
+            break
+        run_job(job)
+        processed += 1
+    return processed
+
+
+def work(poll_interval=1.0):
+    """Бесконечный цикл обработчика"""
+    print("Photo job worker started")
+    while True:
+        if not run_pending_jobs():
+            time.sleep(poll_interval)
+
+
+if __name__ == "__main__":
+    # Запущенный как скрипт файл - модуль __main__ с отдельным пустым реестром JOB_HANDLERS,
+    # поэтому обработчик запускается через worker.py, который работает с модулем jobs
+    from worker import main
+    main()
@@ -0,0 +1,370 @@
+"""
+Метрики запросов, SQL и шаблонов в текстовом формате Prometheus (GET /metrics).
+
+Собираются:
+  - длительность, статусы и число одновременно выполняемых запросов по маршрутам;
+  - количество SQL-операторов и время в базе на запрос (хуки cursor_execute движка);
+  - время рендеринга шаблонов (сигналы Flask) и объем загруженных фото.
+
+Необязательный журнал медленных запросов (SLOW_REQUEST_MS > 0) пишет в лог
+приложения запросы дольше порога вместе с их SQL и временем каждого оператора.
+
+Значения хранятся в памяти процесса. Воркеры gunicorn слушают один порт, и
+запрос /metrics попадает в случайный воркер, поэтому при METRICS_DIR каждый
+процесс после запросов записывает свои значения в <METRICS_DIR>/<pid>.json
+(не чаще раза в METRICS_FLUSH_INTERVAL секунд), а /metrics суммирует файлы
+всех процессов. Счетчики завершившихся воркеров gunicorn переносит в общий
+итог (child_exit в gunicorn.conf.py), поэтому они не уменьшаются при
+перезапуске воркеров. Без METRICS_DIR (разработка, один процесс) отдаются
+значения текущего процесса.
+"""
+import fcntl
+import json
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+from flask import g, has_request_context, request
+from flask.signals import before_render_template, template_rendered
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+STATEMENT_BUCKETS = (1, 2, 3, 5, 8, 13, 21, 34, 55, 89)
+
+# Не больше стольких операторов SQL сохраняется для журнала медленных запросов
+SLOW_LOG_MAX_STATEMENTS = 50
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+
+
+def _format_labels(names, values, extra=()):
+    pairs = [f'{name}="{_escape(value)}"' for name, value in (*zip(names, values), *extra)]
+    return '{' + ','.join(pairs) + '}' if pairs else ''
+
+
+def _format_value(value):
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Metric:
+    """Семейство рядов с общим именем и набором меток"""
+    kind = 'untyped'
+
+    def __init__(self, name, documentation, labels=()):
+        self.name = name
+        self.documentation = documentation
+        self.labels = tuple(labels)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _copy(value):
+        return value
+
+    @staticmethod
+    def _add(total, value):
+        return total + value
+
+    def dump(self):
+        """Значения процесса в виде, пригодном для JSON: [[метки, значение], ...]"""
+        with self._lock:
+            return [[list(labels), self._copy(value)] for labels, value in self._values.items()]
+
+    def merge(self, values, dumped):
+        """Прибавить значения из dump() другого процесса к словарю values"""
+        for labels, value in dumped:
+            labels = tuple(labels)
+            values[labels] = self._add(values[labels], value) if labels in values else self._copy(value)
+
+    def _samples(self, values):
+        return [(self.name, labels, value) for labels, value in sorted(values.items())]
+
+    def render(self, values=None):
+        if values is None:
+            values = {}
+            self.merge(values, self.dump())
+        lines = [f'# HELP {self.name} {self.documentation}', f'# TYPE {self.name} {self.kind}']
+        for name, (labels, extra), value in self._samples(values):
+            lines.append(f'{name}{_format_labels(self.labels, labels, extra)} {_format_value(value)}')
+        return lines
+
+
+class Counter(Metric):
+    kind = 'counter'
+
+    def __init__(self, name, documentation, labels=()):
+        super().__init__(name, documentation, labels)
+        if not self.labels:
+            self._values[()] = 0
+
+    def inc(self, *labels, amount=1):
+        with self._lock:
+            self._values[labels] = self._values.get(labels, 0) + amount
+
+    def _samples(self, values):
+        return [(name, (labels, ()), value) for name, labels, value in super()._samples(values)]
+
+
+class Gauge(Counter):
+    kind = 'gauge'
+
+    def dec(self, *labels, amount=1):
+        self.inc(*labels, amount=-amount)
+
+
+class Histogram(Metric):
+    kind = 'histogram'
+
+    def __init__(self, name, documentation, labels=(), buckets=LATENCY_BUCKETS):
+        super().__init__(name, documentation, labels)
+        self.buckets = tuple(buckets)
+
+    @staticmethod
+    def _copy(value):
+        counts, total = value
+        return [list(counts), total]
+
+    @staticmethod
+    def _add(total, value):
+        return [[a + b for a, b in zip(total[0], value[0])], total[1] + value[1]]
+
+    def observe(self, *labels, value):
+        with self._lock:
+            counts, total = self._values.get(labels, ([0] * (len(self.buckets) + 1), 0.0))
+            for index, bound in enumerate(self.buckets):
+                if value <= bound:
+                    counts[index] += 1
+            counts[-1] += 1
+            self._values[labels] = (counts, total + value)
+
+    def _samples(self, values):
+        samples = []
+        for _, labels, (counts, total) in super()._samples(values):
+            for bound, count in zip((*self.buckets, '+Inf'), counts):
+                samples.append((f'{self.name}_bucket', (labels, (('le', bound),)), count))
+            samples.append((f'{self.name}_sum', (labels, ()), total))
+            samples.append((f'{self.name}_count', (labels, ()), counts[-1]))
+        return samples
+
+
+REQUESTS = Counter('http_requests_total', 'HTTP requests by endpoint and status code',
+                   ('method', 'endpoint', 'status'))
+REQUEST_DURATION = Histogram('http_request_duration_seconds', 'Time to build the response, by endpoint',
+                             ('method', 'endpoint'))
+IN_FLIGHT = Gauge('http_requests_in_flight', 'Requests being processed right now')
+DB_STATEMENTS = Counter('db_statements_total', 'SQL statements executed, inside and outside requests')
+DB_TIME = Counter('db_time_seconds_total', 'Time spent executing SQL statements')
+REQUEST_STATEMENTS = Histogram('http_request_db_statements', 'SQL statements per request, by endpoint',
+                               ('endpoint',), STATEMENT_BUCKETS)
+REQUEST_DB_TIME = Histogram('http_request_db_seconds', 'Time spent in the database per request, by endpoint',
+                            ('endpoint',))
+TEMPLATE_RENDER = Histogram('template_render_seconds', 'Jinja2 template render time, by template',
+                            ('template',))
+PHOTO_UPLOADS = Counter('photo_uploads_total', 'Photos received in uploads')
+PHOTO_UPLOAD_BYTES = Counter('photo_upload_bytes_total', 'Bytes of photos received in uploads')
+
+METRICS = (REQUESTS, REQUEST_DURATION, IN_FLIGHT, DB_STATEMENTS, DB_TIME, REQUEST_STATEMENTS, REQUEST_DB_TIME,
+           TEMPLATE_RENDER, PHOTO_UPLOADS, PHOTO_UPLOAD_BYTES)
+
+
+# Каталог общих для воркеров значений (METRICS_DIR) и время последней записи файла процесса
+_store = {'dir': None, 'flush_interval': 1.0, 'flushed_at': 0.0, 'timer': None}
+DEAD_FILE = 'dead.json'
+
+
+@contextmanager
+def _store_lock(exclusive):
+    with open(os.path.join(_store['dir'], '.lock'), 'a') as lock_file:
+        fcntl.flock(lock_file, fcntl.LOCK_EX if exclusive else fcntl.LOCK_SH)
+        try:
+            yield
+        finally:
+            fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+
+def _read(path):
+    try:
+        with open(path) as source:
+            return json.load(source)
+    except (FileNotFoundError, ValueError):
+        return {}
+
+
+def _write(path, data):
+    temp_path = f'{path}.{os.getpid()}.tmp'
+    with open(temp_path, 'w') as target:
+        json.dump(data, target)
+    os.replace(temp_path, path)
+
+
+def flush_metrics(force=False):
+    """
+    Записать значения процесса в METRICS_DIR (не чаще раза в METRICS_FLUSH_INTERVAL секунд).
+    Пропущенная из-за интервала запись откладывается таймером, чтобы значения последних
+    запросов простаивающего воркера тоже попали в файл.
+    """
+    if _store['dir'] is None:
+        return
+    now = time.monotonic()
+    wait = _store['flush_interval'] - (now - _store['flushed_at'])
+    if not force and wait > 0:
+        if _store['timer'] is None:
+            _store['timer'] = threading.Timer(wait, _deferred_flush)
+            _store['timer'].daemon = True
+            _store['timer'].start()
+        return
+    _store['flushed_at'] = now
+    _write(os.path.join(_store['dir'], f'{os.getpid()}.json'),
+           {metric.name: metric.dump() for metric in METRICS})
+
+
+def _deferred_flush():
+    _store['timer'] = None
+    flush_metrics(force=True)
+
+
+def reset_metrics():
+    """Обнулить значения процесса (воркеру после fork не нужны значения и таймер мастера)"""
+    _store.update(flushed_at=0.0, timer=None)
+    for metric in METRICS:
+        with metric._lock:
+            metric._values = {(): 0} if isinstance(metric, Counter) and not metric.labels else {}
+
+
+def collect_dead_process(pid):
+    """
+    Перенести счетчики и гистограммы завершившегося процесса в общий итог мертвых
+    процессов, чтобы они не уменьшались при перезапуске воркеров; gauge отбрасываются.
+    """
+    if _store['dir'] is None:
+        return
+    path = os.path.join(_store['dir'], f'{pid}.json')
+    with _store_lock(exclusive=True):
+        dumped = _read(path)
+        if dumped:
+            dead_path = os.path.join(_store['dir'], DEAD_FILE)
+            dead = _read(dead_path)
+            for metric in METRICS:
+                if metric.kind != 'gauge' and metric.name in dumped:
+                    values = {}
+                    metric.merge(values, dead.get(metric.name, []))
+                    metric.merge(values, dumped[metric.name])
+                    dead[metric.name] = [[list(labels), value] for labels, value in values.items()]
+            _write(dead_path, dead)
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+
+
+def render_metrics():
+    """
+    Все метрики в текстовом формате Prometheus 0.0.4: при METRICS_DIR - сумма по всем
+    процессам (живым и завершившимся), иначе только значения текущего процесса
+    """
+    if _store['dir'] is None:
+        lines = []
+        for metric in METRICS:
+            lines.extend(metric.render())
+        return '\n'.join(lines) + '\n'
+
+    flush_metrics(force=True)
+    with _store_lock(exclusive=False):
+        dumps = [_read(os.path.join(_store['dir'], name))
+                 for name in os.listdir(_store['dir']) if name.endswith('.json')]
+    lines = []
+    for metric in METRICS:
+        values = {}
+        for dumped in dumps:
+            metric.merge(values, dumped.get(metric.name, []))
+        lines.extend(metric.render(values))
+    return '\n'.join(lines) + '\n'
+
+
+def observe_photo_upload(size):
+    PHOTO_UPLOADS.inc()
+    PHOTO_UPLOAD_BYTES.inc(amount=size)
+
+
+def _endpoint():
+    return request.endpoint or 'unmatched'
+
+
+@event.listens_for(Engine, 'before_cursor_execute')
+def _statement_started(conn, cursor, statement, parameters, context, executemany):
+    # Время начала хранится в контексте выполнения оператора: у оператора с ошибкой
+    # after_cursor_execute не вызывается, и на соединении не остается лишних записей
+    context.metrics_started = time.perf_counter()
+
+
+@event.listens_for(Engine, 'after_cursor_execute')
+def _statement_finished(conn, cursor, statement, parameters, context, executemany):
+    elapsed = time.perf_counter() - context.metrics_started
+    DB_STATEMENTS.inc()
+    DB_TIME.inc(amount=elapsed)
+    if has_request_context() and 'metrics_started' in g:
+        g.metrics_statements += 1
+        g.metrics_db_time += elapsed
+        slow_log = g.metrics_slow_log
+        if slow_log is not None and len(slow_log) < SLOW_LOG_MAX_STATEMENTS:
+            slow_log.append((elapsed, statement))
+
+
+def _template_started(sender, template, context, **extra):
+    if has_request_context():
+        g.setdefault('metrics_templates', []).append(time.perf_counter())
+
+
+def _template_finished(sender, template, context, **extra):
+    if has_request_context() and g.get('metrics_templates'):
+        TEMPLATE_RENDER.observe(template.name or 'string', value=time.perf_counter() - g.metrics_templates.pop())
+
+
+def init_metrics(app):
+    """Подключить сбор метрик к приложению"""
+    slow_request_ms = app.config['SLOW_REQUEST_MS']
+    if app.config['METRICS_DIR']:
+        os.makedirs(app.config['METRICS_DIR'], exist_ok=True)
+        _store.update(dir=app.config['METRICS_DIR'], flush_interval=app.config['METRICS_FLUSH_INTERVAL'])
+
+    @app.before_request
+    def start_request_metrics():
+        IN_FLIGHT.inc()
+        g.metrics_started = time.perf_counter()
+        g.metrics_statements = 0
+        g.metrics_db_time = 0.0
+        # Текст SQL сохраняется, только если включен журнал медленных запросов
+        g.metrics_slow_log = [] if slow_request_ms else None
+
+    @app.after_request
+    def record_request_metrics(response):
+        if 'metrics_started' not in g:
+            return response
+        elapsed = time.perf_counter() - g.metrics_started
+        endpoint = _endpoint()
+        REQUESTS.inc(request.method, endpoint, response.status_code)
+        REQUEST_DURATION.observe(request.method, endpoint, value=elapsed)
+        REQUEST_STATEMENTS.observe(endpoint, value=g.metrics_statements)
+        REQUEST_DB_TIME.observe(endpoint, value=g.metrics_db_time)
+
+        if slow_request_ms and elapsed * 1000 >= slow_request_ms:
+            statements = ''.join(f'\n  [{duration * 1000:.1f} ms] {statement}'
+                                 for duration, statement in g.metrics_slow_log)
+            app.logger.warning(
+                'Slow request %s %s -> %s: %.1f ms, %d SQL statements in %.1f ms%s',
+                request.method, request.full_path.rstrip('?'), response.status_code, elapsed * 1000,
+                g.metrics_statements, g.metrics_db_time * 1000, statements)
+        return response
+
+    @app.teardown_request
+    def finish_request_metrics(exc):
+        if g.pop('metrics_started', None) is not None:
+            IN_FLIGHT.dec()
+            flush_metrics()
+
+    before_render_template.connect(_template_started, app)
+    template_rendered.connect(_template_finished, app)
@@ -0,0 +1,157 @@
+#!/usr/bin/env python3
+"""
+Версионированные миграции схемы базы данных.
+
+Каждая миграция - это функция, принимающая соединение SQLAlchemy, с
+уникальным номером версии. Примененные версии хранятся в таблице
+schema_version, поэтому каждая миграция выполняется ровно один раз.
+Миграции пишутся идемпотентно (checkfirst), чтобы их можно было применить
+и к базам, созданным ранее через db.create_all().
+"""
+from datetime import datetime
+
+from flask import current_app
+from sqlalchemy import text
+
+from models import db
+from partitions import is_partitioned, partition_timeline_events
+from search import create_search_index
+from summary import rebuild_summary
+
+# Произвольный ключ advisory-блокировки PostgreSQL, чтобы миграции не выполнялись параллельно
+MIGRATION_LOCK_KEY = 7_120_314
+
+
+def _tables(*names):
+    return [db.metadata.tables[name] for name in names]
+
+
+def _indexes(table_name, *index_names):
+    table = db.metadata.tables[table_name]
+    return [index for index in table.indexes if index.name in index_names]
+
+
+def create_baseline_schema(connection):
+    """Исходная схема, ранее создававшаяся через db.create_all()"""
+    db.metadata.create_all(connection, tables=_tables(
+        'users', 'locations', 'growth_phases', 'plants',
+        'timeline_events', 'event_photos', 'user_settings'
+    ))
+
+
+def add_hot_query_indexes(connection):
+    """Составные индексы для фильтров и сортировок основных маршрутов"""
+    indexes = (
+        _indexes('locations', 'ix_locations_user_id') +
+        _indexes('plants', 'ix_plants_user_id_archived_created_at', 'ix_plants_location_id') +
+        _indexes('timeline_events',
+                 'ix_timeline_events_plant_id_event_date',
+                 'ix_timeline_events_plant_id_event_type_event_date',
+                 'ix_timeline_events_event_date') +
+        _indexes('event_photos', 'ix_event_photos_event_id')
+    )
+    for index in indexes:
+        index.create(connection, checkfirst=True)
+
+
+def add_user_summaries(connection):
+    """Таблица сводки для дашборда, заполненная по существующим данным"""
+    db.metadata.create_all(connection, tables=_tables('user_summaries'))
+    for (user_id,) in connection.execute(text('SELECT id FROM users')).all():
+        rebuild_summary(connection, user_id)
+
+
+def add_photo_jobs(connection):
+    """Очередь фоновых задач для работы с файлами фото"""
+    db.metadata.create_all(connection, tables=_tables('photo_jobs'))
+
+
+def add_photo_files(connection):
+    """Счетчики ссылок на файлы фото, заполненные по всем колонкам с именами файлов"""
+    db.metadata.create_all(connection, tables=_tables('photo_files'))
+    connection.execute(text(
+        'INSERT INTO photo_files (filename, ref_count, created_at, updated_at) '
+        'SELECT filename, COUNT(*), :now, :now FROM ('
+        '  SELECT photo_filename AS filename FROM plants WHERE photo_filename IS NOT NULL'
+        '  UNION ALL SELECT photo_filename FROM locations WHERE photo_filename IS NOT NULL'
+        '  UNION ALL SELECT photo_filename FROM timeline_events WHERE photo_filename IS NOT NULL'
+        '  UNION ALL SELECT filename FROM event_photos'
+        ') AS refs GROUP BY filename'
+    ), {'now': datetime.utcnow()})
+
+
+def add_timeline_validator_index(connection):
+    """Индекс для ETag/Last-Modified хронологии: MAX(updated_at) событий растения"""
+    for index in _indexes('timeline_events', 'ix_timeline_events_plant_id_updated_at'):
+        index.create(connection, checkfirst=True)
+
+
+def add_import_progress(connection):
+    """Прогресс возобновляемого массового импорта"""
+    db.metadata.create_all(connection, tables=_tables('import_progress'))
+
+
+def add_search_index(connection):
+    """Полнотекстовый поиск: tsvector + GIN на PostgreSQL, FTS5 с триггерами на SQLite"""
+    create_search_index(connection)
+
+
+def add_timeline_partitioning(connection):
+    """Секционирование timeline_events по дате события, если включено TIMELINE_PARTITIONING (PostgreSQL)"""
+    interval = current_app.config['TIMELINE_PARTITIONING']
+    if connection.dialect.name == 'postgresql' and interval and not is_partitioned(connection):
+        partition_timeline_events(connection, interval, current_app.config['TIMELINE_PARTITIONS_AHEAD'])
+
+
+def add_archived_timelines(connection):
+    """Холодное хранение хронологий архивных растений (перенос существующих - python cold_storage.py)"""
+    db.metadata.create_all(connection, tables=_tables('archived_timelines'))
+
+
+# (версия, описание, функция миграции) - новые миграции добавляются только в конец
+MIGRATIONS = [
+    (1, 'Baseline schema', create_baseline_schema),
+    (2, 'Composite indexes for hot query shapes', add_hot_query_indexes),
+    (3, 'Incrementally maintained dashboard summaries', add_user_summaries),
+    (4, 'Background photo job queue', add_photo_jobs),
+    (5, 'Reference-counted content-addressed photo files', add_photo_files),
+    (6, 'Index for timeline conditional GET validators', add_timeline_validator_index),
+    (7, 'Resumable bulk import progress', add_import_progress),
+    (8, 'Full-text search index', add_search_index),
+    (9, 'Optional range partitioning of timeline events', add_timeline_partitioning),
+    (10, 'Cold storage for archived plant timelines', add_archived_timelines),
+]
+
+
+def run_migrations():
+    """Применить все еще не примененные миграции в одной транзакции"""
+    with db.engine.begin() as connection:
+        if connection.dialect.name == 'postgresql':
+            connection.execute(text('SELECT pg_advisory_xact_lock(:key)'), {'key': MIGRATION_LOCK_KEY})
+
+        connection.execute(text(
+            'CREATE TABLE IF NOT EXISTS schema_version ('
+            'version INTEGER PRIMARY KEY, '
+            'description VARCHAR(200) NOT NULL, '
+            'applied_at TIMESTAMP NOT NULL)'
+        ))
+        applied = {row[0] for row in connection.execute(text('SELECT version FROM schema_version'))}
+
+        for version, description, migrate in MIGRATIONS:
+            if version in applied:
+                continue
+            migrate(connection)
+            connection.execute(
+                text('INSERT INTO schema_version (version, description, applied_at) '
+                     'VALUES (:version, :description, :applied_at)'),
+                {'version': version, 'description': description, 'applied_at': datetime.utcnow()}
+            )
+            print(f"Applied migration {version}: {description}")
+
+
+if __name__ == "__main__":
+    # При прямом запуске нужно создать контекст приложения
+    from app import create_app
+    app = create_app()
+    with app.app_context():
+        run_migrations()
@@ -1,10 +1,22 @@
+import sqlite3
 from datetime import datetime
 from flask_sqlalchemy import SQLAlchemy
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
 
 # This creates a circular import issue when defined in separate file
 # So we define it here and import it in app.py
 db = SQLAlchemy()
 
+
+@event.listens_for(Engine, 'connect')
+def _enable_sqlite_foreign_keys(dbapi_connection, connection_record):
+    """SQLite enforces ON DELETE CASCADE / SET NULL only with foreign_keys enabled per connection"""
+    if isinstance(dbapi_connection, sqlite3.Connection):
+        cursor = dbapi_connection.cursor()
+        cursor.execute('PRAGMA foreign_keys=ON')
+        cursor.close()
+
 class BaseModel(db.Model):
     """Base model that provides common functionality for all models"""
     __abstract__ = True
@@ -33,6 +45,9 @@ class User(BaseModel):
 
 class Location(BaseModel):
     __tablename__ = 'locations'
+    __table_args__ = (
+        db.Index('ix_locations_user_id', 'user_id'),
+    )
     
     id = db.Column(db.Integer, primary_key=True)
     user_id = db.Column(db.Integer, db.ForeignKey('users.id', ondelete='CASCADE'), nullable=False)
@@ -43,7 +58,8 @@ class Location(BaseModel):
     photo_filename = db.Column(db.String(255))  # Filename for photo stored in static/photo
     
     # Relationship
-    plants = db.relationship('Plant', backref='location', lazy=True)
+    # ON DELETE SET NULL in the database detaches plants; no need to load them on delete
+    plants = db.relationship('Plant', backref='location', lazy=True, passive_deletes=True)
 
     def __repr__(self):
         return f'<Location {self.name}>'
@@ -66,6 +82,11 @@ class GrowthPhase(db.Model):
 
 class Plant(BaseModel):
     __tablename__ = 'plants'
+    __table_args__ = (
+        # Plant lists and dashboard counts filter by owner and archive flag, ordered by creation time
+        db.Index('ix_plants_user_id_archived_created_at', 'user_id', 'archived', 'created_at'),
+        db.Index('ix_plants_location_id', 'location_id'),
+    )
     
     id = db.Column(db.Integer, primary_key=True)
     user_id = db.Column(db.Integer, db.ForeignKey('users.id', ondelete='CASCADE'), nullable=False)
@@ -78,14 +99,27 @@ class Plant(BaseModel):
     archived = db.Column(db.Boolean, default=False)  # Whether the plant is archived
     
     # Relationship
-    timeline_events = db.relationship('TimelineEvent', backref='plant', lazy=True, cascade='all, delete-orphan')
+    timeline_events = db.relationship('TimelineEvent', backref='plant', lazy=True, cascade='all, delete-orphan',
+                                      passive_deletes=True)
+    # Cold-storage timeline of an archived plant (see cold_storage.py)
+    archived_timeline = db.relationship('ArchivedTimeline', uselist=False, lazy=True, passive_deletes=True)
 
     def __repr__(self):
         return f'<Plant {self.name}>'
 
 
 class TimelineEvent(BaseModel):
+    """Plant timeline entry; range-partitioned by event_date on PostgreSQL when enabled (see partitions.py)"""
     __tablename__ = 'timeline_events'
+    __table_args__ = (
+        # Plant timelines are read by plant ordered by date, growth phases additionally by event type
+        db.Index('ix_timeline_events_plant_id_event_date', 'plant_id', 'event_date'),
+        db.Index('ix_timeline_events_plant_id_event_type_event_date', 'plant_id', 'event_type', 'event_date'),
+        # Dashboard "recent events" walks the newest events first
+        db.Index('ix_timeline_events_event_date', 'event_date'),
+        # Conditional GET validators: per-plant MAX(updated_at) read from the index alone
+        db.Index('ix_timeline_events_plant_id_updated_at', 'plant_id', 'updated_at'),
+    )
     
     id = db.Column(db.Integer, primary_key=True)
     plant_id = db.Column(db.Integer, db.ForeignKey('plants.id', ondelete='CASCADE'), nullable=False)
@@ -99,7 +133,8 @@ class TimelineEvent(BaseModel):
     photo_filename = db.Column(db.String(255))  # Legacy field for single photo - will be deprecated
 
     # Relationship to GrowthPhase is already defined in GrowthPhase class
-    photos = db.relationship('EventPhoto', backref='timeline_event', lazy=True, cascade='all, delete-orphan')
+    photos = db.relationship('EventPhoto', backref='timeline_event', lazy=True, cascade='all, delete-orphan',
+                             passive_deletes=True)
 
     def __repr__(self):
         return f'<TimelineEvent {self.title} on {self.event_date}>'
@@ -107,6 +142,9 @@ class TimelineEvent(BaseModel):
 
 class EventPhoto(BaseModel):
     __tablename__ = 'event_photos'
+    __table_args__ = (
+        db.Index('ix_event_photos_event_id', 'event_id'),
+    )
     
     id = db.Column(db.Integer, primary_key=True)
     event_id = db.Column(db.Integer, db.ForeignKey('timeline_events.id', ondelete='CASCADE'), nullable=False)
@@ -126,4 +164,87 @@ class UserSetting(BaseModel):
     timezone = db.Column(db.String(50), default='UTC')
 
     def __repr__(self):
-        return f'<UserSetting for user {self.user_id}>'
\ No newline at end of file
+        return f'<UserSetting for user {self.user_id}>'
+
+class UserSummary(BaseModel):
+    """Dashboard counters per user, maintained incrementally by the mutating routes (see summary.py)"""
+    __tablename__ = 'user_summaries'
+
+    user_id = db.Column(db.Integer, db.ForeignKey('users.id', ondelete='CASCADE'), primary_key=True)
+    plant_count = db.Column(db.Integer, default=0, nullable=False)
+    location_count = db.Column(db.Integer, default=0, nullable=False)
+    archived_plant_count = db.Column(db.Integer, default=0, nullable=False)
+    event_count = db.Column(db.Integer, default=0, nullable=False)
+    growth_phase_event_count = db.Column(db.Integer, default=0, nullable=False)
+    fertilization_event_count = db.Column(db.Integer, default=0, nullable=False)
+    watering_event_count = db.Column(db.Integer, default=0, nullable=False)
+    note_event_count = db.Column(db.Integer, default=0, nullable=False)
+
+    def __repr__(self):
+        return f'<UserSummary for user {self.user_id}>'
+
+
+class PhotoJob(BaseModel):
+    """Background photo I/O job (file deletion, variant generation), processed by jobs.py"""
+    __tablename__ = 'photo_jobs'
+    __table_args__ = (
+        db.Index('ix_photo_jobs_status_run_after', 'status', 'run_after'),
+    )
+
+    id = db.Column(db.Integer, primary_key=True)
+    kind = db.Column(db.String(50), nullable=False)
+    payload = db.Column(db.JSON, nullable=False)
+    status = db.Column(db.String(20), default='pending', nullable=False)  # pending/running/failed
+    attempts = db.Column(db.Integer, default=0, nullable=False)
+    run_after = db.Column(db.DateTime, default=datetime.utcnow, nullable=False)
+    locked_at = db.Column(db.DateTime)
+    last_error = db.Column(db.Text)
+
+    def __repr__(self):
+        return f'<PhotoJob {self.kind} ({self.status})>'
+
+
+class PhotoFile(BaseModel):
+    """Reference count of a content-addressed photo file shared by plants, locations and events"""
+    __tablename__ = 'photo_files'
+
+    filename = db.Column(db.String(255), primary_key=True)  # Path relative to static
+    ref_count = db.Column(db.Integer, default=0, nullable=False)
+
+    def __repr__(self):
+        return f'<PhotoFile {self.filename} ({self.ref_count} refs)>'
+
+
+class ImportProgress(BaseModel):
+    """Progress of a resumable bulk import (see bulk_import.py), committed together with each chunk"""
+    __tablename__ = 'import_progress'
+
+    key = db.Column(db.String(64), primary_key=True)  # Caller-supplied name or SHA-256 of the source file
+    user_id = db.Column(db.Integer, db.ForeignKey('users.id', ondelete='CASCADE'), nullable=False)
+    rows_done = db.Column(db.Integer, default=0, nullable=False)
+    locations_created = db.Column(db.Integer, default=0, nullable=False)
+    plants_created = db.Column(db.Integer, default=0, nullable=False)
+    events_created = db.Column(db.Integer, default=0, nullable=False)
+    photos_created = db.Column(db.Integer, default=0, nullable=False)
+    finished = db.Column(db.Boolean, default=False, nullable=False)
+
+    def __repr__(self):
+        return f'<ImportProgress {self.key} ({self.rows_done} rows)>'
+
+
+class ArchivedTimeline(BaseModel):
+    """Timeline of an archived plant moved out of the hot tables: compressed rows plus a small summary"""
+    __tablename__ = 'archived_timelines'
+
+    plant_id = db.Column(db.Integer, db.ForeignKey('plants.id', ondelete='CASCADE'), primary_key=True)
+    event_count = db.Column(db.Integer, default=0, nullable=False)
+    photo_count = db.Column(db.Integer, default=0, nullable=False)
+    first_event_date = db.Column(db.Date)
+    last_event_date = db.Column(db.Date)
+    event_type_counts = db.Column(db.JSON, nullable=False)  # {event_type: count}
+    phase_durations = db.Column(db.JSON, nullable=False)  # [[phase_id, days], ...] of completed growth phases
+    # zlib-compressed JSON of the events and event photos, loaded only when the timeline is read or restored
+    payload = db.deferred(db.Column(db.LargeBinary, nullable=False))
+
+    def __repr__(self):
+        return f'<ArchivedTimeline of plant {self.plant_id} ({self.event_count} events)>'
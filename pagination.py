@@ -0,0 +1,71 @@
+"""
+Курсорная (keyset) пагинация.
+
+Страница выбирается условием (col1, col2) > (значения последней строки)
+вместо OFFSET, поэтому стоимость запроса не зависит от того, насколько
+далеко клиент пролистал историю. Курсор - это непрозрачная строка с
+упакованными значениями ключа сортировки последней строки страницы.
+"""
+import base64
+import json
+from datetime import date, datetime
+
+from flask import abort
+from sqlalchemy import tuple_
+
+
+def encode_cursor(values):
+    """Упаковать значения ключа сортировки в строку для URL"""
+    raw = json.dumps([value.isoformat() if isinstance(value, (date, datetime)) else value for value in values])
+    return base64.urlsafe_b64encode(raw.encode('utf-8')).decode('ascii').rstrip('=')
+
+
+def decode_cursor(cursor, columns):
+    """Распаковать курсор в значения с типами колонок сортировки; 400 при некорректном курсоре"""
+    try:
+        padded = cursor + '=' * (-len(cursor) % 4)
+        raw_values = json.loads(base64.urlsafe_b64decode(padded.encode('ascii')))
+        if len(raw_values) != len(columns):
+            raise ValueError('cursor length mismatch')
+        values = []
+        for column, raw in zip(columns, raw_values):
+            python_type = column.type.python_type
+            if python_type in (date, datetime):
+                values.append(python_type.fromisoformat(raw))
+            else:
+                values.append(python_type(raw))
+        return values
+    except (ValueError, TypeError):
+        abort(400)
+
+
+def keyset_paginate(query, columns, cursor=None, limit=50, descending=False, bound_page=False):
+    """
+    Вернуть (строки страницы, курсор следующей страницы или None).
+    columns - колонки ключа сортировки, последняя должна быть уникальной (обычно id).
+
+    bound_page - ограничить выборку диапазоном первой колонки самой страницы: значения
+    первой колонки строк страницы сначала читаются отдельным запросом по индексу.
+    Нужно для секционированных по первой колонке таблиц: с условиями с обеих сторон
+    PostgreSQL читает только секции, в которые попадает страница, а не всю историю.
+    """
+    key = tuple_(*columns)
+    ordering = [column.desc() if descending else column.asc() for column in columns]
+    if cursor:
+        values = decode_cursor(cursor, columns)
+        query = query.filter(key < tuple_(*values) if descending else key > tuple_(*values))
+        # Сравнение кортежей не отсекает секции PostgreSQL: нужна граница по первой колонке
+        query = query.filter(columns[0] <= values[0] if descending else columns[0] >= values[0])
+    if bound_page:
+        window = query.with_entities(columns[0]).order_by(*ordering).limit(limit + 1).all()
+        if window:
+            low, high = (window[-1][0], window[0][0]) if descending else (window[0][0], window[-1][0])
+            query = query.filter(columns[0] >= low, columns[0] <= high)
+
+    rows = query.order_by(*ordering).limit(limit + 1).all()
+
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        next_cursor = encode_cursor([getattr(rows[-1], column.key) for column in columns])
+    return rows, next_cursor
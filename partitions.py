@@ -0,0 +1,236 @@
+#!/usr/bin/env python3
+"""
+Секционирование таблицы timeline_events по дате события (только PostgreSQL).
+
+При TIMELINE_PARTITIONING = 'year' или 'month' миграция (или python partitions.py)
+превращает timeline_events в секционированную по диапазонам event_date таблицу:
+по секции на каждый год или месяц, в котором есть события, плюс секции на
+TIMELINE_PARTITIONS_AHEAD периодов вперед и секция по умолчанию для дат вне
+созданных диапазонов. Будущие секции создаются при запуске приложения и
+периодической фоновой задачей; строки, попавшие в секцию по умолчанию,
+переносятся в новые секции тех же периодов.
+
+Ограничения секционированной таблицы:
+  - первичный ключ (id, event_date): уникальный ключ обязан включать ключ секционирования;
+  - внешний ключ event_photos.event_id на такую таблицу невозможен, каскадное удаление
+    фото выполняет триггер (при переносе строки между секциями фото сохраняются).
+
+На SQLite и без TIMELINE_PARTITIONING таблица остается обычной; запросы с
+условиями на event_date работают одинаково в обоих случаях.
+"""
+import sys
+import weakref
+from datetime import date, datetime, timedelta
+
+from flask import current_app
+from sqlalchemy import text
+
+from jobs import enqueue_job, job_handler
+from models import db, PhotoJob, TimelineEvent
+
+TABLE = 'timeline_events'
+DEFAULT_PARTITION = f'{TABLE}_default'
+INTERVALS = ('year', 'month')
+
+# Как часто фоновая задача проверяет наличие будущих секций
+MAINTENANCE_INTERVAL = timedelta(days=1)
+
+# Секционирована ли таблица: проверяется один раз на процесс для каждого движка
+_partitioned = weakref.WeakKeyDictionary()
+
+
+def period_start(day, interval):
+    return date(day.year, 1, 1) if interval == 'year' else date(day.year, day.month, 1)
+
+
+def next_period(start, interval):
+    if interval == 'year':
+        return date(start.year + 1, 1, 1)
+    return date(start.year + start.month // 12, start.month % 12 + 1, 1)
+
+
+def partition_name(start, interval):
+    return f'{TABLE}_p{start.year}' if interval == 'year' else f'{TABLE}_p{start.year}_{start.month:02d}'
+
+
+def is_partitioned(connection):
+    return connection.dialect.name == 'postgresql' and bool(connection.execute(text(
+        'SELECT 1 FROM pg_partitioned_table WHERE partrelid = to_regclass(:table)'), {'table': TABLE}).scalar())
+
+
+def timeline_partitioned():
+    """Секционирована ли timeline_events в базе приложения"""
+    engine = db.engine
+    if engine not in _partitioned:
+        _partitioned[engine] = is_partitioned(db.session.connection())
+    return _partitioned[engine]
+
+
+def _partitions(connection):
+    return set(connection.execute(text(
+        'SELECT c.relname FROM pg_inherits i JOIN pg_class c ON c.oid = i.inhrelid '
+        'WHERE i.inhparent = to_regclass(:table)'), {'table': TABLE}).scalars())
+
+
+def _existing_interval(names):
+    """Период уже созданных секций: имена месячных секций длиннее годовых"""
+    for name in names:
+        if name != DEFAULT_PARTITION:
+            return 'month' if len(name) > len(f'{TABLE}_p0000') else 'year'
+    return None
+
+
+def _upcoming_periods(interval, ahead):
+    start = period_start(date.today(), interval)
+    periods = [start]
+    for _ in range(ahead):
+        periods.append(next_period(periods[-1], interval))
+    return periods
+
+
+def _create_partitions(connection, periods, interval, existing):
+    created = []
+    for start in sorted(set(periods)):
+        name = partition_name(start, interval)
+        if name in existing:
+            continue
+        connection.execute(text(
+            f"CREATE TABLE {name} PARTITION OF {TABLE} "
+            f"FOR VALUES FROM ('{start.isoformat()}') TO ('{next_period(start, interval).isoformat()}')"))
+        created.append(name)
+    return created
+
+
+def _copy_events(connection, source):
+    """Перенести строки source в timeline_events (генерируемые колонки база заполнит сама)"""
+    columns = ', '.join(column.name for column in TimelineEvent.__table__.columns)
+    connection.execute(text(f'INSERT INTO {TABLE} ({columns}) SELECT {columns} FROM {source}'))
+
+
+def ensure_partitions(connection, interval=None, ahead=None):
+    """
+    Создать недостающие секции текущего и будущих периодов, а также периодов, строки
+    которых попали в секцию по умолчанию. Возвращает имена созданных секций.
+    """
+    if not is_partitioned(connection):
+        return []
+    existing = _partitions(connection)
+    interval = _existing_interval(existing) or interval or current_app.config['TIMELINE_PARTITIONING'] or 'year'
+    ahead = current_app.config['TIMELINE_PARTITIONS_AHEAD'] if ahead is None else ahead
+
+    stray = connection.execute(text(
+        f'SELECT DISTINCT date_trunc(:interval, event_date)::date FROM {DEFAULT_PARTITION}'),
+        {'interval': interval}).scalars().all()
+    periods = _upcoming_periods(interval, ahead) + stray
+    if all(partition_name(start, interval) in existing for start in periods):
+        return []
+
+    if not stray:
+        return _create_partitions(connection, periods, interval, existing)
+
+    # Секцию нельзя создать, пока ее строки лежат в секции по умолчанию: старая секция
+    # по умолчанию отсоединяется, ее строки вставляются заново и попадают в новые секции
+    connection.execute(text(f'ALTER TABLE {TABLE} DETACH PARTITION {DEFAULT_PARTITION}'))
+    connection.execute(text(f'ALTER TABLE {DEFAULT_PARTITION} RENAME TO {DEFAULT_PARTITION}_old'))
+    created = _create_partitions(connection, periods, interval, existing)
+    connection.execute(text(f'CREATE TABLE {DEFAULT_PARTITION} PARTITION OF {TABLE} DEFAULT'))
+    _copy_events(connection, f'{DEFAULT_PARTITION}_old')
+    connection.execute(text(f'DROP TABLE {DEFAULT_PARTITION}_old'))
+    return created
+
+
+def partition_timeline_events(connection, interval, ahead):
+    """Превратить обычную таблицу timeline_events в секционированную, перенеся все строки"""
+    if interval not in INTERVALS:
+        raise ValueError(f'Unknown partition interval: {interval!r}')
+    connection.execute(text(f'LOCK TABLE {TABLE}, event_photos IN ACCESS EXCLUSIVE MODE'))
+
+    # Внешний ключ фото заменяется триггером, последовательность id переходит к новой таблице
+    for name in connection.execute(text(
+            'SELECT conname FROM pg_constraint WHERE conrelid = to_regclass(:photos) '
+            "AND confrelid = to_regclass(:table) AND contype = 'f'"),
+            {'photos': 'event_photos', 'table': TABLE}).scalars().all():
+        connection.execute(text(f'ALTER TABLE event_photos DROP CONSTRAINT {name}'))
+    sequence = connection.execute(text("SELECT pg_get_serial_sequence(:table, 'id')"), {'table': TABLE}).scalar()
+    connection.execute(text(f'ALTER SEQUENCE {sequence} OWNED BY NONE'))
+
+    connection.execute(text(f'ALTER TABLE {TABLE} RENAME TO {TABLE}_unpartitioned'))
+    connection.execute(text(
+        f'CREATE TABLE {TABLE} (LIKE {TABLE}_unpartitioned INCLUDING DEFAULTS INCLUDING GENERATED) '
+        f'PARTITION BY RANGE (event_date)'))
+    periods = connection.execute(text(
+        f'SELECT DISTINCT date_trunc(:interval, event_date)::date FROM {TABLE}_unpartitioned'),
+        {'interval': interval}).scalars().all()
+    _create_partitions(connection, periods + _upcoming_periods(interval, ahead), interval, set())
+    connection.execute(text(f'CREATE TABLE {DEFAULT_PARTITION} PARTITION OF {TABLE} DEFAULT'))
+    _copy_events(connection, f'{TABLE}_unpartitioned')
+    connection.execute(text(f'DROP TABLE {TABLE}_unpartitioned'))
+    connection.execute(text(f'ALTER SEQUENCE {sequence} OWNED BY {TABLE}.id'))
+
+    # Ключи и индексы создаются после загрузки строк; индексы родителя наследуют все секции
+    connection.execute(text(f'ALTER TABLE {TABLE} ADD PRIMARY KEY (id, event_date)'))
+    connection.execute(text(
+        f'ALTER TABLE {TABLE} ADD FOREIGN KEY (plant_id) REFERENCES plants (id) ON DELETE CASCADE'))
+    connection.execute(text(f'ALTER TABLE {TABLE} ADD FOREIGN KEY (phase_id) REFERENCES growth_phases (id)'))
+    for index in TimelineEvent.__table__.indexes:
+        index.create(connection)
+    connection.execute(text(
+        f'CREATE INDEX ix_{TABLE}_search_vector ON {TABLE} USING gin (search_vector)'))
+
+    # AFTER-триггеры выполняются в конце оператора: если строка лишь перенесена в другую
+    # секцию (UPDATE event_date), событие с тем же id уже существует и фото остаются
+    connection.execute(text(
+        'CREATE OR REPLACE FUNCTION delete_timeline_event_photos() RETURNS trigger AS $$ '
+        'BEGIN '
+        f'  DELETE FROM event_photos WHERE event_id = OLD.id AND NOT EXISTS (SELECT 1 FROM {TABLE} WHERE id = OLD.id); '
+        '  RETURN NULL; '
+        'END $$ LANGUAGE plpgsql'))
+    connection.execute(text(
+        f'CREATE TRIGGER {TABLE}_delete_photos AFTER DELETE ON {TABLE} '
+        f'FOR EACH ROW EXECUTE FUNCTION delete_timeline_event_photos()'))
+
+
+def schedule_partition_maintenance(run_after=None):
+    """Поставить задачу проверки будущих секций, если ее еще нет в очереди"""
+    pending = db.session.execute(db.select(PhotoJob.id).where(
+        PhotoJob.kind == 'timeline_partitions', PhotoJob.status.in_(('pending', 'running')))).first()
+    if pending is None:
+        job = enqueue_job('timeline_partitions')
+        job.run_after = run_after or datetime.utcnow()
+
+
+def maintain_partitions():
+    """Создать будущие секции и запланировать следующую проверку (при запуске приложения)"""
+    created = ensure_partitions(db.session.connection())
+    if timeline_partitioned():
+        schedule_partition_maintenance(datetime.utcnow() + MAINTENANCE_INTERVAL)
+    db.session.commit()
+    return created
+
+
+@job_handler('timeline_partitions')
+def timeline_partitions_job():
+    connection = db.session.connection()
+    created = ensure_partitions(connection)
+    if created:
+        print(f"Created timeline partitions: {', '.join(created)}")
+    # Текущая задача удаляется после выполнения, поэтому следующая ставится без проверки очереди
+    if is_partitioned(connection):
+        job = enqueue_job('timeline_partitions')
+        job.run_after = datetime.utcnow() + MAINTENANCE_INTERVAL
+
+
+if __name__ == "__main__":
+    # При прямом запуске нужно создать контекст приложения
+    from app import create_app
+    app = create_app()
+    with app.app_context():
+        interval = sys.argv[1] if len(sys.argv) > 1 else app.config['TIMELINE_PARTITIONING'] or 'year'
+        connection = db.session.connection()
+        if connection.dialect.name != 'postgresql':
+            sys.exit('Partitioning is only supported on PostgreSQL')
+        if not is_partitioned(connection):
+            partition_timeline_events(connection, interval, app.config['TIMELINE_PARTITIONS_AHEAD'])
+            print(f"Partitioned {TABLE} by {interval}")
+        created = maintain_partitions()
+        print(f"Created partitions: {', '.join(created) or 'none'}")
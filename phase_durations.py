@@ -0,0 +1,186 @@
+"""
+Продолжительность этапов роста, вычисляемая в базе данных.
+
+Этап длится от даты своего события growth_phase до даты следующего такого
+события того же растения: LEAD(event_date) OVER (PARTITION BY plant_id
+ORDER BY event_date). Последний этап растения длится до сегодняшнего дня.
+Одно и то же окно используется и для хронологии роста на странице растения,
+и для сводной статистики этапов по видам растений.
+
+SQLite до 3.25 не поддерживает оконные функции - для него следующая дата
+вычисляется в Python по тем же упорядоченным строкам.
+"""
+import sqlite3
+from datetime import date
+
+from sqlalchemy import Integer, func, select
+from sqlalchemy.ext.compiler import compiles
+from sqlalchemy.sql.expression import FunctionElement
+
+from cold_storage import archived_phase_durations
+from models import db, GrowthPhase, Plant, TimelineEvent
+
+
+class days_between(FunctionElement):
+    """Количество дней между двумя датами (end - start) в диалекте базы"""
+    type = Integer()
+    inherit_cache = True
+
+
+@compiles(days_between)
+def _days_between_default(element, compiler, **kw):
+    end, start = list(element.clauses)
+    return f'({compiler.process(end, **kw)} - {compiler.process(start, **kw)})'
+
+
+@compiles(days_between, 'sqlite')
+def _days_between_sqlite(element, compiler, **kw):
+    end, start = list(element.clauses)
+    return f'CAST(julianday({compiler.process(end, **kw)}) - julianday({compiler.process(start, **kw)}) AS INTEGER)'
+
+
+def supports_window_functions():
+    """PostgreSQL и SQLite начиная с 3.25 поддерживают LEAD() OVER"""
+    if db.engine.dialect.name != 'sqlite':
+        return True
+    return sqlite3.sqlite_version_info >= (3, 25)
+
+
+def _phase_rows(*criteria):
+    """Базовая выборка событий этапов роста в порядке окна"""
+    return (
+        select(
+            TimelineEvent.id,
+            TimelineEvent.plant_id,
+            TimelineEvent.phase_id,
+            GrowthPhase.name.label('phase_name'),
+            TimelineEvent.description,
+            TimelineEvent.event_date.label('start_date'),
+        )
+        .join(Plant, Plant.id == TimelineEvent.plant_id)
+        .outerjoin(GrowthPhase, GrowthPhase.id == TimelineEvent.phase_id)
+        .where(TimelineEvent.event_type == 'growth_phase', *criteria)
+    )
+
+
+def phase_intervals(today, *criteria):
+    """
+    Подзапрос этапов роста: start_date, end_date (дата следующего этапа или today),
+    duration_days и признак completed (у этапа есть следующий). criteria фильтруют события.
+    """
+    next_date = func.lead(TimelineEvent.event_date, type_=TimelineEvent.event_date.type).over(
+        partition_by=TimelineEvent.plant_id,
+        order_by=(TimelineEvent.event_date, TimelineEvent.id)
+    )
+    windowed = _phase_rows(*criteria).add_columns(next_date.label('next_date')).subquery()
+    end_date = func.coalesce(windowed.c.next_date, today)
+    return select(
+        windowed.c.id,
+        windowed.c.plant_id,
+        windowed.c.phase_id,
+        windowed.c.phase_name,
+        windowed.c.description,
+        windowed.c.start_date,
+        end_date.label('end_date'),
+        days_between(end_date, windowed.c.start_date).label('duration_days'),
+        windowed.c.next_date.isnot(None).label('completed'),
+    ).subquery()
+
+
+def _python_intervals(today, *criteria):
+    """Запасной вариант без оконных функций: те же строки, что и phase_intervals"""
+    rows = db.session.execute(
+        _phase_rows(*criteria).order_by(TimelineEvent.plant_id, TimelineEvent.event_date, TimelineEvent.id)
+    ).all()
+    intervals = []
+    for index, row in enumerate(rows):
+        following = rows[index + 1] if index + 1 < len(rows) else None
+        next_date = following.start_date if following and following.plant_id == row.plant_id else None
+        end_date = next_date or today
+        intervals.append({
+            **row._asdict(),
+            'end_date': end_date,
+            'duration_days': (end_date - row.start_date).days,
+            'completed': next_date is not None,
+        })
+    return intervals
+
+
+def plant_growth_timeline(plant_id, today=None):
+    """
+    Этапы роста растения от последнего к первому с датами и продолжительностью.
+    Хронология на странице растения постраничная, поэтому этапы всей истории читаются
+    отдельным запросом; если вся хронология уже загружена одной страницей, страница
+    считает этапы по ее событиям (cold_storage.events_growth_timeline).
+    """
+    today = today or date.today()
+    if supports_window_functions():
+        intervals = phase_intervals(today, TimelineEvent.plant_id == plant_id)
+        rows = db.session.execute(
+            select(intervals).order_by(intervals.c.start_date.desc(), intervals.c.id.desc())
+        ).mappings().all()
+        return [dict(row) for row in rows]
+    return _python_intervals(today, TimelineEvent.plant_id == plant_id)[::-1]
+
+
+def _species_row(key, durations):
+    count, total, shortest, longest = durations
+    return {'species': key[0], 'phase_id': key[1], 'phase_name': key[2], 'phases': count,
+            'avg_days': round(total / count, 1), 'min_days': shortest, 'max_days': longest}
+
+
+def phase_durations_by_species(user_id, today=None):
+    """
+    Статистика завершенных этапов роста по видам растений пользователя:
+    количество, средняя, минимальная и максимальная продолжительность в днях.
+    Этапы архивных растений берутся из сводок холодного хранения (archived_timelines).
+    """
+    today = today or date.today()
+    criteria = (Plant.user_id == user_id,)
+    species = func.coalesce(Plant.species, '')
+    # (вид, id этапа, название) -> [количество, сумма дней, минимум, максимум]
+    groups = {}
+
+    def add(key, count, total, shortest, longest):
+        group = groups.setdefault(key, [0, 0, shortest, longest])
+        group[0] += count
+        group[1] += total
+        group[2] = min(group[2], shortest)
+        group[3] = max(group[3], longest)
+
+    if not supports_window_functions():
+        species_by_plant = dict(db.session.execute(
+            select(Plant.id, species).where(*criteria)).all())
+        for interval in _python_intervals(today, *criteria):
+            if interval['completed']:
+                days = interval['duration_days']
+                add((species_by_plant[interval['plant_id']], interval['phase_id'], interval['phase_name']),
+                    1, days, days, days)
+    else:
+        intervals = phase_intervals(today, *criteria)
+        rows = db.session.execute(
+            select(
+                species.label('species'),
+                intervals.c.phase_id,
+                intervals.c.phase_name,
+                func.count().label('phases'),
+                func.sum(intervals.c.duration_days).label('total_days'),
+                func.min(intervals.c.duration_days).label('min_days'),
+                func.max(intervals.c.duration_days).label('max_days'),
+            )
+            .join(Plant, Plant.id == intervals.c.plant_id)
+            .where(intervals.c.completed)
+            .group_by(species, intervals.c.phase_id, intervals.c.phase_name)
+        )
+        for row in rows:
+            add((row.species, row.phase_id, row.phase_name), row.phases, int(row.total_days), row.min_days,
+                row.max_days)
+
+    archived = archived_phase_durations(user_id)
+    if archived:
+        phase_names = dict(db.session.execute(select(GrowthPhase.id, GrowthPhase.name)).all())
+        for plant_species, phase_id, days in archived:
+            add((plant_species, phase_id, phase_names.get(phase_id)), 1, days, days, days)
+
+    return [_species_row(key, durations)
+            for key, durations in sorted(groups.items(), key=lambda item: (item[0][0], item[0][1] or 0))]
@@ -0,0 +1,332 @@
+"""
+Хранение загруженных фото в static/photos.
+
+Файлы адресуются по содержимому (photos/content/<ab>/<sha256>.<ext>), поэтому
+повторная загрузка того же изображения не занимает места. Число ссылок на
+файл из Plant, Location, TimelineEvent и EventPhoto хранится в таблице
+photo_files; файл удаляется, только когда исчезает последняя ссылка.
+
+Запись принятого файла выполняется в запросе, а создание вариантов и
+удаление файлов - фоновыми задачами (см. jobs.py). Файлы, созданные в
+транзакции, которая затем откатилась, удаляются той же фоновой задачей.
+"""
+import hashlib
+import mimetypes
+import os
+import tempfile
+from collections import Counter
+from urllib.parse import quote
+
+from flask import Request, current_app, abort, request, send_file
+from werkzeug.security import safe_join
+from sqlalchemy import bindparam, event, insert, select, update
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session
+
+from jobs import enqueue_job, job_handler
+from metrics import observe_photo_upload
+from models import db, PhotoFile, PhotoJob
+from photo_variants import delete_variants, generate_variants
+
+CHUNK_SIZE = 64 * 1024
+
+# Файлы фото никогда не меняются на месте (имя уникально или равно хешу содержимого)
+PHOTO_CACHE_MAX_AGE = 365 * 24 * 60 * 60
+
+# Хранилище фото и каталог временных файлов незавершенных загрузок внутри него
+PHOTOS_ROOT = os.path.join('static', 'photos')
+TEMP_DIR = 'tmp'
+
+# Расширения, которые сохраняются под одним именем, чтобы одинаковые файлы совпадали
+EXTENSION_ALIASES = {'jpeg': 'jpg'}
+
+
+class HashingUploadFile:
+    """
+    Temporary file (in static/photos/tmp unless temp_dir is given) that computes SHA-256
+    of the data while it is written, so an upload is hashed in the same pass that streams
+    it to disk and can later be moved into place with os.replace() instead of being copied.
+    The file must be created in the directory it is moved to (or on the same filesystem).
+    """
+
+    def __init__(self, temp_dir=None):
+        temp_dir = temp_dir or os.path.join(PHOTOS_ROOT, TEMP_DIR)
+        os.makedirs(temp_dir, exist_ok=True)
+        self._file = tempfile.NamedTemporaryFile(dir=temp_dir, delete=False)
+        self._digest = hashlib.sha256()
+        self.name = self._file.name
+        self.size = 0
+
+    def write(self, data):
+        self._digest.update(data)
+        self.size += len(data)
+        return self._file.write(data)
+
+    def finish(self):
+        """Закрыть файл и вернуть (путь, sha256) - после этого файлом владеет вызывающий код"""
+        self._file.close()
+        return self.name, self._digest.hexdigest()
+
+    def __getattr__(self, name):
+        return getattr(self._file, name)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self._file.close()
+
+
+class UploadRequest(Request):
+    """
+    Request, который пишет файлы multipart-формы сразу в HashingUploadFile фиксированными
+    блоками, без промежуточного буфера в памяти и повторного копирования при сохранении.
+    Фото попадают в static/photos/tmp, остальные файлы (CSV и NDJSON массового импорта) -
+    в IMPORT_DIR, откуда их забирает фоновая задача. Файлы, которые обработчик не забрал,
+    удаляются при закрытии запроса.
+    """
+    # Ограничение памяти для обычных (не файловых) полей формы
+    max_form_memory_size = 1024 * 1024
+
+    def _get_file_stream(self, total_content_length, content_type, filename=None, content_length=None):
+        if filename and allowed_file(filename):
+            stream = HashingUploadFile()
+        else:
+            stream = HashingUploadFile(current_app.config['IMPORT_DIR'])
+        self.__dict__.setdefault('_upload_temp_files', []).append(stream.name)
+        return stream
+
+    def close(self):
+        super().close()
+        for temp_name in self.__dict__.get('_upload_temp_files', ()):
+            try:
+                os.remove(temp_name)
+            except FileNotFoundError:
+                pass  # Файл уже перемещен в хранилище или удален как дубликат
+
+
+def allowed_file(filename):
+    """Check if uploaded file has allowed extension"""
+    ALLOWED_EXTENSIONS = {'png', 'jpg', 'jpeg', 'gif', 'webp'}
+    return '.' in filename and \
+        filename.rsplit('.', 1)[1].lower() in ALLOWED_EXTENSIONS
+
+
+def save_photo_to_folder(photo_file):
+    """
+    Save uploaded photo under a content-addressed path and return the path relative to static.
+    Identical uploads map to the same file: its reference count is incremented and nothing is
+    written or post-processed again. Every returned path holds one reference that must be
+    released with release_photos() when the referencing row or column is cleared.
+    """
+    if photo_file and photo_file.filename != '':
+        if allowed_file(photo_file.filename):
+            ext = photo_file.filename.rsplit('.', 1)[1].lower()
+            ext = EXTENSION_ALIASES.get(ext, ext)
+
+            if isinstance(photo_file.stream, HashingUploadFile):
+                # The form parser already streamed the upload to disk and hashed it
+                temp_file = photo_file.stream
+            else:
+                # Stream the upload into a temporary file, hashing it on the way
+                with HashingUploadFile() as temp_file:
+                    for chunk in iter(lambda: photo_file.stream.read(CHUNK_SIZE), b''):
+                        temp_file.write(chunk)
+            temp_name, sha256 = temp_file.finish()
+            observe_photo_upload(temp_file.size)
+
+            relative_path = content_path(sha256, ext)
+            acquire_photo(relative_path)
+
+            filepath = os.path.join('static', relative_path)
+            if os.path.exists(filepath):
+                # Duplicate upload - the stored copy and its variants are reused
+                os.remove(temp_name)
+            else:
+                os.makedirs(os.path.dirname(filepath), exist_ok=True)
+                os.replace(temp_name, filepath)
+                # If the transaction rolls back, nothing references the new file
+                db.session.info.setdefault('created_photos', []).append(relative_path)
+                # Thumbnails and WebP variants are created by the background worker
+                enqueue_job('generate_variants', filename=relative_path)
+
+            return relative_path
+        else:
+            return None
+    return None
+
+
+def stored_photo_path(filename):
+    """
+    Абсолютный путь существующего файла хранилища по имени относительно static/photos
+    или None, если имя выходит за пределы static/photos, указывает на временные файлы
+    незавершенных загрузок (tmp/) или файла нет.
+    """
+    root = os.path.abspath(PHOTOS_ROOT)
+    path = safe_join(root, filename)
+    if path is None or os.path.relpath(path, root).split(os.sep)[0] == TEMP_DIR:
+        return None
+    return path if os.path.isfile(path) else None
+
+
+def delete_file_from_disk(filepath):
+    """Delete file from disk if it exists"""
+    # Only files inside static/photos are ever deleted, whatever path the database holds
+    if filepath and filepath.startswith('photos/') and stored_photo_path(filepath[len('photos/'):]):
+        full_path = os.path.join('static', filepath)
+        if os.path.exists(full_path):
+            try:
+                os.remove(full_path)
+                delete_variants(filepath)
+                # Also try to remove the directory if it's empty
+                dir_path = os.path.dirname(full_path)
+                if os.path.isdir(dir_path) and not os.listdir(dir_path):
+                    os.rmdir(dir_path)
+                return True
+            except OSError:
+                pass  # Fail silently if file removal fails
+    return False
+
+
+def content_path(sha256, ext):
+    """Путь файла относительно static по хешу содержимого"""
+    return f"photos/content/{sha256[:2]}/{sha256}.{ext}"
+
+
+def acquire_photo(filename):
+    """Увеличить счетчик ссылок на файл в текущей транзакции (создать запись при первой ссылке)"""
+    counter = update(PhotoFile).where(PhotoFile.filename == filename).values(ref_count=PhotoFile.ref_count + 1)
+    if db.session.execute(counter).rowcount:
+        return
+    try:
+        with db.session.begin_nested():
+            db.session.add(PhotoFile(filename=filename, ref_count=1))
+    except IntegrityError:
+        # Запись одновременно создала другая транзакция
+        db.session.execute(counter)
+
+
+def acquire_photos(*filepaths):
+    """
+    Увеличить счетчики ссылок сразу для многих файлов (массовый импорт): один UPDATE
+    executemany для известных файлов и один INSERT для новых.
+    """
+    references = Counter(filepath for filepath in filepaths if filepath)
+    if not references:
+        return
+
+    photo_files = PhotoFile.__table__
+    db.session.execute(
+        photo_files.update()
+        .where(photo_files.c.filename == bindparam('name'))
+        .values(ref_count=photo_files.c.ref_count + bindparam('acquired')),
+        [{'name': filename, 'acquired': count} for filename, count in references.items()]
+    )
+    known = set(db.session.execute(
+        select(PhotoFile.filename).where(PhotoFile.filename.in_(references))).scalars())
+    missing = [filename for filename in references if filename not in known]
+    if not missing:
+        return
+    try:
+        with db.session.begin_nested():
+            db.session.execute(photo_files.insert(), [
+                {'filename': filename, 'ref_count': references[filename]} for filename in missing])
+    except IntegrityError:
+        # Часть записей одновременно создала другая транзакция - добавляем ссылки по одной
+        for filename in missing:
+            for _ in range(references[filename]):
+                acquire_photo(filename)
+
+
+def release_photos(*filepaths):
+    """
+    Освободить по одной ссылке на каждый файл. Файлы, на которые больше никто не
+    ссылается, удаляются фоновой задачей одним списком.
+    """
+    references = Counter(filepath for filepath in filepaths if filepath)
+    if not references:
+        return
+
+    photo_files = PhotoFile.__table__
+    db.session.execute(
+        photo_files.update()
+        .where(photo_files.c.filename == bindparam('name'))
+        .values(ref_count=photo_files.c.ref_count - bindparam('released')),
+        [{'name': filename, 'released': count} for filename, count in references.items()]
+    )
+    ref_counts = dict(db.session.execute(
+        select(PhotoFile.filename, PhotoFile.ref_count).where(PhotoFile.filename.in_(references))
+    ).all())
+    # Файлы без записи в photo_files (не учтенные ранее) тоже больше никому не нужны
+    unreferenced = [filename for filename in references if ref_counts.get(filename, 0) <= 0]
+    if unreferenced:
+        enqueue_job('delete_files', filenames=unreferenced)
+
+
+@event.listens_for(Session, 'after_commit')
+def _keep_created_photos(session):
+    session.info.pop('created_photos', None)
+
+
+@event.listens_for(Session, 'after_transaction_end')
+def _cleanup_created_photos(session, transaction):
+    # Корневая транзакция завершилась без commit (rollback или close): созданные в ней
+    # файлы удаляет фоновая задача - она же проверит, что на файл не сослалась
+    # параллельная загрузка того же содержимого
+    if transaction.parent is not None:
+        return
+    created = session.info.pop('created_photos', None)
+    if created:
+        with session.get_bind().begin() as connection:
+            connection.execute(insert(PhotoJob), {'kind': 'delete_files', 'payload': {'filenames': created}})
+
+
+@job_handler('delete_files')
+def delete_files_job(filenames):
+    for filepath in filenames:
+        # Блокировка записи не дает параллельной загрузке того же файла сослаться на него во время удаления
+        photo_file = db.session.execute(
+            select(PhotoFile).where(PhotoFile.filename == filepath).with_for_update()
+        ).scalar()
+        if photo_file and photo_file.ref_count > 0:
+            continue  # На файл снова сослались после постановки задачи
+        delete_file_from_disk(filepath)
+        if photo_file:
+            db.session.delete(photo_file)
+        db.session.commit()
+
+
+@job_handler('generate_variants')
+def generate_variants_job(filename):
+    generate_variants(filename)
+
+
+def send_photo(filename):
+    """
+    Отдать файл из static/photos с вечным кешированием. Имя файла уникально, поэтому
+    оно же служит сильным ETag, и повторный запрос с If-None-Match получает 304 без
+    передачи данных. Путь проверяется до условного запроса: на временные и
+    несуществующие файлы всегда приходит 404. При PHOTO_SENDFILE передача самих
+    байтов поручается обратному прокси (X-Accel-Redirect для nginx, X-Sendfile для Apache/lighttpd).
+    """
+    # Временные файлы незавершенных загрузок (tmp/) не отдаются
+    path = stored_photo_path(filename)
+    if path is None:
+        abort(404)
+
+    etag = os.path.basename(filename)
+    if request.if_none_match.contains(etag):
+        response = current_app.response_class(status=304)
+    elif current_app.config['PHOTO_SENDFILE'] == 'x-accel-redirect':
+        response = current_app.response_class(mimetype=mimetypes.guess_type(path)[0])
+        response.headers['X-Accel-Redirect'] = current_app.config['PHOTO_ACCEL_PREFIX'] + quote(filename)
+    else:
+        # При PHOTO_SENDFILE = 'x-sendfile' send_file сам ставит заголовок (USE_X_SENDFILE)
+        response = send_file(path, etag=etag, conditional=True, max_age=PHOTO_CACHE_MAX_AGE)
+
+    response.set_etag(etag)
+    response.cache_control.no_cache = None
+    response.cache_control.public = True
+    response.cache_control.max_age = PHOTO_CACHE_MAX_AGE
+    response.cache_control.immutable = True
+    return response
@@ -0,0 +1,138 @@
+#!/usr/bin/env python3
+"""
+Уменьшенные копии и WebP-варианты загруженных фото.
+
+Для исходного файла <каталог>/<имя>.<ext> в static/photos создаются:
+  <каталог>/<имя>.w<ширина>.webp - миниатюры для каждой ширины из PHOTO_VARIANT_WIDTHS
+  <каталог>/<имя>.full.webp      - полноразмерная WebP-копия (если исходник не WebP)
+
+Шаблоны отдают миниатюры через srcset/sizes, а исходник остается запасным вариантом.
+При прямом запуске скрипт (пере)создает варианты для всех фото в static/photos.
+"""
+import os
+import re
+import sys
+
+from flask import current_app, url_for
+from PIL import Image, ImageOps
+
+from fragments import mark_fragment_incomplete
+
+PHOTOS_ROOT = os.path.join('static', 'photos')
+
+# Имена вариантов содержат вторую точку, исходные файлы - нет
+VARIANT_PATTERN = re.compile(r'\.(w\d+|full)\.webp$')
+
+
+def variant_filename(filename, variant):
+    """Путь варианта ('w320', 'full') относительно static для исходного файла"""
+    stem = filename.rsplit('.', 1)[0]
+    return f"{stem}.{variant}.webp"
+
+
+def variant_filenames(filename):
+    """Все варианты, которые создаются для исходного файла при текущей конфигурации"""
+    variants = [variant_filename(filename, f'w{width}') for width in current_app.config['PHOTO_VARIANT_WIDTHS']]
+    if not filename.lower().endswith('.webp'):
+        variants.append(variant_filename(filename, 'full'))
+    return variants
+
+
+def _prepare_image(image):
+    """Повернуть по EXIF и привести к режиму, который поддерживает WebP"""
+    image = ImageOps.exif_transpose(image)
+    if image.mode not in ('RGB', 'RGBA'):
+        has_alpha = image.mode in ('LA', 'PA') or 'transparency' in image.info
+        image = image.convert('RGBA' if has_alpha else 'RGB')
+    return image
+
+
+def generate_variants(filename, force=False):
+    """
+    Создать варианты для файла (путь относительно static). Возвращает количество
+    созданных файлов. Поврежденные и нераспознанные изображения пропускаются.
+    """
+    source_path = os.path.join('static', filename)
+    quality = current_app.config['PHOTO_WEBP_QUALITY']
+    created = 0
+    try:
+        with Image.open(source_path) as original:
+            image = _prepare_image(original)
+            targets = [(f'w{width}', width) for width in current_app.config['PHOTO_VARIANT_WIDTHS']]
+            if not filename.lower().endswith('.webp'):
+                targets.append(('full', None))
+
+            for variant, width in targets:
+                target_path = os.path.join('static', variant_filename(filename, variant))
+                if not force and os.path.exists(target_path):
+                    continue
+                resized = image
+                if width and image.width > width:
+                    resized = image.resize((width, round(image.height * width / image.width)), Image.LANCZOS)
+                resized.save(target_path, 'WEBP', quality=quality, method=4)
+                created += 1
+    except (OSError, Image.DecompressionBombError) as e:
+        print(f"Could not create variants for {filename}: {e}")
+    return created
+
+
+def delete_variants(filename):
+    """Удалить все варианты исходного файла"""
+    for variant in variant_filenames(filename):
+        try:
+            os.remove(os.path.join('static', variant))
+        except OSError:
+            pass  # Варианта может не быть (старые фото или слишком маленький исходник)
+
+
+def photo_url(filename):
+    """URL фото по пути относительно static: файлы из static/photos отдаются маршрутом photo"""
+    if filename.startswith('photos/'):
+        return url_for('photo', filename=filename[len('photos/'):])
+    return url_for('static', filename=filename)
+
+
+def photo_srcset(filename):
+    """
+    Данные для адаптивного <img>: srcset из WebP-миниатюр и URL полноразмерной копии.
+    Возвращает None, если варианты для файла еще не созданы.
+    """
+    if not filename:
+        return None
+    widths = current_app.config['PHOTO_VARIANT_WIDTHS']
+    # Одна проверка наименьшего варианта вместо проверки каждого файла
+    if not widths or not os.path.exists(os.path.join('static', variant_filename(filename, f'w{widths[0]}'))):
+        # Варианты могут появиться позже (фоновая задача): разметка без srcset кешируется ненадолго
+        mark_fragment_incomplete()
+        return None
+
+    full = filename if filename.lower().endswith('.webp') else variant_filename(filename, 'full')
+    return {
+        'srcset': ', '.join(
+            f"{photo_url(variant_filename(filename, f'w{width}'))} {width}w" for width in widths
+        ),
+        'full_url': photo_url(full),
+    }
+
+
+def regenerate_all(force=False):
+    """Создать недостающие (или все при force) варианты для всех фото в static/photos"""
+    total = 0
+    for directory, subdirs, files in os.walk(PHOTOS_ROOT):
+        # Временные файлы незавершенных загрузок не обрабатываются
+        subdirs[:] = [subdir for subdir in subdirs if subdir != 'tmp']
+        for name in files:
+            if VARIANT_PATTERN.search(name):
+                continue
+            path = os.path.join(directory, name)
+            filename = os.path.relpath(path, 'static').replace(os.sep, '/')
+            total += generate_variants(filename, force=force)
+    print(f"Created {total} photo variants")
+
+
+if __name__ == "__main__":
+    # При прямом запуске нужно создать контекст приложения
+    from app import create_app
+    app = create_app()
+    with app.app_context():
+        regenerate_all(force='--force' in sys.argv)
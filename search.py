@@ -0,0 +1,182 @@
+"""
+Полнотекстовый поиск по растениям, локациям и записям хронологии.
+
+PostgreSQL: у таблиц plants, locations и timeline_events есть генерируемая
+колонка search_vector (to_tsvector('russian', ...) с весами полей) с GIN-индексом.
+База пересчитывает ее сама при любой записи, включая COPY и массовые UPDATE.
+
+SQLite: для каждой таблицы есть виртуальная таблица FTS5 с внешним содержимым
+(search_<таблица>, rowid = id строки), которую синхронизируют триггеры на
+INSERT, UPDATE и DELETE исходной таблицы, в том числе каскадные удаления.
+
+Русские слова на PostgreSQL приводятся к основе словарем russian, на SQLite
+каждый термин без окончания ищется как префикс ("томаты" находит "томатов"). Результаты
+упорядочены по релевантности (ts_rank_cd / bm25) и листаются курсором.
+"""
+import re
+import sqlite3
+import weakref
+
+from sqlalchemy import (Float, String, cast, column, func, literal, literal_column, or_, select, table, text,
+                        union_all)
+from sqlalchemy.orm import joinedload
+
+from models import db, Location, Plant, TimelineEvent
+from pagination import keyset_paginate
+
+# Индексируемые поля по таблицам: (колонка, вес); A - самый значимый
+SEARCH_FIELDS = {
+    'plants': (('name', 'A'), ('species', 'B'), ('notes', 'C')),
+    'locations': (('name', 'A'), ('description', 'C')),
+    'timeline_events': (('title', 'A'), ('description', 'C')),
+}
+# Веса полей для bm25() на SQLite
+BM25_WEIGHTS = {'A': 10.0, 'B': 4.0, 'C': 1.0}
+
+# Окончания русских слов, отбрасываемые перед префиксным поиском на SQLite
+RUSSIAN_ENDING = re.compile(r'(?<=[а-яё]{4})[аеёиоуыэюяйь]+$')
+
+KINDS = {'plant': Plant, 'location': Location, 'event': TimelineEvent}
+MAX_TERMS = 10
+
+# Способ поиска по движкам: проверяется один раз на процесс, а не в каждом запросе
+_modes = weakref.WeakKeyDictionary()
+
+
+def fts5_available():
+    """Собран ли модуль sqlite3 с FTS5"""
+    connection = sqlite3.connect(':memory:')
+    try:
+        connection.execute('CREATE VIRTUAL TABLE probe USING fts5(body)')
+        return True
+    except sqlite3.OperationalError:
+        return False
+    finally:
+        connection.close()
+
+
+def _search_vector_sql(fields):
+    return ' || '.join(
+        f"setweight(to_tsvector('russian'::regconfig, coalesce({name}, '')), '{weight}')" for name, weight in fields)
+
+
+def create_search_index(connection):
+    """Создать поисковые колонки и индексы (PostgreSQL) или таблицы FTS5 с триггерами (SQLite)"""
+    if connection.dialect.name == 'postgresql':
+        for table, fields in SEARCH_FIELDS.items():
+            connection.execute(text(
+                f'ALTER TABLE {table} ADD COLUMN IF NOT EXISTS search_vector tsvector '
+                f'GENERATED ALWAYS AS ({_search_vector_sql(fields)}) STORED'))
+            connection.execute(text(
+                f'CREATE INDEX IF NOT EXISTS ix_{table}_search_vector ON {table} USING gin (search_vector)'))
+        return
+    if connection.dialect.name != 'sqlite' or not fts5_available():
+        return  # Поиск работает через LIKE (см. _like_condition)
+
+    for table, fields in SEARCH_FIELDS.items():
+        fts = f'search_{table}'
+        names = ', '.join(name for name, _ in fields)
+        new_values = ', '.join(f'new.{name}' for name, _ in fields)
+        old_values = ', '.join(f'old.{name}' for name, _ in fields)
+        insert_new = f'INSERT INTO {fts} (rowid, {names}) VALUES (new.id, {new_values});'
+        delete_old = f"INSERT INTO {fts} ({fts}, rowid, {names}) VALUES ('delete', old.id, {old_values});"
+        connection.execute(text(
+            f'CREATE VIRTUAL TABLE IF NOT EXISTS {fts} USING fts5('
+            f"{names}, content='{table}', content_rowid='id', tokenize='unicode61 remove_diacritics 2')"))
+        connection.execute(text(
+            f'CREATE TRIGGER IF NOT EXISTS {fts}_insert AFTER INSERT ON {table} BEGIN {insert_new} END'))
+        connection.execute(text(
+            f'CREATE TRIGGER IF NOT EXISTS {fts}_delete AFTER DELETE ON {table} BEGIN {delete_old} END'))
+        connection.execute(text(
+            f'CREATE TRIGGER IF NOT EXISTS {fts}_update AFTER UPDATE OF {names} ON {table} '
+            f'BEGIN {delete_old} {insert_new} END'))
+        connection.execute(text(f"INSERT INTO {fts} ({fts}) VALUES ('rebuild')"))
+
+
+def search_terms(query):
+    """Слова запроса без синтаксиса поисковых движков (не больше MAX_TERMS)"""
+    return re.findall(r'\w+', (query or '').lower())[:MAX_TERMS]
+
+
+def _fts5_prefix(term):
+    """Префикс термина для FTS5 без окончания: «томаты» находит и «томат», и «томатов»"""
+    return f'"{RUSSIAN_ENDING.sub("", term)}"*'
+
+
+def _search_mode():
+    engine = db.engine
+    if engine not in _modes:
+        if engine.dialect.name == 'postgresql':
+            _modes[engine] = 'tsvector'
+        elif engine.dialect.name == 'sqlite' and db.session.execute(text(
+                "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'search_plants'")).scalar():
+            _modes[engine] = 'fts5'
+        else:
+            _modes[engine] = 'like'
+    return _modes[engine]
+
+
+def _like_condition(model, terms):
+    """Запасной вариант без полнотекстового индекса: каждое слово встречается в одном из полей"""
+    fields = [getattr(model, name) for name, _ in SEARCH_FIELDS[model.__tablename__]]
+    return [or_(*(field.ilike(f'%{term}%') for field in fields)) for term in terms]
+
+
+def _kind_select(kind, user_id, terms, mode):
+    """Выборка (score, kind, id) совпадений одного типа; меньший score - более релевантный"""
+    model = KINDS[kind]
+    table_name = model.__tablename__
+    if mode == 'tsvector':
+        tsquery = func.to_tsquery('russian', ' & '.join(f'{term}:*' for term in terms))
+        vector = literal_column(f'{table_name}.search_vector')
+        # double precision: значение real после JSON-курсора сравнивалось бы неточно
+        score = -cast(func.ts_rank_cd(vector, tsquery), Float)
+        statement = select(score.label('score'), literal(kind, String).label('kind'), model.id.label('id'))
+        statement = statement.where(vector.op('@@')(tsquery))
+    elif mode == 'fts5':
+        fts = table(f'search_{table_name}', column('rowid'))
+        weights = [BM25_WEIGHTS[weight] for _, weight in SEARCH_FIELDS[table_name]]
+        score = func.bm25(literal_column(fts.name), *weights, type_=Float)
+        statement = select(score.label('score'), literal(kind, String).label('kind'), model.id.label('id'))
+        statement = statement.select_from(fts).join(model, model.id == fts.c.rowid)
+        statement = statement.where(literal_column(fts.name).op('MATCH')(' '.join(_fts5_prefix(term) for term in terms)))
+    else:
+        statement = select(literal(0.0, Float).label('score'), literal(kind, String).label('kind'),
+                           model.id.label('id'))
+        statement = statement.where(*_like_condition(model, terms))
+
+    if model is TimelineEvent:
+        return statement.join(Plant, Plant.id == TimelineEvent.plant_id).where(Plant.user_id == user_id)
+    return statement.where(model.user_id == user_id)
+
+
+def search(user_id, query, kinds=None, cursor=None, limit=20):
+    """
+    Найти записи пользователя по запросу. Возвращает (список (тип, объект), курсор следующей
+    страницы или None); тип - 'plant', 'location' или 'event'.
+    """
+    terms = search_terms(query)
+    kinds = [kind for kind in KINDS if not kinds or kind in kinds]
+    if not user_id or not terms or not kinds:
+        return [], None
+
+    mode = _search_mode()
+    statements = [_kind_select(kind, user_id, terms, mode) for kind in kinds]
+    matches = (union_all(*statements) if len(statements) > 1 else statements[0]).subquery()
+    rows, next_cursor = keyset_paginate(
+        db.session.query(matches), [matches.c.score, matches.c.kind, matches.c.id], cursor, limit)
+
+    # Объекты загружаются одним запросом на тип
+    ids = {}
+    for row in rows:
+        ids.setdefault(row.kind, []).append(row.id)
+    loaders = {
+        'plant': lambda: Plant.query.options(joinedload(Plant.location)),
+        'location': lambda: Location.query,
+        'event': lambda: TimelineEvent.query.options(joinedload(TimelineEvent.plant)),
+    }
+    objects = {}
+    for kind, kind_ids in ids.items():
+        for obj in loaders[kind]().filter(KINDS[kind].id.in_(kind_ids)):
+            objects[kind, obj.id] = obj
+    return [(row.kind, objects[row.kind, row.id]) for row in rows if (row.kind, row.id) in objects], next_cursor
@@ -0,0 +1,187 @@
+#!/usr/bin/env python3
+"""
+Генератор синтетических данных для нагрузочных тестов и бенчмарков.
+
+Заполняет базу (DATABASE_URL) пользователями, локациями, растениями,
+событиями хронологии и фото событий в заданном масштабе. Этапы роста берутся
+из init_database(). Данные детерминированы при одинаковом --seed. Строки
+загружаются теми же средствами, что и массовый импорт (COPY на PostgreSQL,
+executemany на SQLite), порциями с фиксацией. Генератору нужна монопольная
+запись в базу: id новых строк выделяются заранее.
+
+Первый пользователь - 'default', от его имени работают маршруты приложения.
+Фото ссылаются на несуществующие файлы в photos/content (пул из PHOTO_POOL
+имен), счетчики ссылок и сводка дашборда заполняются как при обычной работе,
+хронологии архивных растений переносятся в холодное хранение.
+
+Запуск: python seed_data.py [--users N] [--locations N] [--plants N] [--events N] [--photos N] [--seed N]
+(--locations на пользователя, --plants на локацию, --events на растение, --photos на событие)
+"""
+import argparse
+import hashlib
+import random
+import sys
+import time
+from collections import Counter
+from datetime import date, datetime, timedelta
+
+from sqlalchemy import select
+
+from bulk_import import allocate_ids, copy_rows
+from cold_storage import archive_timelines
+from models import db, EventPhoto, GrowthPhase, Location, Plant, TimelineEvent, User
+from photo_storage import acquire_photos, content_path
+from summary import rebuild_summary
+
+# Событий в одной фиксируемой порции
+SEED_CHUNK_SIZE = 20000
+PHOTO_POOL = 200
+
+EVENT_TYPES = ('watering', 'watering', 'watering', 'watering', 'watering', 'note', 'note', 'fertilization',
+               'fertilization', 'growth_phase')
+SPECIES = ('Томат', 'Перец', 'Огурец', 'Базилик', 'Монстера', 'Фикус', 'Орхидея', 'Кактус', 'Лимон', 'Клубника')
+LOCATIONS = ('Теплица', 'Подоконник', 'Балкон', 'Гроубокс', 'Стеллаж', 'Веранда', 'Огород', 'Кухня')
+NOTES = ('Появились новые листья', 'Листья желтеют по краям', 'Пересадка в горшок побольше',
+         'Обработка от тли', 'Хороший прирост за неделю', 'Завязались первые плоды', 'Подвязка к опоре',
+         'Подсыхает верхний слой субстрата', 'Развернул к свету', 'Обрезка боковых побегов')
+FERTILIZERS = (('NPK 10-10-10', '5 мл'), ('Биогумус', '50 г'), ('Кальциевая селитра', '2 г'),
+               ('Гумат калия', '10 мл'))
+
+
+def photo_pool():
+    """Детерминированные пути фото, как у файлов, загруженных в хранилище"""
+    return [content_path(hashlib.sha256(f'seed-photo-{index}'.encode()).hexdigest(), 'jpg')
+            for index in range(PHOTO_POOL)]
+
+
+def _get_or_create_user(username):
+    user_id = db.session.execute(select(User.id).where(User.username == username)).scalar()
+    if user_id is None:
+        user = User(username=username, email=f'{username}@example.com', password_hash='temp_password_hash')
+        db.session.add(user)
+        db.session.flush()
+        user_id = user.id
+    return user_id
+
+
+def _event_row(rng, event_id, plant_id, event_date, phase_ids, phase_index, photos, now):
+    event_type = rng.choice(EVENT_TYPES)
+    description = ''
+    phase_id = fertilization_type = fertilization_amount = None
+    if event_type == 'growth_phase' and phase_index < len(phase_ids):
+        phase_id = phase_ids[phase_index]
+        title = f'Этап {phase_index + 1}'
+    elif event_type == 'fertilization':
+        fertilization_type, fertilization_amount = rng.choice(FERTILIZERS)
+        title = f'Подкормка: {fertilization_type}'
+    elif event_type == 'note':
+        description = rng.choice(NOTES)
+        title = description
+    else:
+        event_type = 'watering'
+        title = f'Watering - {event_date.isoformat()}'
+    photo_filename = rng.choice(photos) if photos and event_type == 'note' and rng.random() < 0.3 else None
+    return (event_id, plant_id, event_type, event_date, title, description, phase_id, fertilization_type,
+            fertilization_amount, photo_filename, now, now)
+
+
+def seed(users=1, locations=5, plants=20, events=50, photos=1, archived_ratio=0.1, rng_seed=0, verbose=True):
+    """
+    Заполнить базу данными заданного масштаба. Возвращает количество созданных строк
+    по таблицам. Этапы роста должны быть уже созданы init_database().
+    """
+    rng = random.Random(rng_seed)
+    phase_ids = db.session.execute(select(GrowthPhase.id).order_by(GrowthPhase.phase_order)).scalars().all()
+    pool = photo_pool()
+    now = datetime.utcnow()
+    totals = Counter()
+    started = time.perf_counter()
+
+    event_columns = ('id', 'plant_id', 'event_type', 'event_date', 'title', 'description', 'phase_id',
+                     'fertilization_type', 'fertilization_amount', 'photo_filename', 'created_at', 'updated_at')
+    for user_index in range(users):
+        user_id = _get_or_create_user('default' if user_index == 0 else f'user{user_index}')
+
+        location_ids = allocate_ids(Location.__table__, locations)
+        copy_rows(Location.__table__, ('id', 'user_id', 'name', 'lighting', 'created_at', 'updated_at'), [
+            (location_id, user_id, f'{LOCATIONS[index % len(LOCATIONS)]} {index + 1}', 'Фитолампа', now, now)
+            for index, location_id in enumerate(location_ids)])
+        totals['locations'] += len(location_ids)
+
+        plant_specs = [(location_id, index) for location_id in location_ids for index in range(plants)]
+        plant_ids = allocate_ids(Plant.__table__, len(plant_specs))
+        plant_rows = []
+        for plant_id, (location_id, index) in zip(plant_ids, plant_specs):
+            species = rng.choice(SPECIES)
+            planted = date(2020, 1, 1) + timedelta(days=rng.randrange(1500))
+            plant_rows.append((plant_id, user_id, location_id, f'{species} {plant_id}', species, planted,
+                               rng.choice(NOTES), rng.choice(pool) if photos else None,
+                               rng.random() < archived_ratio, now + timedelta(microseconds=plant_id), now))
+        copy_rows(Plant.__table__, ('id', 'user_id', 'location_id', 'name', 'species', 'planted_date', 'notes',
+                                    'photo_filename', 'archived', 'created_at', 'updated_at'), plant_rows)
+        acquire_photos(*(row[7] for row in plant_rows))
+        totals['plants'] += len(plant_rows)
+        db.session.commit()
+
+        # События генерируются порциями по растениям, чтобы не держать их все в памяти
+        plants_per_chunk = max(1, SEED_CHUNK_SIZE // max(events, 1))
+        for offset in range(0, len(plant_rows), plants_per_chunk):
+            chunk = plant_rows[offset:offset + plants_per_chunk]
+            event_ids = iter(allocate_ids(TimelineEvent.__table__, len(chunk) * events))
+            event_rows, photo_rows = [], []
+            for plant in chunk:
+                plant_id, planted = plant[0], plant[5]
+                phase_index = 0
+                for day in range(events):
+                    row = _event_row(rng, next(event_ids), plant_id, planted + timedelta(days=day), phase_ids,
+                                     phase_index, pool, now)
+                    if row[6] is not None:
+                        phase_index += 1
+                    event_rows.append(row)
+                    photo_rows.extend((row[0], rng.choice(pool), now, now) for _ in range(photos))
+            copy_rows(TimelineEvent.__table__, event_columns, event_rows)
+            copy_rows(EventPhoto.__table__, ('event_id', 'filename', 'created_at', 'updated_at'), photo_rows)
+            acquire_photos(*(row[9] for row in event_rows), *(row[1] for row in photo_rows))
+            db.session.commit()
+            totals['events'] += len(event_rows)
+            totals['event_photos'] += len(photo_rows)
+            if verbose:
+                rate = totals['events'] / (time.perf_counter() - started)
+                print(f"user {user_index + 1}/{users}: {totals['events']} events ({rate:.0f}/s)", file=sys.stderr)
+
+        # Хронологии архивных растений переносятся в холодное хранение, как при архивировании
+        archived_ids = [row[0] for row in plant_rows if row[8]]
+        for offset in range(0, len(archived_ids), plants_per_chunk):
+            totals['archived_events'] += archive_timelines(user_id, archived_ids[offset:offset + plants_per_chunk])
+            db.session.commit()
+
+        rebuild_summary(db.session, user_id)
+        db.session.commit()
+    return dict(totals)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Seed the database with synthetic plants and timelines')
+    parser.add_argument('--users', type=int, default=1)
+    parser.add_argument('--locations', type=int, default=5, help='locations per user')
+    parser.add_argument('--plants', type=int, default=20, help='plants per location')
+    parser.add_argument('--events', type=int, default=50, help='timeline events per plant')
+    parser.add_argument('--photos', type=int, default=1, help='photos per event')
+    parser.add_argument('--archived', type=float, default=0.1, help='share of archived plants')
+    parser.add_argument('--seed', type=int, default=0, help='random seed')
+    args = parser.parse_args()
+
+    from app import create_app
+    from identity import invalidate_user_cache
+    from init_db import init_database
+    app = create_app()
+    with app.app_context():
+        init_database()
+        started = time.perf_counter()
+        totals = seed(args.users, args.locations, args.plants, args.events, args.photos, args.archived, args.seed)
+        invalidate_user_cache()
+        print(f"Seeded {totals} in {time.perf_counter() - started:.1f} s")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,90 @@
+"""
+Инкрементально поддерживаемая сводка для дашборда.
+
+Вместо подсчета растений, локаций и событий при каждом открытии главной
+страницы изменяющие маршруты корректируют счетчики в таблице user_summaries
+в той же транзакции, что и сами изменения. Счетчики меняются атомарным
+UPDATE ... SET count = count + delta, поэтому параллельные записи не теряют
+обновлений.
+"""
+from sqlalchemy import func, select, update
+from sqlalchemy.exc import IntegrityError
+
+from models import db, Location, Plant, TimelineEvent, UserSummary
+
+# Типы событий, для которых в сводке есть отдельный счетчик
+EVENT_TYPE_COUNTERS = {
+    'growth_phase': 'growth_phase_event_count',
+    'fertilization': 'fertilization_event_count',
+    'watering': 'watering_event_count',
+    'note': 'note_event_count',
+}
+
+
+def event_deltas(event_type, delta):
+    """Изменения счетчиков сводки при добавлении (delta > 0) или удалении событий одного типа"""
+    deltas = {'event_count': delta}
+    if event_type in EVENT_TYPE_COUNTERS:
+        deltas[EVENT_TYPE_COUNTERS[event_type]] = delta
+    return deltas
+
+
+def compute_summary(connection, user_id):
+    """Посчитать все счетчики сводки пользователя по исходным таблицам"""
+    counts = {
+        'plant_count': connection.execute(
+            select(func.count(Plant.id)).where(Plant.user_id == user_id)).scalar(),
+        'archived_plant_count': connection.execute(
+            select(func.count(Plant.id)).where(Plant.user_id == user_id, Plant.archived.is_(True))).scalar(),
+        'location_count': connection.execute(
+            select(func.count(Location.id)).where(Location.user_id == user_id)).scalar(),
+        'event_count': 0,
+    }
+    for column in EVENT_TYPE_COUNTERS.values():
+        counts[column] = 0
+
+    event_type_counts = connection.execute(
+        select(TimelineEvent.event_type, func.count(TimelineEvent.id))
+        .join(Plant, Plant.id == TimelineEvent.plant_id)
+        .where(Plant.user_id == user_id)
+        .group_by(TimelineEvent.event_type)
+    )
+    for event_type, count in event_type_counts:
+        for column, delta in event_deltas(event_type, count).items():
+            counts[column] += delta
+    return counts
+
+
+def rebuild_summary(connection, user_id):
+    """Пересчитать сводку пользователя с нуля (заполнение и восстановление счетчиков)"""
+    counts = compute_summary(connection, user_id)
+    connection.execute(UserSummary.__table__.delete().where(UserSummary.user_id == user_id))
+    connection.execute(UserSummary.__table__.insert().values(user_id=user_id, **counts))
+
+
+def adjust_summary(user_id, **deltas):
+    """
+    Атомарно изменить счетчики сводки пользователя в текущей транзакции сессии.
+    Если строки сводки еще нет, она создается по текущим данным, которые уже
+    включают изменения этой транзакции.
+    """
+    db.session.flush()
+    values = {column: getattr(UserSummary, column) + delta for column, delta in deltas.items() if delta}
+    if not values:
+        return
+
+    result = db.session.execute(update(UserSummary).where(UserSummary.user_id == user_id).values(values))
+    if result.rowcount:
+        return
+
+    try:
+        with db.session.begin_nested():
+            db.session.add(UserSummary(user_id=user_id, **compute_summary(db.session, user_id)))
+    except IntegrityError:
+        # Строку одновременно создала другая транзакция - применяем изменение к ней
+        db.session.execute(update(UserSummary).where(UserSummary.user_id == user_id).values(values))
+
+
+def get_summary(user_id):
+    """Получить сводку пользователя одним запросом по первичному ключу"""
+    return db.session.get(UserSummary, user_id)
@@ -0,0 +1,33 @@
+#!/usr/bin/env python3
+"""
+Процесс-обработчик фоновых задач (см. jobs.py).
+
+Запуск: python worker.py [--once]
+
+Обработчики регистрируются в модуле jobs при импорте модулей, которые их
+объявляют (photo_storage, bulk_import, partitions - их импортирует app).
+Поэтому обработчик запускается отдельным скриптом, а не как python jobs.py:
+файл, запущенный как скрипт, загружается модулем __main__ со своим пустым
+реестром, отдельным от реестра модуля jobs.
+"""
+import sys
+
+import jobs
+
+
+def main():
+    # Импорт приложения загружает все модули с обработчиками задач
+    from app import create_app
+    app = create_app()
+    if not jobs.JOB_HANDLERS:
+        sys.exit('No job handlers are registered: refusing to start the worker')
+    print(f"Job handlers: {', '.join(sorted(jobs.JOB_HANDLERS))}")
+    with app.app_context():
+        if '--once' in sys.argv:
+            print(f"Processed {jobs.run_pending_jobs()} jobs")
+        else:
+            jobs.work()
+
+
+if __name__ == "__main__":
+    main()